@@ -0,0 +1,90 @@
+"""
+Helpers shared by the benchmark scripts: running measurements in a fresh
+interpreter, and writing and comparing JSON results.
+"""
+from pathlib import Path
+from typing import Any
+import json
+import os
+import subprocess
+import sys
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKENDS = ['PYTHON', 'RUST']
+
+
+def run_worker(module: str, args: list[str], env: dict[str, str] | None = None) -> dict[str, Any]:
+    """
+    Run `python -m module --worker args...` in a fresh interpreter and return
+    the JSON object it prints on its last line of stdout. A fresh process per
+    measurement keeps imports, caches and peak memory from leaking across runs.
+    """
+    full_env = dict(os.environ)
+    src = str(REPO_ROOT / 'src')
+    full_env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [src, str(REPO_ROOT), full_env.get('PYTHONPATH')]))
+    if env:
+        full_env.update(env)
+    proc = subprocess.run([sys.executable, '-m', module, '--worker', *args],
+                          capture_output=True, text=True, env=full_env, cwd=REPO_ROOT)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {proc.returncode}'}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def peak_rss_kb() -> int:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def write_results(path: Path | str, results: dict[str, Any]) -> None:
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_results(path: Path | str) -> dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(baseline: dict[str, Any], current: dict[str, Any],
+                    metrics: dict[str, str], tolerance: float) -> list[str]:
+    """
+    Compare two result files, entry by entry. metrics maps a metric name to
+    'lower' (lower is better), 'higher' (higher is better) or 'exact' (must
+    not change at all). Returns human readable descriptions of regressions.
+    """
+    regressions = []
+    base_entries = baseline.get('entries', {})
+    for key, entry in current.get('entries', {}).items():
+        base = base_entries.get(key)
+        if base is None or 'error' in base or 'error' in entry:
+            continue
+        for metric, better in metrics.items():
+            if metric not in base or metric not in entry:
+                continue
+            old, new = base[metric], entry[metric]
+            if better == 'exact':
+                bad = old != new
+            elif better == 'lower':
+                bad = new > old * (1 + tolerance)
+            else:
+                bad = new < old * (1 - tolerance)
+            if bad:
+                regressions.append(f'{key}: {metric} {old} -> {new}')
+    return regressions
+
+
+def report_regressions(regressions: list[str]) -> int:
+    if not regressions:
+        print('No regressions against baseline')
+        return 0
+    print('Regressions against baseline:')
+    for reg in regressions:
+        print(f'  {reg}')
+    return 1
@@ -0,0 +1,170 @@
+"""
+Import latency benchmark over synthetic packages.
+
+Imports every module of a generated package without any hook, with the
+PyholeMetaPathFinder installed and nothing to do (hook), and populating an
+IncrementalProject (index). Reports the import time, the time per module and
+the number of path searches (calls to PathFinder.find_spec), which is the
+number of modules when each import searches the path once. Each measurement
+runs in a fresh interpreter. Run from the repository root:
+
+    python -m benchmarks.import_bench --preset medium -o out.json
+    python -m benchmarks.import_bench --preset medium --baseline out.json
+"""
+from pathlib import Path
+import argparse
+import gc
+import importlib
+import importlib.machinery
+import sys
+import tempfile
+import time
+
+from .common import compare_results, load_results, report_regressions, run_worker, write_results
+from .synth import PRESETS, SynthConfig, generate_package
+
+
+HOOKS = ['none', 'hook', 'index']
+
+METRICS = {
+    'import_time': 'lower',
+    'path_searches': 'exact',
+    'modules': 'exact',
+}
+
+
+def module_names(pkg_root: Path) -> list[str]:
+    names = []
+    for path in sorted(pkg_root.rglob('*.py')):
+        parts = list(path.relative_to(pkg_root.parent).with_suffix('').parts)
+        if parts[-1] == '__init__':
+            parts.pop()
+        names.append('.'.join(parts))
+    return names
+
+
+def count_path_searches() -> list[int]:
+    count = [0]
+    find_spec = importlib.machinery.PathFinder.find_spec.__func__
+
+    def counting(cls, *args, **kwargs):
+        count[0] += 1
+        return find_spec(cls, *args, **kwargs)
+
+    importlib.machinery.PathFinder.find_spec = classmethod(counting)
+    return count
+
+
+def make_hook(kind: str):
+    from pyhole.import_hook import HookManager, populate_db
+    from pyhole.project import IncrementalProject
+
+    if kind == 'hook':
+        return HookManager(None)
+    if kind == 'index':
+        return populate_db(IncrementalProject())
+    return None
+
+
+def time_imports(names: list[str], kind: str) -> float:
+    for name in names:
+        sys.modules.pop(name, None)
+    importlib.invalidate_caches()
+    gc.collect()
+    hook = make_hook(kind)
+    if hook is not None:
+        hook.__enter__()
+    try:
+        start = time.perf_counter()
+        for name in names:
+            importlib.import_module(name)
+        return time.perf_counter() - start
+    finally:
+        if hook is not None:
+            hook.__exit__()
+
+
+def worker(pkg: str, kind: str, repeat: int) -> dict:
+    pkg_root = Path(pkg)
+    sys.path.insert(0, str(pkg_root.parent))
+    names = module_names(pkg_root)
+    # Warm up the bytecode and directory caches
+    time_imports(names, 'none')
+
+    count = count_path_searches()
+    time_imports(names, kind)
+    searches = count[0]
+    import_time = min(time_imports(names, kind) for _ in range(repeat))
+    return {
+        'import_time': import_time,
+        'us_per_module': import_time / len(names) * 1e6,
+        'path_searches': searches,
+        'modules': len(names),
+    }
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--pkg', help=argparse.SUPPRESS)
+    parser.add_argument('--hook', action='append', choices=HOOKS,
+                        help='Hook to measure (repeatable, default: all)')
+    parser.add_argument('--preset', action='append', choices=list(PRESETS),
+                        help='Package configuration to benchmark (repeatable)')
+    parser.add_argument('--modules', type=int, help='Module count of a custom package')
+    parser.add_argument('--depth', type=int, default=3, help='Package nesting depth')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', type=Path, help='Write results as JSON')
+    parser.add_argument('--baseline', type=Path, help='Compare against stored results')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative slowdown before flagging a regression')
+    return parser.parse_args(argv)
+
+
+def configs_from_args(args: argparse.Namespace) -> list[SynthConfig]:
+    cfgs = [PRESETS[name] for name in args.preset or []]
+    if args.modules is not None:
+        cfgs.append(SynthConfig('custom', args.modules, args.depth))
+    if not cfgs:
+        cfgs.append(PRESETS['medium'])
+    return cfgs
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    if args.worker:
+        import json
+        print(json.dumps(worker(args.pkg, args.hook[0], args.repeat)))
+        return 0
+
+    results = {'python': sys.version.split()[0], 'entries': {}}
+    with tempfile.TemporaryDirectory(prefix='pyhole-bench-') as tmp:
+        for cfg in configs_from_args(args):
+            pkg = generate_package(Path(tmp) / cfg.key(), cfg)
+            for kind in args.hook or HOOKS:
+                key = f'{cfg.key()}/{kind}'
+                entry = run_worker('benchmarks.import_bench',
+                                   ['--pkg', str(pkg), '--hook', kind,
+                                    '--repeat', str(args.repeat)],
+                                   env={'PYHOLE_INDEXER': 'PYTHON'})
+                entry['config'] = cfg.to_dict()
+                entry['hook'] = kind
+                results['entries'][key] = entry
+                if 'error' in entry:
+                    print(f'{key}: skipped ({entry["error"]})')
+                else:
+                    print(f'{key}: {entry["import_time"] * 1e3:.1f} ms, '
+                          f'{entry["us_per_module"]:.0f} us/module, '
+                          f'{entry["path_searches"]} path searches for '
+                          f'{entry["modules"]} modules')
+
+    if args.output:
+        write_results(args.output, results)
+    if args.baseline:
+        regs = compare_results(load_results(args.baseline), results, METRICS, args.tolerance)
+        return report_regressions(regs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,145 @@
+"""
+Indexing benchmark over synthetic packages.
+
+For every package configuration and indexer backend this measures the
+time to build a Project, the peak memory, the memory the Project keeps
+once built, objects indexed per second and
+the number of keyword functions found. Each measurement runs in a fresh
+interpreter. Run from the repository root:
+
+    python -m benchmarks.index_bench --preset small --preset medium -o out.json
+    python -m benchmarks.index_bench --preset medium --baseline out.json
+"""
+from pathlib import Path
+import argparse
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .common import (BACKENDS, compare_results, load_results, peak_rss_kb,
+                     report_regressions, run_worker, write_results)
+from .synth import PRESETS, SynthConfig, generate_package
+
+
+METRICS = {
+    'build_time': 'lower',
+    'peak_mem_kb': 'lower',
+    'retained_kb': 'lower',
+    'objects_per_sec': 'higher',
+    'objects': 'exact',
+    'kw_fns': 'exact',
+}
+
+
+def worker(pkg: str, repeat: int, kwargs_focused: bool) -> dict:
+    from pyhole.project import Project
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        project = Project(Path(pkg), kwargs_focused)
+        times.append(time.perf_counter() - start)
+        del project
+
+    # Measure memory separately, tracemalloc slows down allocation heavy code
+    gc.collect()
+    tracemalloc.start()
+    project = Project(Path(pkg), kwargs_focused)
+    _, peak = tracemalloc.get_traced_memory()
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    build_time = min(times)
+    objects = len(project.db)
+    return {
+        'build_time': build_time,
+        'peak_mem_kb': peak // 1024,
+        'retained_kb': retained // 1024,
+        'max_rss_kb': peak_rss_kb(),
+        'objects': objects,
+        'objects_per_sec': objects / build_time if build_time > 0 else 0.0,
+        'kw_fns': len(project.kw_fns),
+    }
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--pkg', help=argparse.SUPPRESS)
+    parser.add_argument('--preset', action='append', choices=list(PRESETS),
+                        help='Package configuration to benchmark (repeatable)')
+    parser.add_argument('--modules', type=int, help='Module count of a custom package')
+    parser.add_argument('--depth', type=int, default=3, help='Package nesting depth')
+    parser.add_argument('--fns-per-module', type=int, default=20)
+    parser.add_argument('--kwargs-share', type=float, default=0.2,
+                        help='Fraction of functions taking **kwargs')
+    parser.add_argument('--alt-dups', type=int, default=2,
+                        help='Conditionally duplicated functions per module')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', action='append', choices=BACKENDS,
+                        help='Indexer backend to benchmark (default: all)')
+    parser.add_argument('--kwargs-focused', action='store_true',
+                        help='Index modules without **kwargs functions from a shallow scan')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', type=Path, help='Write results as JSON')
+    parser.add_argument('--baseline', type=Path, help='Compare against stored results')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative slowdown before flagging a regression')
+    return parser.parse_args(argv)
+
+
+def configs_from_args(args: argparse.Namespace) -> list[SynthConfig]:
+    cfgs = [PRESETS[name] for name in args.preset or []]
+    if args.modules is not None:
+        cfgs.append(SynthConfig('custom', args.modules, args.depth, args.fns_per_module,
+                                args.kwargs_share, args.alt_dups, args.seed))
+    if not cfgs:
+        cfgs.append(PRESETS['small'])
+    return cfgs
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    if args.worker:
+        import json
+        print(json.dumps(worker(args.pkg, args.repeat, args.kwargs_focused)))
+        return 0
+
+    results = {'python': sys.version.split()[0], 'entries': {}}
+    with tempfile.TemporaryDirectory(prefix='pyhole-bench-') as tmp:
+        for cfg in configs_from_args(args):
+            pkg = generate_package(Path(tmp) / cfg.key(), cfg)
+            for backend in args.backend or BACKENDS:
+                key = f'{cfg.key()}/{backend}'
+                if args.kwargs_focused:
+                    key += '/kwargs-focused'
+                worker_args = ['--pkg', str(pkg), '--repeat', str(args.repeat)]
+                if args.kwargs_focused:
+                    worker_args.append('--kwargs-focused')
+                entry = run_worker('benchmarks.index_bench', worker_args,
+                                   env={'PYHOLE_INDEXER': backend})
+                entry['config'] = cfg.to_dict()
+                entry['backend'] = backend
+                results['entries'][key] = entry
+                if 'error' in entry:
+                    print(f'{key}: skipped ({entry["error"]})')
+                else:
+                    print(f'{key}: {entry["build_time"]:.3f}s, {entry["objects"]} objects, '
+                          f'{entry["objects_per_sec"]:.0f} obj/s, {entry["kw_fns"]} kw fns, '
+                          f'peak {entry["peak_mem_kb"]} KiB, '
+                          f'retained {entry["retained_kb"]} KiB')
+
+    if args.output:
+        write_results(args.output, results)
+    if args.baseline:
+        regs = compare_results(load_results(args.baseline), results, METRICS, args.tolerance)
+        return report_regressions(regs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
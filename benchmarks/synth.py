@@ -0,0 +1,220 @@
+"""
+Deterministic generator of synthetic Python packages, used to benchmark
+indexing and tracing on projects of a known shape and size.
+"""
+from pathlib import Path
+import random
+
+
+class SynthConfig:
+    name: str
+    modules: int
+    depth: int
+    fns_per_module: int
+    kwargs_share: float
+    alt_dups: int
+    seed: int
+
+    def __init__(self, name: str = 'synth', modules: int = 50, depth: int = 3,
+                 fns_per_module: int = 20, kwargs_share: float = 0.2,
+                 alt_dups: int = 2, seed: int = 0) -> None:
+        self.name = name
+        self.modules = modules
+        self.depth = depth
+        self.fns_per_module = fns_per_module
+        self.kwargs_share = kwargs_share
+        self.alt_dups = alt_dups
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(dc: dict) -> "SynthConfig":
+        return SynthConfig(**dc)
+
+    def key(self) -> str:
+        return (f'{self.name}-m{self.modules}-d{self.depth}-f{self.fns_per_module}'
+                f'-k{self.kwargs_share}-a{self.alt_dups}-s{self.seed}')
+
+    def __str__(self) -> str:
+        return self.key()
+
+
+# Presets, roughly the size of a small library, requests and sympy
+PRESETS = {
+    'small': SynthConfig('small', modules=20, depth=2, fns_per_module=10),
+    'medium': SynthConfig('medium', modules=200, depth=3, fns_per_module=20),
+    'large': SynthConfig('large', modules=1000, depth=4, fns_per_module=30),
+}
+
+
+def _package_dirs(root: Path, cfg: SynthConfig) -> list[Path]:
+    # A chain of packages depth levels deep, with one sibling package per level
+    dirs = [root]
+    cur = root
+    for level in range(1, cfg.depth):
+        dirs.append(cur / f'side{level}')
+        cur = cur / f'sub{level}'
+        dirs.append(cur)
+    return dirs
+
+
+def _gen_function(rng: random.Random, name: str, has_kw: bool,
+                  callees: list[tuple[str, bool]], indent: str,
+                  is_method: bool = False) -> list[str]:
+    params = ['self'] if is_method else []
+    params.extend(['a', 'b=None'])
+    if has_kw:
+        params.append('**kwargs')
+    lines = [f'{indent}def {name}({", ".join(params)}):']
+    body = indent + '    '
+    lines.append(f'{body}x = a')
+    for callee, callee_kw in callees:
+        if has_kw and rng.random() < 0.5:
+            lines.append(f'{body}x = {callee}(x, **kwargs)')
+        elif callee_kw:
+            lines.append(f'{body}x = {callee}(x, opt{rng.randrange(8)}=b)')
+        else:
+            lines.append(f'{body}x = {callee}(x, b=b)')
+    if has_kw:
+        lines.append(f'{body}if kwargs.get("verbose"):')
+        lines.append(f'{body}    x = [x]')
+    lines.append(f'{body}return x')
+    lines.append('')
+    return lines
+
+
+def _gen_module(rng: random.Random, cfg: SynthConfig) -> str:
+    lines = ['"""Generated module"""', 'import os', '', 'FLAG = os.name == "posix"', '']
+    fns: list[tuple[str, bool]] = []
+    for i in range(cfg.fns_per_module):
+        name = f'fn{i}'
+        has_kw = rng.random() < cfg.kwargs_share
+        callees = rng.sample(fns, min(len(fns), 2))
+        lines.extend(_gen_function(rng, name, has_kw, callees, ''))
+        fns.append((name, has_kw))
+
+    # Duplicate definitions turn into AltObjects
+    for i in range(cfg.alt_dups):
+        lines.append('if FLAG:')
+        lines.extend(_gen_function(rng, f'dup{i}', False, [], '    '))
+        lines.append('else:')
+        lines.extend(_gen_function(rng, f'dup{i}', True, [], '    '))
+
+    lines.append('class Thing:')
+    lines.extend(_gen_function(rng, '__init__', rng.random() < cfg.kwargs_share,
+                               [], '    ', is_method=True))
+    lines.extend(_gen_function(rng, 'method', rng.random() < cfg.kwargs_share,
+                               fns[:1], '    ', is_method=True))
+    return '\n'.join(lines) + '\n'
+
+
+def generate_package(parent: Path, cfg: SynthConfig) -> Path:
+    """
+    Generate the package described by cfg inside parent, returning the
+    package root. The same config always produces byte-identical files.
+    """
+    rng = random.Random(cfg.seed)
+    root = Path(parent) / cfg.name
+    dirs = _package_dirs(root, cfg)
+    for drc in dirs:
+        drc.mkdir(parents=True, exist_ok=True)
+        (drc / '__init__.py').write_text(_gen_module(rng, cfg))
+    # The __init__.py files account for some of the modules
+    for i in range(max(0, cfg.modules - len(dirs))):
+        drc = dirs[i % len(dirs)]
+        (drc / f'mod{i}.py').write_text(_gen_module(rng, cfg))
+    return root
+
+
+WORKLOADS_SRC = '''"""Generated tracing workloads"""
+
+
+def tight_loop(n):
+    total = 0
+    for i in range(n):
+        total += i * 2
+        if total > 1000000:
+            total = 0
+    return total
+
+
+def leaf(a, b=None, c=None, **kwargs):
+    return a
+'''
+
+
+def _chain_src(depth: int) -> str:
+    lines = []
+    for i in range(depth):
+        callee = f'chain{i + 1}' if i + 1 < depth else 'leaf'
+        lines.append(f'def chain{i}(a, **kwargs):')
+        lines.append(f'    return {callee}(a, **kwargs)')
+        lines.append('')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+WORKLOADS_TAIL = '''
+def kwargs_chain(n):
+    for i in range(n):
+        chain0(i, b=1, c=2, extra=3)
+
+
+class Inner:
+    def method(self, x, **kwargs):
+        return x
+
+
+class Middle:
+    def __init__(self):
+        self.inner = Inner()
+
+
+class Outer:
+    def __init__(self):
+        self.middle = Middle()
+
+
+def attr_chain(n):
+    ob = Outer()
+    for i in range(n):
+        ob.middle.inner.method(i, flag=True)
+
+
+class Point:
+    def __init__(self, x, y, **kwargs):
+        self.x = x
+        self.y = y
+
+
+def construct(n):
+    for i in range(n):
+        Point(i, i, label='p')
+
+
+def fib(k):
+    if k < 2:
+        return k
+    return fib(k - 1) + fib(k - 2)
+
+
+def recursion(n):
+    for _ in range(max(1, n // 1000)):
+        fib(15)
+'''
+
+WORKLOADS = ['tight_loop', 'kwargs_chain', 'attr_chain', 'construct', 'recursion']
+
+
+def generate_workloads(parent: Path, name: str = 'pyhole_workloads', depth: int = 8) -> Path:
+    """
+    Generate a package whose top-level functions named in WORKLOADS each run
+    a workload of size n, returning the package root.
+    """
+    root = Path(parent) / name
+    root.mkdir(parents=True, exist_ok=True)
+    src = WORKLOADS_SRC + '\n\n' + _chain_src(depth) + WORKLOADS_TAIL
+    (root / '__init__.py').write_text(src)
+    return root
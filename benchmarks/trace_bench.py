@@ -0,0 +1,258 @@
+"""
+Tracing overhead benchmark.
+
+Runs generated workloads (tight loops, **kwargs forwarding chains,
+attribute-chain calls, class construction and recursion) untraced, under
+Tracer (with sys.settrace and sys.setprofile), PrintTracer, CallTracer and
+DeferredCallTracer, instrumented at import time, and with the **kwargs
+functions wrapped by KwargsWrapper.
+Reports the slowdown factor and the overhead in nanoseconds per call event,
+per line event and per event (the two together). Tracers which don't see
+line events (run with sys.setprofile, instrumented or wrapped) charge all of
+their overhead to calls. The others are charged the per-call overhead of the
+bare call-only Tracer (the 'profile' column) for calls, and the rest of
+their overhead to lines. Run from the repository root:
+
+    python -m benchmarks.trace_bench -o out.json
+    python -m benchmarks.trace_bench --baseline out.json
+"""
+from pathlib import Path
+import argparse
+import contextlib
+import gc
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+from .common import (BACKENDS, compare_results, load_results, report_regressions,
+                     run_worker, write_results)
+from .synth import WORKLOADS, generate_workloads
+
+
+TRACERS = ['none', 'tracer', 'profile', 'print', 'call', 'deferred', 'instrument', 'wrap']
+
+METRICS = {
+    'slowdown': 'lower',
+    'calls': 'exact',
+    'lines': 'exact',
+}
+
+
+class EventCounter:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.lines = 0
+
+    def trace(self, frame, event, _):
+        if event == 'call':
+            self.calls += 1
+        elif event == 'line':
+            self.lines += 1
+        return self.trace
+
+
+def count_events(fn, n: int) -> EventCounter:
+    counter = EventCounter()
+    sys.settrace(counter.trace)
+    try:
+        fn(n)
+    finally:
+        sys.settrace(None)
+    # The counter also sees the call into fn itself
+    counter.calls -= 1
+    return counter
+
+
+def line_tracer():
+    """
+    A Tracer which does nothing on line events, so it runs with sys.settrace
+    like the base Tracer used to (the 'tracer' column of older results)
+    """
+    from pyhole.tracer import Tracer
+
+    class LineTracer(Tracer):
+        def trace_line(self, frame):
+            pass
+
+    return LineTracer()
+
+
+def make_tracer(kind: str, pkg_root: Path):
+    from pyhole.tracer import Tracer, PrintTracer
+    from pyhole.keyword import CallTracer
+    from pyhole.deferred import DeferredCallTracer
+    from pyhole.db import KeywordDb
+    from pyhole.project import Project
+
+    if kind in ('none', 'instrument', 'wrap'):
+        return None
+    if kind == 'tracer':
+        return line_tracer()
+    if kind == 'profile':
+        return Tracer()
+    if kind == 'print':
+        return PrintTracer(print_line=True, ignore_patterns=[])
+    project = Project(pkg_root)
+    if kind == 'deferred':
+        return DeferredCallTracer(project.db, project.kw_fns, KeywordDb())
+    return CallTracer(project.db, project.kw_fns, KeywordDb())
+
+
+def instrumented_workload(pkg_root: Path, workload: str):
+    """
+    The workload function from a copy of the package instrumented at import time
+    """
+    from pyhole.db import KeywordDb
+    from pyhole.instrument import ProbeRecorder, instrumented_code
+    from pyhole.project import Project
+    import types
+
+    project = Project(pkg_root)
+    recorder = ProbeRecorder(project.db, project.kw_fns, KeywordDb())
+    path = str(pkg_root / '__init__.py')
+    mod = types.ModuleType(f'{pkg_root.name}_instrumented')
+    mod.__file__ = path
+    recorder.install(mod.__dict__)
+    exec(instrumented_code(path), mod.__dict__)
+    return getattr(mod, workload)
+
+
+def time_wrapped(mod, pkg_root: Path, workload: str, n: int, repeat: int) -> float:
+    from pyhole.db import KeywordDb
+    from pyhole.project import Project
+    from pyhole.wrap import KwargsWrapper
+
+    project = Project(pkg_root)
+    with KwargsWrapper(project.db, project.kw_fns, KeywordDb()):
+        return time_run(getattr(mod, workload), n, None, repeat)
+
+
+def time_run(fn, n: int, tracer, repeat: int) -> float:
+    best = float('inf')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            gc.collect()
+            if tracer is not None:
+                tracer.enable_tracing()
+            start = time.perf_counter_ns()
+            fn(n)
+            end = time.perf_counter_ns()
+            if tracer is not None:
+                tracer.disable_tracing()
+                if hasattr(tracer, 'flush'):
+                    # Resolution is part of the cost, even if not paid in the callback
+                    tracer.flush()
+                    end = time.perf_counter_ns()
+            best = min(best, end - start)
+    return best
+
+
+def worker(pkg: str, workload: str, n: int, repeat: int) -> dict:
+    pkg_root = Path(pkg)
+    sys.path.insert(0, str(pkg_root.parent))
+    mod = importlib.import_module(pkg_root.name)
+    fn = getattr(mod, workload)
+
+    events = count_events(fn, n)
+    out = {'calls': events.calls, 'lines': events.lines, 'tracers': {}}
+    elapsed, line_events = {}, {}
+    for kind in TRACERS:
+        tracer = None
+        if kind == 'instrument':
+            elapsed[kind] = time_run(instrumented_workload(pkg_root, workload), n, None, repeat)
+        elif kind == 'wrap':
+            elapsed[kind] = time_wrapped(mod, pkg_root, workload, n, repeat)
+        else:
+            tracer = make_tracer(kind, pkg_root)
+            elapsed[kind] = time_run(fn, n, tracer, repeat)
+        line_events[kind] = tracer is not None and not tracer.call_only
+
+    base = elapsed['none']
+
+    def per(overhead: float, cnt: int) -> float:
+        return overhead / cnt if cnt else 0.0
+
+    # What it costs to get a call event at all, charged to the calls of tracers
+    # which also get line events
+    call_ns = per(max(0, elapsed['profile'] - base), events.calls)
+    for kind in TRACERS:
+        overhead = max(0, elapsed[kind] - base)
+        if line_events[kind]:
+            ns_per_call = call_ns
+            ns_per_line = per(max(0, overhead - call_ns * events.calls), events.lines)
+        else:
+            ns_per_call, ns_per_line = per(overhead, events.calls), 0.0
+        out['tracers'][kind] = {
+            'time_ns': elapsed[kind],
+            'slowdown': elapsed[kind] / base if base else 0.0,
+            'ns_per_call': ns_per_call,
+            'ns_per_line': ns_per_line,
+            'ns_per_event': per(overhead, events.calls + events.lines),
+        }
+    return out
+
+
+def flatten(entry: dict) -> dict[str, dict]:
+    # One comparable entry per tracer, so compare_results can be reused
+    flat = {}
+    for kind, res in entry.get('tracers', {}).items():
+        flat[kind] = dict(res, calls=entry['calls'], lines=entry['lines'])
+    return flat
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--pkg', help=argparse.SUPPRESS)
+    parser.add_argument('--workload', action='append', choices=WORKLOADS,
+                        help='Workload to run (repeatable, default: all)')
+    parser.add_argument('-n', type=int, default=2000, help='Workload size')
+    parser.add_argument('--depth', type=int, default=8, help='Length of the **kwargs chain')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--backend', choices=BACKENDS, default='PYTHON',
+                        help='Indexer backend used for CallTracer')
+    parser.add_argument('-o', '--output', type=Path, help='Write results as JSON')
+    parser.add_argument('--baseline', type=Path, help='Compare against stored results')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative slowdown before flagging a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    if args.worker:
+        import json
+        print(json.dumps(worker(args.pkg, args.workload[0], args.n, args.repeat)))
+        return 0
+
+    results = {'python': sys.version.split()[0], 'n': args.n, 'entries': {}}
+    with tempfile.TemporaryDirectory(prefix='pyhole-bench-') as tmp:
+        pkg = generate_workloads(Path(tmp), depth=args.depth)
+        for workload in args.workload or WORKLOADS:
+            entry = run_worker('benchmarks.trace_bench',
+                               ['--pkg', str(pkg), '--workload', workload,
+                                '-n', str(args.n), '--repeat', str(args.repeat)],
+                               env={'PYHOLE_INDEXER': args.backend})
+            if 'error' in entry:
+                print(f'{workload}: failed ({entry["error"]})')
+                results['entries'][workload] = entry
+                continue
+            print(f'{workload}: {entry["calls"]} calls, {entry["lines"]} lines')
+            for kind, res in flatten(entry).items():
+                results['entries'][f'{workload}/{kind}'] = res
+                print(f'  {kind:>10}: {res["time_ns"] / 1e6:9.2f} ms  x{res["slowdown"]:6.2f}  '
+                      f'{res["ns_per_call"]:8.0f} ns/call  {res["ns_per_line"]:8.0f} ns/line  '
+                      f'{res["ns_per_event"]:8.0f} ns/event')
+
+    if args.output:
+        write_results(args.output, results)
+    if args.baseline:
+        regs = compare_results(load_results(args.baseline), results, METRICS, args.tolerance)
+        return report_regressions(regs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,5 @@
 from pyhole import exec_cases, add_project, get_kwd_db
 from pyhole.project import Project
-from pathlib import Path
 import logging
 import time
 
@@ -8,12 +7,9 @@ import time
 if __name__ == "__main__":
     logging.basicConfig(format='%(levelname)s: %(message)s',
                         level=logging.WARNING)
-    cwd = Path.cwd()
-    # Run from project root
-    root = cwd / ".venv" / "lib" / "python3.10" / "site-packages" / "sympy"
-
     start = time.time()
-    project = Project(root)
+    # Modules are indexed as the test cases reach them
+    project = Project.from_import_name("sympy")
     end = time.time()
     print("parse time = {}s".format(end - start))
     print(len(project.db), "objects")
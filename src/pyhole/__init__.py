@@ -1,4 +1,5 @@
 import enum
+import os
 
 
 class Indexer(enum.Enum):
@@ -6,14 +7,18 @@ class Indexer(enum.Enum):
     PYTHON = 1
 
 
-indexer = Indexer.RUST
+# The indexer backend can be overridden (eg, by benchmarks) by setting
+# PYHOLE_INDEXER to the name of an Indexer variant.
+indexer = Indexer[os.environ.get('PYHOLE_INDEXER', 'RUST').upper()]
 
 if indexer == Indexer.RUST:
     from parse_py import (SourceSpan, ObjectPath, Object, AltObject, Module,
                           Function, Class, FormalParam, FormalParamKind)
     from parse_py import module_from_dir
-    from .test_decorator import test_case, add_project, exec_cases, get_kwd_db
+    from .test_decorator import (test_case, add_project, attach_project, exec_cases,
+                                 get_kwd_db, get_attached_report)
 else:
     from .object import (SourceSpan, ObjectPath, Object, AltObject, Module,
                          Function, Class, FormalParam, FormalParamKind)
-    from .test_decorator import test_case, add_project, exec_cases, get_kwd_db
+    from .test_decorator import (test_case, add_project, attach_project, exec_cases,
+                                 get_kwd_db, get_attached_report)
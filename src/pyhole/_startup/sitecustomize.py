@@ -0,0 +1,22 @@
+"""
+Put on PYTHONPATH of children by pyhole.propagate, to trace them from startup.
+"""
+import os
+import sys
+
+try:
+    from pyhole.propagate import start_child
+except ImportError:
+    pass
+else:
+    start_child()
+
+# Run the sitecustomize module this one shadows, if any
+_self = sys.modules.pop('sitecustomize')
+_startup_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or '.') != _startup_dir]
+try:
+    import sitecustomize  # noqa: F401
+except ImportError:
+    # The import system expects to find this module once it ran
+    sys.modules['sitecustomize'] = _self
@@ -1,3 +1,4 @@
+import hashlib
 from .db import Position
 
 
@@ -19,3 +20,22 @@ class FileCache:
         with open(filename) as f:
             lines = list(map(lambda x: x[:-1], f.readlines()))
             self.files[filename] = lines
+
+    def source_hash(self, filename: str, start_line: int, end_line: int) -> str:
+        """
+        Hash of the source lines start_line to end_line (inclusive) of filename
+        """
+        if filename not in self.files:
+            self._open_file(filename)
+        text = '\n'.join(self.files[filename][start_line - 1:end_line])
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def object_hash(self, ob) -> str:
+        """
+        Hash of the source of ob (eg, a Function), empty if it can't be read
+        """
+        span = ob.source_span
+        try:
+            return self.source_hash(str(span.filename), span.start_line, span.end_line)
+        except OSError:
+            return ''
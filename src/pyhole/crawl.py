@@ -0,0 +1,192 @@
+"""
+Listing of project directories for Project, with os.scandir.
+
+A Crawler leaves out the entries matching its exclude globs, and directories
+it already listed in the current crawl (eg, reached again through a symlink).
+It keeps a manifest of the directories it listed with their mtimes, which
+can be saved between runs. A directory whose mtime didn't change isn't listed
+again, since adding, removing or renaming entries changes it.
+"""
+from fnmatch import translate
+from pathlib import PurePath
+import json
+import logging as lg
+import os
+import re
+import time
+
+
+MANIFEST_VERSION = 1
+
+# Directories which never hold project packages
+DEFAULT_EXCLUDE = ['__pycache__', '.*', 'node_modules', '*.egg-info']
+
+# Listings of directories modified less than this long before are not kept in
+# the manifest, as a later change could leave the mtime as it was
+_RACY_NS = 2_000_000_000
+
+
+class DirChildren:
+    init: PurePath | None
+    files: list[PurePath]
+    dirs: list[PurePath]
+
+    def __init__(
+        self, init: PurePath | None, files: list[PurePath], dirs: list[PurePath]
+    ) -> None:
+        self.init = init
+        self.files = files
+        self.dirs = dirs
+
+
+def manifest_path(rst_path: PurePath) -> PurePath:
+    """
+    Where the directory manifest of a run is kept, next to its results
+    """
+    return rst_path.with_suffix('.manifest.json')
+
+
+def _compile_globs(patterns: list[str]) -> re.Pattern | None:
+    if not patterns:
+        return None
+    return re.compile('|'.join(translate(p) for p in patterns))
+
+
+class Crawler:
+    """
+    Lists the directories under root. A glob of exclude without a / is
+    matched against the names of entries, one with a / against their path
+    relative to root, eg, "tests" excludes every tests directory and
+    "pkg/vendor" only one of them.
+    """
+
+    root: PurePath
+    exclude: list[str]
+    # directory => (mtime in ns, its children)
+    manifest: dict[str, tuple[int, DirChildren]]
+    # Directories listed, rather than taken from the manifest
+    listed: int
+    # Children of the directories of the current crawl
+    crawled: dict[str, DirChildren]
+
+    def __init__(self, root: PurePath, exclude: list[str] | None = None) -> None:
+        self.root = root
+        self.exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+        patterns = [p.strip('/') for p in self.exclude]
+        self._names = _compile_globs([p for p in patterns if '/' not in p])
+        self._paths = _compile_globs([p for p in patterns if '/' in p])
+        # Of the prefix to strip from paths to make them relative to root
+        self._root_len = 0 if str(root) == '.' else len(str(root)) + 1
+        self.manifest = {}
+        self.listed = 0
+        self.crawled = {}
+        self._visited: set[tuple[int, int]] = set()
+
+    def restart(self) -> None:
+        """
+        Start a new crawl, in which directories listed before are listed again
+        (if changed).
+        """
+        self._visited = set()
+        self.crawled = {}
+
+    def stamps(self) -> dict[str, tuple[int, int]]:
+        """
+        The mtime and size of the directories of the current crawl and of the
+        files found in them. A new crawl finds other files, or files with
+        other contents, only if these changed.
+        """
+        stamps = {}
+        for directory, drc in self.crawled.items():
+            paths = [directory, *map(str, drc.files)]
+            if drc.init is not None:
+                paths.append(str(drc.init))
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def _excluded(self, path: str, name: str) -> bool:
+        if self._names is not None and self._names.match(name):
+            return True
+        return self._paths is not None and self._paths.match(path[self._root_len:]) is not None
+
+    def dir_children(self, directory: PurePath) -> DirChildren:
+        """
+        The children of directory (see dir_children in pyhole.project), none
+        if it was already listed in this crawl.
+        """
+        path = str(directory)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return DirChildren(None, [], [])
+        ident = (st.st_dev, st.st_ino)
+        if ident in self._visited:
+            return DirChildren(None, [], [])
+        self._visited.add(ident)
+
+        cached = self.manifest.get(path)
+        if cached is not None and cached[0] == st.st_mtime_ns:
+            self.crawled[path] = cached[1]
+            return cached[1]
+        drc = self._list(directory, path)
+        self.crawled[path] = drc
+        self.listed += 1
+        if time.time_ns() - st.st_mtime_ns > _RACY_NS:
+            self.manifest[path] = (st.st_mtime_ns, drc)
+        else:
+            self.manifest.pop(path, None)
+        return drc
+
+    def _list(self, directory: PurePath, path: str) -> DirChildren:
+        files: list[PurePath] = []
+        dirs: list[PurePath] = []
+        init: PurePath | None = None
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                try:
+                    if entry.is_dir():
+                        if not self._excluded(entry.path, name):
+                            dirs.append(directory / name)
+                    elif name.endswith('.py') and entry.is_file():
+                        if name == '__init__.py':
+                            init = directory / name
+                        elif not self._excluded(entry.path, name):
+                            files.append(directory / name)
+                except OSError:
+                    # Removed meanwhile, or a broken symlink
+                    continue
+        return DirChildren(init, files, dirs)
+
+    def load_manifest(self, path: PurePath) -> None:
+        """
+        Start from the manifest saved at path, unless it was saved with
+        other exclude globs.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            lg.warning('Ignoring unreadable manifest %s: %s', path, e)
+            return
+        if data.get('version') != MANIFEST_VERSION or data.get('exclude') != self.exclude:
+            return
+        for directory, (mtime, init, files, dirs) in data['dirs'].items():
+            base = PurePath(directory)
+            self.manifest[directory] = (mtime, DirChildren(
+                base / '__init__.py' if init else None,
+                [base / name for name in files], [base / name for name in dirs]))
+
+    def save_manifest(self, path: PurePath) -> None:
+        dirs = {directory: [mtime, drc.init is not None,
+                            [f.name for f in drc.files], [d.name for d in drc.dirs]]
+                for directory, (mtime, drc) in self.manifest.items()}
+        with open(path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'exclude': self.exclude, 'dirs': dirs}, f)
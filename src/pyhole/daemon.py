@@ -0,0 +1,358 @@
+"""
+Long-running daemon keeping project indexes warm, reached over a Unix socket.
+
+Clients (the pytest plugin, exec_cases, or anything speaking the protocol)
+don't index projects themselves. They open a session over some registered
+roots, fetch a table of the functions to watch, record call events with
+RemoteCallTracer and send them to the daemon, which resolves them into the
+session's KeywordDb with its own Project (see pyhole.deferred). Roots are
+re-indexed when their source files change.
+
+The protocol is one JSON object per line each way. Requests have an "op" and
+its parameters, responses carry the result, or an "error". Requests over
+roots may give the "exclude" globs to list them with (see pyhole.crawl).
+Start a daemon with:
+
+    python -m pyhole.daemon [--socket PATH] [ROOT ...]
+"""
+from contextlib import redirect_stdout
+from pathlib import PurePath
+from typing import Any
+import argparse
+import io
+import itertools
+import json
+import logging as lg
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from .crawl import DEFAULT_EXCLUDE, Crawler
+from .db import KeywordDb, Position
+from .deferred import DeferredCallTracer, TableEventRecorder, function_table
+from .keyword import LinePlan, nearest_enclosing_function
+from .project import Project
+from .static import infer_static_keywords, infer_dict_access_keywords
+
+
+PROTOCOL_VERSION = 1
+
+
+def default_socket_path() -> str:
+    path = os.environ.get('PYHOLE_DAEMON_SOCKET')
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f'pyhole-{os.getuid()}.sock')
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+def _source_files(root: str) -> dict[str, tuple[int, int]]:
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith('.py'):
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+class IndexedRoot:
+    root: str
+    project: Project
+    line_plan: LinePlan
+
+    def __init__(self, root: str, exclude: list[str] | None = None) -> None:
+        self.root = root
+        self._checked = 0.0
+        # Kept between re-indexes, so that unchanged directories aren't listed again
+        self._crawler = Crawler(PurePath(root), exclude)
+        self._index()
+
+    def _stamps(self) -> dict[str, tuple[int, int]]:
+        if self._crawler.crawled:
+            # Only what the index was built from, not excluded directories
+            return self._crawler.stamps()
+        # The Rust indexer lists directories itself
+        return _source_files(self.root)
+
+    def _index(self) -> None:
+        self.project = Project(PurePath(self.root), crawler=self._crawler)
+        self._stamps_seen = self._stamps()
+        self.line_plan = LinePlan(self.project.kw_fns)
+        self._checked = time.monotonic()
+
+    def refresh(self, min_interval: float) -> bool:
+        """
+        Re-index if source files changed, checking at most once every
+        min_interval seconds. Returns whether the root was re-indexed.
+        """
+        if time.monotonic() - self._checked < min_interval:
+            return False
+        self._checked = time.monotonic()
+        if self._stamps() == self._stamps_seen:
+            return False
+        lg.info('Re-indexing %s', self.root)
+        self._index()
+        return True
+
+
+class Session:
+    """
+    The state of one client run over some roots. Projects are those current
+    when the session was opened, even if a root is re-indexed meanwhile.
+    """
+
+    projects: list[Project]
+    kwd_db: KeywordDb
+    tracer: DeferredCallTracer
+
+    def __init__(self, projects: list[Project], static: bool) -> None:
+        self.projects = projects
+        self.kwd_db = KeywordDb()
+        static_calls = set()
+        if static:
+            for project in projects:
+                static_calls |= infer_static_keywords(project, self.kwd_db)
+                infer_dict_access_keywords(project.kw_fns, self.kwd_db)
+        self.tracer = DeferredCallTracer([p.db for p in projects],
+                                         [p.kw_fns for p in projects],
+                                         self.kwd_db, static_calls=static_calls)
+
+    def function_table(self) -> dict[str, dict[str, str]]:
+        """
+        filename => def line => name of **kwargs (empty if none), for every
+        function of the session's projects
+        """
+        table = function_table([p.db for p in self.projects], [p.kw_fns for p in self.projects])
+        return {filename: {str(line): kw_name or '' for line, kw_name in fns.items()}
+                for filename, fns in table.items()}
+
+
+class DaemonState:
+    # By root and exclude globs
+    roots: dict[tuple[str, tuple[str, ...]], IndexedRoot]
+    sessions: dict[str, Session]
+
+    def __init__(self, refresh_interval: float = 1.0) -> None:
+        self.roots = {}
+        self.sessions = {}
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self._session_ids = itertools.count(1)
+
+    def indexed(self, root: str, exclude: list[str] | None = None) -> IndexedRoot:
+        """
+        The index of root, listed with the exclude globs (the default ones if
+        None, see pyhole.crawl)
+        """
+        root = os.path.abspath(root)
+        exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+        key = (root, tuple(exclude))
+        entry = self.roots.get(key)
+        if entry is None:
+            entry = self.roots[key] = IndexedRoot(root, exclude)
+        else:
+            entry.refresh(self.refresh_interval)
+        return entry
+
+    def _session(self, req: dict) -> Session:
+        try:
+            return self.sessions[req['session']]
+        except KeyError:
+            raise DaemonError(f'unknown session {req.get("session")}')
+
+    def handle(self, req: dict) -> dict[str, Any]:
+        with self.lock:
+            return self._handle(req)
+
+    def _handle(self, req: dict) -> dict[str, Any]:
+        match req.get('op'):
+            case 'ping':
+                return {'version': PROTOCOL_VERSION}
+            case 'register':
+                project = self.indexed(req['root'], req.get('exclude')).project
+                return {'objects': len(project.db), 'kw_fns': len(project.kw_fns)}
+            case 'is_kw_fn':
+                project = self.indexed(req['root'], req.get('exclude')).project
+                pos = Position(req['filename'], req['line'])
+                return {'result': pos in project.kw_fns}
+            case 'plan':
+                entry = self.indexed(req['root'], req.get('exclude'))
+                fn = nearest_enclosing_function(Position(req['filename'], req['line']),
+                                                entry.project.db)
+                if fn is None:
+                    return {'function': None, 'lines': []}
+                return {'function': str(fn.full_path()),
+                        'lines': sorted(entry.line_plan.lines_of(fn))}
+            case 'open':
+                projects = [self.indexed(root, req.get('exclude')).project
+                            for root in req['roots']]
+                session_id = str(next(self._session_ids))
+                self.sessions[session_id] = Session(projects, req.get('static', False))
+                return {'session': session_id}
+            case 'functions':
+                return {'functions': self._session(req).function_table()}
+            case 'events':
+                events = [(Position(*caller) if caller else None, line, Position(*callee), keys)
+                          for caller, line, callee, keys in req['events']]
+                self._session(req).tracer.resolve_events(events)
+                return {}
+            case 'merge':
+                sess = self._session(req)
+                sess.kwd_db.merge_shard(req['shard'], [p.db for p in sess.projects])
+                return {}
+            case 'keywords':
+                return {'shard': self._session(req).kwd_db.to_shard()}
+            case 'render':
+                kwd_db = self._session(req).kwd_db
+                rst = io.StringIO()
+                kwd_db.render_rst(rst)
+                fancy = io.StringIO()
+                with redirect_stdout(fancy):
+                    kwd_db.print_fancy()
+                return {'rst': rst.getvalue(), 'fancy': fancy.getvalue()}
+            case 'close':
+                self.sessions.pop(req.get('session'), None)
+                return {}
+            case op:
+                raise DaemonError(f'unknown op {op}')
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            shutdown = False
+            try:
+                req = json.loads(line)
+                shutdown = req.get('op') == 'shutdown'
+                resp = {} if shutdown else self.server.state.handle(req)
+            except Exception as e:
+                lg.debug('Request failed', exc_info=True)
+                resp = {'error': f'{type(e).__name__}: {e}'}
+            self.wfile.write(json.dumps(resp).encode() + b'\n')
+            self.wfile.flush()
+            if shutdown:
+                # From another thread, as shutdown waits for serve_forever to exit
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+class PyholeDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    state: DaemonState
+
+    def __init__(self, socket_path: str, roots: list[str] = (),
+                 refresh_interval: float = 1.0) -> None:
+        if os.path.exists(socket_path):
+            if DaemonClient.connect(socket_path) is not None:
+                raise DaemonError(f'a daemon is already listening on {socket_path}')
+            # Left over by a daemon which didn't exit cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+        self.socket_path = socket_path
+        self.state = DaemonState(refresh_interval)
+        for root in roots:
+            self.state.indexed(root)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class DaemonClient:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.file = sock.makefile('rwb')
+
+    @staticmethod
+    def connect(socket_path: str | None = None) -> "DaemonClient | None":
+        """
+        A client of the daemon listening on socket_path, None if there is none.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path or default_socket_path())
+        except OSError:
+            sock.close()
+            return None
+        return DaemonClient(sock)
+
+    def call(self, op: str, **params: Any) -> dict[str, Any]:
+        self.file.write(json.dumps(dict(params, op=op)).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise DaemonError('connection to the daemon was closed')
+        resp = json.loads(line)
+        if 'error' in resp:
+            raise DaemonError(resp['error'])
+        return resp
+
+    def close(self) -> None:
+        self.file.close()
+        self.sock.close()
+
+
+class RemoteCallTracer(TableEventRecorder):
+    """
+    Records call events for a daemon session, which resolves them. Only
+    needs the session's function table, not an index.
+    """
+
+    def __init__(self, client: DaemonClient, session: str,
+                 capacity: int = 1 << 16, collect_stats: bool = False) -> None:
+        table = client.call('functions', session=session)['functions']
+        super().__init__({filename: {int(line): kw_name or None for line, kw_name in fns.items()}
+                          for filename, fns in table.items()}, capacity, collect_stats)
+        self.client = client
+        self.session = session
+        self._sent: set[tuple[int, int, int, tuple[str, ...]]] = set()
+
+    def process(self, events: set[tuple[int, int, int, tuple[str, ...]]]) -> None:
+        events -= self._sent
+        if not events:
+            return
+        self._sent.update(events)
+        self.client.call('events', session=self.session, events=self.positions_of(events))
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Keep pyhole project indexes warm')
+    parser.add_argument('roots', nargs='*', help='Project roots to index at startup')
+    parser.add_argument('--socket', default=None,
+                        help='Socket path (default: $PYHOLE_DAEMON_SOCKET, or one '
+                             'in $XDG_RUNTIME_DIR or the temporary directory)')
+    parser.add_argument('--refresh-interval', type=float, default=1.0,
+                        help='Minimum seconds between checks for changed files of a root')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    lg.basicConfig(format='%(levelname)s: %(message)s', level=lg.INFO)
+    socket_path = args.socket or default_socket_path()
+    with PyholeDaemon(socket_path, args.roots, args.refresh_interval) as server:
+        lg.info('Listening on %s', socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
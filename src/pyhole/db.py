@@ -2,7 +2,8 @@ from types import FunctionType, MethodType
 from . import Object, Function
 from .utils import horizontal_line, boxed, tabled
 from pathlib import PurePath
-from typing import Tuple, TextIO
+from typing import Callable, Tuple, TextIO
+import enum
 
 
 class Position:
@@ -38,20 +39,121 @@ class Position:
         raise NotImplementedError
 
 
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("numpy is needed for batch position resolution "
+                           "(install pyhole[numpy])") from e
+    return numpy
+
+
+class FunctionIndex:
+    """
+    Arrays of the spans of the functions in an ObjectDb, for resolving many
+    (file id, line) positions at once. Functions are sorted by file id and
+    start line, and a function's id is its rank in that order. Positions are
+    packed into int64 keys as file_id << 32 | line, so that searchsorted finds
+    the last function starting at or before each position, and parents (the
+    innermost function enclosing each function, or -1) are followed up to
+    the innermost function which also ends after it.
+    """
+
+    files: list[str]
+    file_ids: dict[str, int]
+    functions: list[Function]
+
+    def __init__(self, fns: list[Tuple[str, int, int, Function]]) -> None:
+        np = _import_numpy()
+        self.files = sorted({filename for filename, _, _, _ in fns})
+        self.file_ids = {filename: i for i, filename in enumerate(self.files)}
+        fns = sorted(fns, key=lambda f: (self.file_ids[f[0]], f[1]))
+        self.functions = [fn for _, _, _, fn in fns]
+        file_col = np.array([self.file_ids[f[0]] for f in fns], dtype=np.int64)
+        self.starts = np.array([f[1] for f in fns], dtype=np.int64)
+        self.ends = np.array([f[2] for f in fns], dtype=np.int64)
+        self.start_keys = (file_col << 32) | self.starts
+        self.end_keys = (file_col << 32) | self.ends
+        self.parents = np.full(len(fns), -1, dtype=np.int64)
+        stack: list[int] = []
+        for i in range(len(fns)):
+            while stack and self.end_keys[stack[-1]] < self.start_keys[i]:
+                stack.pop()
+            if stack:
+                self.parents[i] = stack[-1]
+            stack.append(i)
+        bounds = np.searchsorted(file_col, np.arange(len(self.files) + 1))
+        self._file_bounds = {filename: (bounds[i], bounds[i + 1])
+                             for i, filename in enumerate(self.files)}
+
+    def file_id(self, filename: str) -> int:
+        """
+        Id of filename, -1 if it has no functions.
+        """
+        return self.file_ids.get(filename, -1)
+
+    def file_arrays(self, filename: str):
+        """
+        Start lines, end lines and ids of the functions in filename, sorted by
+        start line.
+        """
+        np = _import_numpy()
+        lo, hi = self._file_bounds.get(filename, (0, 0))
+        return self.starts[lo:hi], self.ends[lo:hi], np.arange(lo, hi, dtype=np.int64)
+
+    def resolve(self, file_ids, lines):
+        """
+        Ids of the innermost functions enclosing each (file id, line), -1 for
+        positions outside any function.
+        """
+        np = _import_numpy()
+        keys = (np.asarray(file_ids, dtype=np.int64) << 32) | np.asarray(lines, dtype=np.int64)
+        idx = np.searchsorted(self.start_keys, keys, side='right') - 1
+        # Climb out of the functions which end before the position, at most
+        # once per level of nesting
+        pending = idx >= 0
+        while True:
+            pending[pending] = self.end_keys[idx[pending]] < keys[pending]
+            if not pending.any():
+                return idx
+            idx[pending] = self.parents[idx[pending]]
+            pending &= idx >= 0
+
+
 class ObjectDb:
     db: dict[Position, Object]
+    obs: set[Object]
     file_fn_db: dict[str, list[Tuple[int, Function]]]
 
+    # Called with the filename of a position missing from the db, to index the
+    # module of the file on demand (see Project.from_import_name)
+    index_file: Callable[[str], None] | None
+
     def __init__(self) -> None:
         self.db = {}
+        self.obs = set()
         self.file_fn_db = {}
+        self._fn_index = None
+        self.index_file = None
 
     def __setitem__(self, pos: Position, ob: Object) -> None:
         if pos in self.db:
             raise RuntimeError(f"{pos} already exists in db")
         self.db[pos] = ob
+        self.obs.add(ob)
+        self._fn_index = None
+
+    def __contains__(self, pos: Position) -> bool:
+        if pos in self.db:
+            return True
+        if self.index_file is None:
+            return False
+        self.index_file(pos.filename)
+        return pos in self.db
 
     def __getitem__(self, pos: Position) -> Object:
+        if pos not in self.db and self.index_file is not None:
+            self.index_file(pos.filename)
         return self.db[pos]
 
     def __len__(self) -> int:
@@ -67,11 +169,13 @@ class ObjectDb:
         return self.db.values()
 
     def has_ob(self, ob: Object) -> bool:
-        return ob in self.db.values()
+        return ob in self.obs
 
     def file_fn_obs(self, filename: str):
         if filename in self.file_fn_db:
             return self.file_fn_db[filename]
+        if self.index_file is not None:
+            self.index_file(filename)
         file_fn_obs = []
         for ob_pos, ob in self.db.items():
             if ob_pos.filename == filename and isinstance(ob, Function):
@@ -81,29 +185,129 @@ class ObjectDb:
         self.file_fn_db[filename] = file_fn_obs
         return file_fn_obs
 
+    def function_index(self) -> FunctionIndex:
+        """
+        Vectorized view of the functions in the db (needs numpy), built on
+        first use.
+        """
+        if self._fn_index is None:
+            fns = [(pos.filename, pos.start_line, ob.source_span.end_line, ob)
+                   for pos, ob in self.db.items() if isinstance(ob, Function)]
+            self._fn_index = FunctionIndex(fns)
+        return self._fn_index
+
     def lookup_fn(self, fn: FunctionType | MethodType) -> Object | None:
         if not hasattr(fn, "__code__"):
             return None
         code = fn.__code__
         pos = Position(code.co_filename, code.co_firstlineno)
-        if pos in self.db:
+        if pos in self:
             return self.db[pos]
         else:
             return None
 
 
+class Evidence(enum.Enum):
+    """
+    How a key was found
+    """
+    TRACE = 0
+    STATIC_CALL = 1
+    DICT_ACCESS = 2
+    # Traced in an earlier run, see pyhole.results
+    CACHED = 3
+
+    def __str__(self) -> str:
+        match self:
+            case Evidence.TRACE:
+                return "traced"
+            case Evidence.STATIC_CALL:
+                return "static call"
+            case Evidence.DICT_ACCESS:
+                return "dict access"
+            case Evidence.CACHED:
+                return "cached"
+
+
 class KeywordDb:
     db: dict[Function, list[str]]
+    evidence: dict[Function, dict[str, set[Evidence]]]
+    # The other functions (callers or callees) whose code the keys of a
+    # function were found through
+    sources: dict[Function, set[Function]]
 
     def __init__(self) -> None:
         self.db = {}
+        self.evidence = {}
+        self.sources = {}
 
-    def append_possibility(self, fn: Function, poss: str) -> None:
+    def append_possibility(self, fn: Function, poss: str,
+                           evidence: Evidence = Evidence.TRACE,
+                           source: Function | None = None) -> None:
         if fn not in self.db:
             self.db[fn] = []
+            self.evidence[fn] = {}
         fn_list = self.db[fn]
         if poss not in fn_list:
             fn_list.append(poss)
+            self.evidence[fn][poss] = {evidence}
+        else:
+            self.evidence[fn][poss].add(evidence)
+        if source is not None and source is not fn:
+            if fn not in self.sources:
+                self.sources[fn] = set()
+            self.sources[fn].add(source)
+
+    def evidence_of(self, fn: Function, poss: str) -> set[Evidence]:
+        return self.evidence.get(fn, {}).get(poss, set())
+
+    def merge(self, other: "KeywordDb") -> None:
+        for fn, kwds in other.items():
+            for kwd in kwds:
+                for evidence in other.evidence_of(fn, kwd):
+                    self.append_possibility(fn, kwd, evidence)
+        for fn, srcs in other.sources.items():
+            self.sources.setdefault(fn, set()).update(srcs)
+
+    def to_shard(self) -> list[list]:
+        """
+        The keys as plain data, keyed by the Position of each function, to be
+        merged into a KeywordDb elsewhere (eg, in another process) with
+        merge_shard. Each key comes with the Positions of the sources of its
+        function.
+        """
+        shard = []
+        for fn, kwds in self.items():
+            span = fn.source_span
+            sources = sorted([str(src.source_span.filename), src.source_span.start_line]
+                             for src in self.sources.get(fn, ()))
+            for kwd in kwds:
+                evidence = sorted(e.name for e in self.evidence_of(fn, kwd))
+                shard.append([str(span.filename), span.start_line, kwd, evidence, sources])
+        return shard
+
+    def merge_shard(self, shard: list[list], dbs: ObjectDb | list[ObjectDb]) -> None:
+        """
+        Merge keys produced by to_shard, looking up functions in dbs. Keys of
+        functions which aren't found are dropped, and so are sources which
+        aren't found.
+        """
+        dbs = dbs if isinstance(dbs, list) else [dbs]
+
+        def lookup(filename: str, start_line: int) -> Function | None:
+            pos = Position(filename, start_line)
+            return next((db[pos] for db in dbs if pos in db), None)
+
+        for filename, start_line, kwd, evidence, sources in shard:
+            fn = lookup(filename, start_line)
+            if fn is None:
+                continue
+            for name in evidence:
+                self.append_possibility(fn, kwd, Evidence[name])
+            for src_filename, src_line in sources:
+                src = lookup(src_filename, src_line)
+                if src is not None and src is not fn:
+                    self.sources.setdefault(fn, set()).add(src)
 
     def __str__(self) -> str:
         return str(self.db)
@@ -136,7 +340,12 @@ class KeywordDb:
             file.write(f'Signature: def {name}({fn._format_args()})\n\n')
             file.write('Valid keys:\n\n')
             for kwd in kwds:
-                file.write(f'* {kwd}\n')
+                evidence = self.evidence_of(fn, kwd)
+                if Evidence.TRACE in evidence or not evidence:
+                    file.write(f'* {kwd}\n')
+                else:
+                    kinds = ', '.join(sorted(map(str, evidence)))
+                    file.write(f'* {kwd} ({kinds})\n')
             file.write('\n')
 
     @staticmethod
@@ -0,0 +1,337 @@
+"""
+Deferred analysis: record compact call events while tests run, resolve them
+into a KeywordDb afterwards.
+
+The tracer callback only looks up the ids of the caller and callee code
+objects and appends (caller id, caller line, callee id, **kwargs keys) to a
+preallocated array-backed buffer. Matching events against call expressions
+and signatures (what CallTracer does inside the callback) happens in
+batches, when the buffer fills up and whenever flush is called.
+"""
+from array import array
+import builtins
+import sys
+from types import CodeType, FrameType
+from typing import Any, Iterable
+from .db import KeywordDb, ObjectDb, Position
+from .keyword import KeywordValKind, find_keyword_params
+from .object import CallSite, call_sites_at
+from .tracer import Tracer
+from . import Class, Function, Module
+
+
+# Code ids of code objects which aren't project functions
+_FOREIGN = -1
+
+# Marks names missing from a namespace
+_UNBOUND = object()
+
+
+class EventBuffer:
+    """
+    Fixed capacity buffer of call events, stored column-wise in arrays.
+    Keys tuples are interned, so that each event is four integers.
+    """
+
+    capacity: int
+    size: int
+
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self.callers = array('l', [0]) * capacity
+        self.lines = array('l', [0]) * capacity
+        self.callees = array('l', [0]) * capacity
+        self.key_ids = array('l', [0]) * capacity
+        self.keys: list[tuple[str, ...]] = [()]
+        self._key_ids: dict[tuple[str, ...], int] = {(): 0}
+
+    def append(self, caller: int, line: int, callee: int, keys: tuple[str, ...]) -> bool:
+        """
+        Returns whether the buffer is full.
+        """
+        key_id = self._key_ids.get(keys)
+        if key_id is None:
+            key_id = self._key_ids[keys] = len(self.keys)
+            self.keys.append(keys)
+        i = self.size
+        self.callers[i] = caller
+        self.lines[i] = line
+        self.callees[i] = callee
+        self.key_ids[i] = key_id
+        self.size = i + 1
+        return self.size == self.capacity
+
+    def drain(self) -> set[tuple[int, int, int, int]]:
+        """
+        The distinct events in the buffer, which is emptied.
+        """
+        events = set(zip(self.callers[:self.size], self.lines[:self.size],
+                         self.callees[:self.size], self.key_ids[:self.size]))
+        self.size = 0
+        return events
+
+
+class CallEventRecorder(Tracer):
+    """
+    Call-only tracer (run with sys.setprofile) recording compact call events,
+    see the module docstring. Subclasses say which functions are of interest
+    (_lookup) and what to do with the recorded events (process), which is
+    called when the buffer fills up and on flush.
+    """
+
+    buffer: EventBuffer
+    files: set[str]
+
+    def __init__(self, files: set[str], capacity: int = 1 << 16,
+                 collect_stats: bool = False) -> None:
+        super().__init__(collect_stats)
+        self.buffer = EventBuffer(capacity)
+        self.files = files
+        self._code_ids: dict[CodeType, int] = {}
+        self._pos_ids: dict[Position, int] = {}
+        # Indexed by id
+        self._tokens: list[Any] = []
+        self._kw_names: list[str | None] = []
+
+    # Override this
+    def _lookup(self, pos: Position) -> tuple[Any, str | None] | None:
+        """
+        A token standing for the function defined at pos, and the name of its
+        **kwargs if it is a **kwargs function. None if pos isn't a function of
+        interest.
+        """
+        return None
+
+    # Override this
+    def process(self, events: set[tuple[int, int, int, tuple[str, ...]]]) -> None:
+        pass
+
+    def _register_pos(self, pos: Position) -> int:
+        code_id = self._pos_ids.get(pos)
+        if code_id is None:
+            code_id = _FOREIGN
+            found = self._lookup(pos) if pos.filename in self.files else None
+            if found is not None:
+                code_id = len(self._tokens)
+                self._tokens.append(found[0])
+                self._kw_names.append(found[1])
+            self._pos_ids[pos] = code_id
+        return code_id
+
+    def _register(self, code: CodeType) -> int:
+        code_id = _FOREIGN
+        # Module code starts on line 1, like a function defined there
+        if code.co_filename in self.files and code.co_name != '<module>':
+            code_id = self._register_pos(Position(code.co_filename, code.co_firstlineno))
+        self._code_ids[code] = code_id
+        return code_id
+
+    def trace_call(self, frame: FrameType):
+        ids = self._code_ids
+        callee = ids.get(frame.f_code)
+        if callee is None:
+            callee = self._register(frame.f_code)
+        if callee == _FOREIGN:
+            return
+        back = frame.f_back
+        if back is None:
+            return
+        caller = ids.get(back.f_code)
+        if caller is None:
+            caller = self._register(back.f_code)
+        kw_name = self._kw_names[callee]
+        keys = tuple(frame.f_locals[kw_name]) if kw_name else ()
+        if self.buffer.append(caller, back.f_lineno, callee, keys):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Process the buffered events.
+        """
+        keys = self.buffer.keys
+        self.process({(caller, line, callee, keys[key_id])
+                      for caller, line, callee, key_id in self.buffer.drain()})
+
+
+def function_table(dbs: list[ObjectDb], kw_fns: list[ObjectDb]) -> dict[str, dict[int, str | None]]:
+    """
+    filename => def line => name of **kwargs (None if none), for every
+    function of dbs. Enough for a TableEventRecorder to record events without
+    the index.
+    """
+    table: dict[str, dict[int, str | None]] = {}
+    for db, kw_db in zip(dbs, kw_fns):
+        for pos, ob in db.items():
+            if not isinstance(ob, Function):
+                continue
+            kw_name = ob.get_kwargs_name() if kw_db.has_ob(ob) else None
+            table.setdefault(pos.filename, {})[pos.start_line] = kw_name
+    return table
+
+
+class TableEventRecorder(CallEventRecorder):
+    """
+    Records events of the functions of a function_table, with [filename,
+    def line] as their token, so that they can be resolved where the index is.
+    """
+
+    table: dict[str, dict[int, str | None]]
+
+    def __init__(self, table: dict[str, dict[int, str | None]],
+                 capacity: int = 1 << 16, collect_stats: bool = False) -> None:
+        super().__init__(set(table), capacity, collect_stats)
+        self.table = table
+
+    def _lookup(self, pos: Position) -> tuple[Any, str | None] | None:
+        fns = self.table.get(pos.filename)
+        if fns is None or pos.start_line not in fns:
+            return None
+        return [pos.filename, pos.start_line], fns[pos.start_line]
+
+    def positions_of(self, events: Iterable[tuple[int, int, int, tuple[str, ...]]]) -> list[list]:
+        """
+        events as [caller token (None if foreign), line, callee token, keys],
+        the form resolve_events of DeferredCallTracer takes
+        """
+        return [[self._tokens[caller] if caller >= 0 else None, line, self._tokens[callee], list(keys)]
+                for caller, line, callee, keys in events]
+
+
+class DeferredCallTracer(CallEventRecorder):
+    """
+    Resolves call events into kwd_db, see the module docstring. Call flush
+    after each test, or at the end of the session, to update kwd_db. Events
+    recorded elsewhere (eg, by another process) can be resolved with
+    resolve_events.
+
+    Call expressions are matched to events by the name the callee is called
+    by, falling back to the only candidate call of the statement if it calls
+    a name which may be bound to the callee (see _may_call). Callees invoked
+    through an alias, with several candidate calls on the same statement,
+    are missed.
+    """
+
+    dbs: list[ObjectDb]
+    kw_fns: list[ObjectDb]
+    kwd_db: KeywordDb
+    static_calls: set[CallSite]
+
+    def __init__(self, dbs: ObjectDb | list[ObjectDb],
+                 kw_fns: ObjectDb | list[ObjectDb],
+                 kwd_db: KeywordDb,
+                 static_calls: set[CallSite] | None = None,
+                 capacity: int = 1 << 16,
+                 collect_stats: bool = False) -> None:
+        dbs = dbs if isinstance(dbs, list) else [dbs]
+        super().__init__({pos.filename for db in dbs for pos in db}, capacity, collect_stats)
+        self.dbs = dbs
+        self.kw_fns = kw_fns if isinstance(kw_fns, list) else [kw_fns]
+        self.kwd_db = kwd_db
+        self.static_calls = static_calls if static_calls is not None else set()
+        self._seen: set[tuple[int, int, int, tuple[str, ...]]] = set()
+        # Indexed functions called while tracing, if set to a set (see pyhole.impact)
+        self.reached: set[Function] | None = None
+        # Functions whose keys are already known (see pyhole.results)
+        self.saturated: set[Function] = set()
+
+    def _is_kwd_fn(self, fn: Function) -> bool:
+        return any(map(lambda dt: dt.has_ob(fn), self.kw_fns))
+
+    def _lookup(self, pos: Position) -> tuple[Any, str | None] | None:
+        for db in self.dbs:
+            if pos in db and isinstance(db[pos], Function):
+                fn = db[pos]
+                return fn, fn.get_kwargs_name() if self._is_kwd_fn(fn) else None
+        return None
+
+    def process(self, events: set[tuple[int, int, int, tuple[str, ...]]]) -> None:
+        if self.reached is not None:
+            self.reached.update(self._tokens[callee] for _, _, callee, _ in events)
+        events -= self._seen
+        self._seen.update(events)
+        for caller, line, callee, keys in events:
+            self._resolve(caller, line, callee, keys)
+
+    def resolve_events(self, events: Iterable[tuple[Position | None, int, Position,
+                                                    tuple[str, ...]]]) -> None:
+        """
+        Resolve events given by the positions of the caller (None if unknown)
+        and callee functions, instead of code objects.
+        """
+        by_id = set()
+        for caller_pos, line, callee_pos, keys in events:
+            callee = self._register_pos(callee_pos)
+            if callee == _FOREIGN:
+                continue
+            caller = self._register_pos(caller_pos) if caller_pos is not None else _FOREIGN
+            by_id.add((caller, line, callee, tuple(keys)))
+        self.process(by_id)
+
+    def forget_resolved(self) -> None:
+        """
+        Resolve events again even if they were seen before, eg when kwd_db is
+        replaced to collect the keys of a single test.
+        """
+        self._seen.clear()
+
+    def _resolve(self, caller: int, line: int, callee: int, keys: tuple[str, ...]) -> None:
+        child_fn = self._tokens[callee]
+        par_fn = self._tokens[caller] if caller != _FOREIGN else None
+        if child_fn not in self.saturated:
+            for key in keys:
+                self.kwd_db.append_possibility(child_fn, key, source=par_fn)
+        if par_fn is None or (par_fn in self.saturated and child_fn in self.saturated):
+            return
+        par_has_kw = self._is_kwd_fn(par_fn)
+        child_has_kw = self._kw_names[callee] is not None
+        if not par_has_kw and not child_has_kw:
+            return
+        # The caller's line may be a continuation line of a multi-line statement
+        for site in self._matching_calls(call_sites_at(par_fn, line), par_fn, child_fn, callee):
+            if self.stats is not None:
+                self.stats.calls_resolved += 1
+            kwds = find_keyword_params(par_fn, child_fn, site, par_has_kw, child_has_kw)
+            for kwd in kwds:
+                if kwd.kind == KeywordValKind.PARENT:
+                    self.kwd_db.append_possibility(par_fn, kwd.name, source=child_fn)
+                else:
+                    self.kwd_db.append_possibility(child_fn, kwd.name, source=par_fn)
+
+    def _matching_calls(self, sites: tuple[CallSite, ...], par_fn: Function,
+                        child_fn: Function, callee: int) -> list[CallSite]:
+        calls = [c for c in sites if c not in self.static_calls]
+        names = {child_fn.name}
+        if child_fn.name == '__init__' and isinstance(child_fn.parent, Class):
+            names.add(child_fn.parent.name)
+        matching = [c for c in calls if c.name in names]
+        if not matching and len(calls) == 1 and self._may_call(calls[0], par_fn, callee):
+            return calls
+        return matching
+
+    def _may_call(self, site: CallSite, par_fn: Function, callee: int) -> bool:
+        """
+        Whether site, which doesn't call the callee by its name, may call it
+        anyway: it calls a name which isn't bound to another function in the
+        globals of par_fn's module or the builtins, eg, the function wrapped
+        by a decorator. C functions calling back into the callee (eg,
+        sorted(items, key=callee)) are not its caller.
+        """
+        if site.parts is None or len(site.parts) != 1:
+            return False
+        value = self._module_globals(par_fn).get(site.name, _UNBOUND)
+        if value is _UNBOUND:
+            value = vars(builtins).get(site.name, _UNBOUND)
+        if value is _UNBOUND:
+            return True
+        code = getattr(value, '__code__', None)
+        return code is not None and self._code_ids.get(code, callee) == callee
+
+    def _module_globals(self, fn: Function) -> dict[str, Any]:
+        mod = fn.parent
+        while mod is not None and not isinstance(mod, Module):
+            mod = mod.parent
+        if mod is None:
+            return {}
+        loaded = sys.modules.get(str(mod.full_path()))
+        return vars(loaded) if loaded is not None else {}
@@ -0,0 +1,145 @@
+"""
+Test impact selection: which indexed functions each test reached, and the
+keys it found, persisted between runs. A later run only needs to trace the
+tests which reached a function whose source changed, or whose own source
+changed, the keys of the other tests are replayed from the stored map.
+"""
+from pathlib import PurePath
+from typing import Callable, Iterable
+import hashlib
+import inspect
+import json
+import logging as lg
+from .cache import FileCache
+from .db import KeywordDb, ObjectDb
+from . import Function
+
+
+IMPACT_VERSION = 2
+
+
+def impact_path(rst_path: PurePath) -> PurePath:
+    """
+    Where the impact map of a run is kept, next to its results
+    """
+    return rst_path.with_suffix('.impact.json')
+
+
+def functions_by_path(db: ObjectDb) -> dict[str, Function]:
+    return {str(ob.full_path()): ob for ob in db.values() if isinstance(ob, Function)}
+
+
+def hash_of_test(test_fn: Callable) -> str:
+    """
+    Hash of the source of a test function, empty if it can't be read. Tests
+    usually aren't in the project, so they have no Function to hash.
+    """
+    try:
+        source = inspect.getsource(test_fn)
+    except (OSError, TypeError):
+        return ''
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+class ImpactMap:
+    # test id => full paths of the functions reached
+    reached: dict[str, list[str]]
+    # test id => (function full path, key) found while tracing the test
+    keys: dict[str, list[tuple[str, str]]]
+    # function full path => source hash, when the map was saved
+    hashes: dict[str, str]
+    # test id => source hash of the test function, when it was traced
+    test_hashes: dict[str, str]
+
+    def __init__(self) -> None:
+        self.reached = {}
+        self.keys = {}
+        self.hashes = {}
+        self.test_hashes = {}
+
+    @staticmethod
+    def load(path: PurePath) -> "ImpactMap":
+        impact = ImpactMap()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return impact
+        except (OSError, ValueError) as e:
+            lg.warning('Ignoring unreadable impact map %s: %s', path, e)
+            return impact
+        if data.get('version') != IMPACT_VERSION:
+            return impact
+        impact.hashes = data['hashes']
+        for test_id, rec in data['tests'].items():
+            impact.reached[test_id] = rec['reached']
+            impact.keys[test_id] = [tuple(k) for k in rec['keys']]
+            impact.test_hashes[test_id] = rec['hash']
+        return impact
+
+    def save(self, path: PurePath) -> None:
+        tests = {test_id: {'reached': self.reached[test_id],
+                           'keys': [list(k) for k in self.keys.get(test_id, [])],
+                           'hash': self.test_hashes.get(test_id, '')}
+                 for test_id in sorted(self.reached)}
+        with open(path, 'w') as f:
+            json.dump({'version': IMPACT_VERSION, 'hashes': self.hashes, 'tests': tests}, f)
+
+    def record(self, test_id: str, reached: Iterable[Function], kwd_db: KeywordDb,
+               source_hash: str = '') -> None:
+        """
+        Record a traced test, kwd_db holding only the keys found by it, and
+        source_hash the hash_of_test of its function.
+        """
+        self.test_hashes[test_id] = source_hash
+        self.reached[test_id] = sorted({str(fn.full_path()) for fn in reached})
+        self.keys[test_id] = [(str(fn.full_path()), key)
+                              for fn, kwds in kwd_db.items() for key in kwds]
+
+    def carry(self, test_id: str, old: "ImpactMap") -> None:
+        """
+        Keep the record of a test which wasn't traced in this run.
+        """
+        self.reached[test_id] = old.reached[test_id]
+        self.keys[test_id] = old.keys.get(test_id, [])
+        self.test_hashes[test_id] = old.test_hashes.get(test_id, '')
+
+    def changed_functions(self, fns: dict[str, Function], file_cache: FileCache) -> set[str]:
+        """
+        The functions reached by recorded tests which were changed or removed
+        since the map was saved.
+        """
+        changed = set()
+        for path, old_hash in self.hashes.items():
+            fn = fns.get(path)
+            if fn is None or file_cache.object_hash(fn) != old_hash:
+                changed.add(path)
+        return changed
+
+    def is_affected(self, test_id: str, changed: set[str], source_hash: str = '') -> bool:
+        """
+        Whether the test reached a changed function, or its own source changed
+        (eg, to pass new keys), source_hash being its hash_of_test now.
+        """
+        if test_id not in self.reached:
+            # Never recorded, so nothing is known about it
+            return True
+        if self.test_hashes.get(test_id, '') != source_hash:
+            return True
+        return not changed.isdisjoint(self.reached[test_id])
+
+    def replay(self, test_id: str, fns: dict[str, Function], kwd_db: KeywordDb) -> None:
+        """
+        Add the keys stored for test_id to kwd_db.
+        """
+        for path, key in self.keys.get(test_id, []):
+            fn = fns.get(path)
+            if fn is not None:
+                kwd_db.append_possibility(fn, key)
+
+    def update_hashes(self, fns: dict[str, Function], file_cache: FileCache) -> None:
+        self.hashes = {}
+        for reached in self.reached.values():
+            for path in reached:
+                if path not in self.hashes and path in fns:
+                    self.hashes[path] = file_cache.object_hash(fns[path])
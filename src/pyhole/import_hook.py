@@ -6,6 +6,7 @@ import logging as lg
 import _frozen_importlib  # type: ignore[import]
 import _frozen_importlib_external  # type: ignore[import]
 from .project import IncrementalProject
+from .instrument import ProbeRecorder, instrumented_code
 
 
 class PyholeMetaPathFinder(abc.MetaPathFinder):
@@ -13,11 +14,22 @@ class PyholeMetaPathFinder(abc.MetaPathFinder):
     Custom meta path finder to add explore a project.
     Heavily inspired by https://github.com/google/atheris/blob/master/src/import_hook.py
     """
-    project: IncrementalProject
+    project: IncrementalProject | None
+    recorder: ProbeRecorder | None
+    packages: set[str] | None
 
-    def __init__(self, project: IncrementalProject) -> None:
+    def __init__(self, project: IncrementalProject | None,
+                 recorder: ProbeRecorder | None = None,
+                 packages: list[str] | None = None) -> None:
+        """
+        Modules found are added to project, if any. If recorder is given, the
+        modules it wants are instrumented to report to it. packages restricts
+        both to the given top-level packages.
+        """
         super().__init__()
         self.project = project
+        self.recorder = recorder
+        self.packages = set(packages) if packages is not None else None
 
     def find_spec(
         self,
@@ -26,59 +38,98 @@ class PyholeMetaPathFinder(abc.MetaPathFinder):
         target: Optional[types.ModuleType] = None
     ) -> Optional[machinery.ModuleSpec]:
         """
-        Currently, this doesn't actually "find" a spec.
-        Rather, it just bootstraps onto another loader to add
-        stuff into the project.
+        This bootstraps onto the other finders to add stuff into the project.
+        It returns the spec found by the first of the later finders which
+        finds one, as the import system would, so that each import searches
+        the path once. Modules which are to be instrumented get an
+        instrumenting loader.
         """
         package_name = fullname.split(".")[0]
 
         if package_name == "pyhole":
             return None
+        if self.packages is not None and package_name not in self.packages:
+            return None
 
-        found_pyhole = False
-        for meta in sys.meta_path:
-            if not found_pyhole:
-                if meta is self:
-                    found_pyhole = True
-                continue
-
+        try:
+            later = sys.meta_path[sys.meta_path.index(self) + 1:]
+        except ValueError:
+            return None
+        for meta in later:
             if not hasattr(meta, 'find_spec'):
-                continue
+                # Legacy finder, leave the search to the import system
+                return None
 
             spec = meta.find_spec(fullname, path, target)
-            if spec is None or spec.loader is None:
+            if spec is None:
                 continue
-
-            if hasattr(spec.loader, 'path'):
-                lg.debug("Importing path: %s (%s)", spec.loader.path, fullname)
+            if spec.loader is None or not hasattr(spec.loader, 'path'):
+                # Namespace packages, and loaders not backed by a file
+                return spec
+
+            lg.debug("Importing path: %s (%s)", spec.loader.path, fullname)
+            is_source = type(spec.loader) is _frozen_importlib_external.SourceFileLoader
+            recorder = None
+            if self.recorder is not None and self.recorder.wants(spec.loader.path):
+                if is_source:
+                    recorder = self.recorder
+                else:
+                    lg.warning('Not instrumenting %s, unknown loader of type %s',
+                               fullname, type(spec.loader))
+
+            if self.project is not None and (not is_source or recorder is not None):
+                # The code of instrumented modules isn't what their source compiles to
                 self.project.add_file(spec.loader.path, fullname)
-            else:
-                lg.warning('Loader returned for %s has no path', fullname)
-
-            # if isinstance(spec.loader, _frozen_importlib_external.SourceFileLoader):
-            #     spec.loader = PyholeSourceFileLoader(
-            #         spec.loader.name, spec.loader.path)
-            #     return spec
-            # else:
-            #     lg.warn('Unknown loader of type %s', str(type(spec.loader)))
+            if is_source and (recorder is not None or self.project is not None):
+                # The project is populated from the code the loader compiles
+                spec.loader = PyholeSourceFileLoader(
+                    spec.loader.name, spec.loader.path, recorder,
+                    self.project if recorder is None else None)
 
-            return None
+            return spec
+        return None
 
 
 class PyholeSourceFileLoader(_frozen_importlib_external.SourceFileLoader):
-    def __init__(self, name: str, path: str) -> None:
+    recorder: ProbeRecorder | None
+    project: IncrementalProject | None
+
+    def __init__(self, name: str, path: str, recorder: ProbeRecorder | None = None,
+                 project: IncrementalProject | None = None) -> None:
+        """
+        Modules are instrumented to report to recorder if given, and added
+        to project (from their code object) if given.
+        """
         super().__init__(name, path)
+        self.recorder = recorder
+        self.project = project
+
+    def get_code(self, fullname: str) -> types.CodeType:
+        if self.recorder is not None:
+            return instrumented_code(self.path)
+        code = super().get_code(fullname)
+        if self.project is not None:
+            self.project.add_code(code, self.path, fullname)
+        return code
 
     def exec_module(self, module):
         lg.debug("Source file loader loading: %s", self.path)
+        if self.recorder is not None:
+            self.recorder.install(module.__dict__)
         super().exec_module(module)
 
 
 class HookManager:
-    project: IncrementalProject
+    project: IncrementalProject | None
+    recorder: ProbeRecorder | None
+    packages: list[str] | None
 
-    def __init__(self, project: IncrementalProject) -> None:
+    def __init__(self, project: IncrementalProject | None,
+                 recorder: ProbeRecorder | None = None,
+                 packages: list[str] | None = None) -> None:
         self.project = project
+        self.recorder = recorder
+        self.packages = packages
 
     def __enter__(self) -> "HookManager":
         i = 0
@@ -93,7 +144,8 @@ class HookManager:
         ]:
             i += 1
 
-        sys.meta_path.insert(i, PyholeMetaPathFinder(self.project))
+        sys.meta_path.insert(i, PyholeMetaPathFinder(
+            self.project, self.recorder, self.packages))
 
         return self
 
@@ -108,3 +160,11 @@ class HookManager:
 
 def populate_db(project: IncrementalProject):
     return HookManager(project)
+
+
+def instrument_modules(recorder: ProbeRecorder, packages: list[str] | None = None):
+    """
+    Instrument modules imported inside the with block to report **kwargs
+    keys to recorder, instead of tracing them.
+    """
+    return HookManager(None, recorder, packages)
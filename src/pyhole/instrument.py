@@ -0,0 +1,248 @@
+"""
+Import-time instrumentation of **kwargs call sites, an alternative to tracing.
+
+Modules are rewritten as they are imported so that:
+
+- every function with **kwargs reports the keys it was called with,
+  through __pyhole_enter__(site, kwargs) at the start of its body, and
+- every call site which may produce keys (one with explicit keyword
+  arguments, or one forwarding the enclosing function's **kwargs) reports
+  its callee, by rewriting f(...) to __pyhole_probe__(site, f)(...).
+
+Sites are constant tuples baked into the code, so a probe costs one call and a
+set lookup once the (site, callee) pair has been seen. The instrumented
+bytecode is cached in __pycache__ next to the regular bytecode.
+"""
+from types import CodeType
+from typing import Any
+from importlib.util import MAGIC_NUMBER, cache_from_source
+import ast
+import marshal
+import os
+import sys
+import logging as lg
+from .db import KeywordDb, ObjectDb, Position
+from .keyword import (FunctionKind, KeywordValKind, find_keyword_params,
+                      resolve_function, stmt_call_expressions, forwards_kwargs)
+from .object import extract_statements_from_body, function_calls
+from . import Function
+
+
+PROBE_NAME = '__pyhole_probe__'
+ENTER_NAME = '__pyhole_enter__'
+# Bump when the rewriting changes, to invalidate cached bytecode
+INSTRUMENT_VERSION = 1
+CACHE_OPT = 'pyhole'
+
+
+class KwargsCallRewriter(ast.NodeTransformer):
+    path: str
+    targets: dict[int, tuple]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # id of ast.Call to rewrite => site
+        self.targets = {}
+
+    def _collect_targets(self, node: ast.FunctionDef) -> None:
+        kw_name = node.args.kwarg.arg if node.args.kwarg else None
+        stmts = extract_statements_from_body(node.body)
+        for lineno, stmt in stmts.items():
+            for call_expr in stmt_call_expressions(stmt):
+                has_kwds = any(kwd.arg for kwd in call_expr.keywords)
+                if has_kwds or (kw_name and forwards_kwargs(call_expr, kw_name)):
+                    site = (self.path, node.lineno, lineno,
+                            call_expr.lineno, call_expr.col_offset)
+                    self.targets[id(call_expr)] = site
+
+    def _enter_stmt(self, node: ast.FunctionDef) -> ast.stmt:
+        site = (self.path, node.lineno)
+        call = ast.Call(func=ast.Name(ENTER_NAME, ast.Load()),
+                        args=[ast.Constant(site), ast.Name(node.args.kwarg.arg, ast.Load())],
+                        keywords=[])
+        first = node.body[0]
+        return ast.copy_location(ast.Expr(call), first)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> Any:
+        self._collect_targets(node)
+        self.generic_visit(node)
+        if node.args.kwarg:
+            body = node.body
+            has_doc = isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str)
+            idx = 1 if has_doc else 0
+            body.insert(idx, self._enter_stmt(node))
+        return node
+
+    def visit_Call(self, node: ast.Call) -> Any:
+        site = self.targets.get(id(node))
+        self.generic_visit(node)
+        if site is None:
+            return node
+        probe = ast.Call(func=ast.Name(PROBE_NAME, ast.Load()),
+                         args=[ast.Constant(site), node.func],
+                         keywords=[])
+        node.func = ast.copy_location(probe, node.func)
+        return node
+
+
+def instrument_source(source: str | bytes, path: str) -> ast.Module:
+    tree = ast.parse(source, path)
+    tree = KwargsCallRewriter(path).visit(tree)
+    return ast.fix_missing_locations(tree)
+
+
+class ProbeRecorder:
+    """
+    Receives the reports of instrumented code, and turns them into keys in a
+    KeywordDb, using the same analysis as CallTracer.
+    """
+
+    dbs: list[ObjectDb]
+    kw_fns: list[ObjectDb]
+    kwd_db: KeywordDb
+    files: set[str] | None
+
+    def __init__(self, dbs: ObjectDb | list[ObjectDb],
+                 kw_fns: ObjectDb | list[ObjectDb],
+                 kwd_db: KeywordDb,
+                 files: set[str] | None = None) -> None:
+        """
+        files restricts instrumentation to the given source files, all files
+        are instrumented if it is None.
+        """
+        self.dbs = dbs if isinstance(dbs, list) else [dbs]
+        self.kw_fns = kw_fns if isinstance(kw_fns, list) else [kw_fns]
+        self.kwd_db = kwd_db
+        self.files = files
+        self._seen_calls: set[tuple] = set()
+        self._seen_keys: dict[tuple, set[str]] = {}
+
+    def wants(self, path: str) -> bool:
+        return self.files is None or path in self.files
+
+    def _lookup(self, pos: Position) -> Function | None:
+        for db in self.dbs:
+            if pos in db:
+                ob = db[pos]
+                if isinstance(ob, Function):
+                    return ob
+        return None
+
+    def _is_kwd_fn(self, fn: Function) -> bool:
+        return any(map(lambda dt: dt.has_ob(fn), self.kw_fns))
+
+    def enter(self, site: tuple, kwargs: dict[str, Any]) -> None:
+        seen = self._seen_keys.get(site)
+        if seen is None:
+            seen = self._seen_keys[site] = set()
+        new_keys = [key for key in kwargs if key not in seen]
+        if not new_keys:
+            return
+        seen.update(new_keys)
+        fn = self._lookup(Position(*site))
+        if fn is None:
+            return
+        for key in new_keys:
+            self.kwd_db.append_possibility(fn, key)
+
+    def probe(self, site: tuple, fn: Any) -> Any:
+        key = (site, getattr(fn, '__func__', fn))
+        try:
+            if key in self._seen_calls:
+                return fn
+            self._seen_calls.add(key)
+        except TypeError:
+            # Unhashable callable, resolve it every time
+            pass
+        try:
+            self._resolve(site, fn)
+        except Exception as e:
+            lg.error('Failed to resolve call at %s: %s', site, e)
+        return fn
+
+    def _resolve(self, site: tuple, fn: Any) -> None:
+        path, def_line, stmt_line, call_line, call_col = site
+        caller = self._lookup(Position(path, def_line))
+        if caller is None:
+            return
+        call_site = None
+        for site in function_calls(caller)[0].get(stmt_line, ()):
+            if site.line == call_line and site.col == call_col:
+                call_site = site
+                break
+        if call_site is None:
+            return
+        called_fn, kind = resolve_function(fn, FunctionKind.GLOB)
+        if called_fn is None or kind == FunctionKind.BUILTIN or not hasattr(called_fn, '__code__'):
+            return
+        code = called_fn.__code__
+        callee = self._lookup(Position(code.co_filename, code.co_firstlineno))
+        if callee is None:
+            return
+        kwds = find_keyword_params(caller, callee, call_site,
+                                   self._is_kwd_fn(caller), self._is_kwd_fn(callee))
+        for kwd in kwds:
+            if kwd.kind == KeywordValKind.PARENT:
+                self.kwd_db.append_possibility(caller, kwd.name, source=callee)
+            else:
+                self.kwd_db.append_possibility(callee, kwd.name, source=caller)
+
+    def install(self, module_dict: dict[str, Any]) -> None:
+        module_dict[PROBE_NAME] = self.probe
+        module_dict[ENTER_NAME] = self.enter
+
+
+def _cache_header(source_mtime: int, source_size: int) -> bytes:
+    return (MAGIC_NUMBER
+            + INSTRUMENT_VERSION.to_bytes(4, 'little')
+            + (source_mtime & 0xFFFFFFFF).to_bytes(4, 'little')
+            + (source_size & 0xFFFFFFFF).to_bytes(4, 'little'))
+
+
+def load_cached_code(path: str, source_mtime: int, source_size: int) -> CodeType | None:
+    try:
+        with open(cache_from_source(path, optimization=CACHE_OPT), 'rb') as f:
+            data = f.read()
+    except (OSError, NotImplementedError):
+        return None
+    header = _cache_header(source_mtime, source_size)
+    if data[:len(header)] != header:
+        return None
+    try:
+        code = marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+    return code if isinstance(code, CodeType) else None
+
+
+def store_cached_code(path: str, source_mtime: int, source_size: int, code: CodeType) -> None:
+    if sys.dont_write_bytecode:
+        return
+    try:
+        cache_path = cache_from_source(path, optimization=CACHE_OPT)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_cache_header(source_mtime, source_size))
+            f.write(marshal.dumps(code))
+        os.replace(tmp_path, cache_path)
+    except (OSError, NotImplementedError) as e:
+        lg.debug('Could not cache instrumented code of %s: %s', path, e)
+
+
+def instrumented_code(path: str) -> CodeType:
+    """
+    Instrumented code object of the module at path, from the cache if it is
+    still valid.
+    """
+    st = os.stat(path)
+    mtime, size = int(st.st_mtime), st.st_size
+    code = load_cached_code(path, mtime, size)
+    if code is not None:
+        return code
+    with open(path, 'rb') as f:
+        source = f.read()
+    code = compile(instrument_source(source, path), path, 'exec', dont_inherit=True)
+    store_cached_code(path, mtime, size, code)
+    return code
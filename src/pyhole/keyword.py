@@ -5,10 +5,13 @@ from .tracer import Tracer
 from .db import KeywordDb, ObjectDb, Position
 from .cache import FileCache
 from . import FormalParamKind, Function, Object
+from .object import CallSite, function_calls
 import ast
 from termcolor import colored
 import logging as lg
-from types import FrameType, FunctionType, MethodType
+from types import CodeType, FrameType, FunctionType, MethodType
+from functools import lru_cache
+import inspect
 import enum
 
 
@@ -258,6 +261,69 @@ class SymbolTable:
         return f'locals = {self.loc.keys()}\nglobals = {self.glob.keys()}\nbuiltins = {self.builtins.keys()}'
 
 
+@lru_cache(maxsize=4096)
+def _code_local_names(code: CodeType) -> frozenset[str]:
+    return frozenset(code.co_varnames + code.co_cellvars + code.co_freevars)
+
+
+class FrameSymbolTable(SymbolTable):
+    """
+    Symbol table of a frame which looks up names lazily. Accessing
+    frame.f_locals copies all the fast locals of the frame into a dict, so it
+    is only done when the name looked up is a local of the frame's code.
+    Global and builtin lookups go straight to the frame's dicts. Lookups are
+    memoized for the lifetime of the table, which is a single trace event.
+    """
+
+    frame: FrameType
+
+    def __init__(self, frame: FrameType):
+        self.frame = frame
+        self._loc = None
+        self._seen = {}
+        code = frame.f_code
+        if code.co_flags & inspect.CO_OPTIMIZED:
+            self._local_names = _code_local_names(code)
+        else:
+            # Module and class bodies keep their locals in a real dict
+            self._local_names = None
+
+    @property
+    def loc(self) -> dict[str, Any]:
+        if self._loc is None:
+            self._loc = self.frame.f_locals
+        return self._loc
+
+    @property
+    def glob(self) -> dict[str, Any]:
+        return self.frame.f_globals
+
+    @property
+    def builtins(self) -> dict[str, Any]:
+        return self.frame.f_builtins
+
+    def lookup(self, name: str) -> Tuple[Any, SymbolKind]:
+        if name in self._seen:
+            return self._seen[name]
+        if self._local_names is None or name in self._local_names:
+            loc = self.loc
+            if name in loc:
+                res = loc[name], SymbolKind.LOC
+                self._seen[name] = res
+                return res
+        glob = self.frame.f_globals
+        if name in glob:
+            res = glob[name], SymbolKind.GLOB
+        else:
+            builtins = self.frame.f_builtins
+            if name in builtins:
+                res = builtins[name], SymbolKind.BUILTIN
+            else:
+                res = None, SymbolKind.NOT_FOUND
+        self._seen[name] = res
+        return res
+
+
 def lookup_fn(ob: Any, names: list[str]) -> Any:
     # Fixme: This check should never be needed
     # But for expressions such as "foo.bar() if not foo else None",
@@ -298,6 +364,28 @@ def find_called_fn(expr: ast.Expression, sym_tab: SymbolTable) -> Tuple[Any, Fun
     return None, FunctionKind.NOT_FOUND
 
 
+def find_site_fn(site: CallSite, sym_tab: SymbolTable) -> Tuple[Any, FunctionKind]:
+    """
+    Like find_called_fn, for the callee of a CallSite.
+    """
+    if site.parts is None:
+        # An Attribute of something else than a Name, or another expression
+        return None, FunctionKind.UNKNOWN if site.name is not None else FunctionKind.NOT_FOUND
+    name = site.parts[0]
+    base, kind = sym_tab.lookup(name)
+    if len(site.parts) == 1:
+        if not base:
+            lg.error("%s for Name not found in loc or glob", name)
+        return base, kind.to_function_type()
+    if base is None:
+        lg.error("%s for Attribute not found in symbol table %s", name, list(site.parts))
+        return None, FunctionKind.NOT_FOUND
+    fn = lookup_fn(base, list(site.parts[1:]))
+    if fn is None:
+        return None, FunctionKind.UNKNOWN
+    return fn, kind.to_function_type()
+
+
 def resolve_function(fn, kind):
     if fn is None:
         return None, kind
@@ -340,6 +428,156 @@ class KeywordVal:
         return f"{self.name} ({self.kind})"
 
 
+def find_keyword_params(par_fn: Function,
+                        child_fn: Function,
+                        site: CallSite,
+                        par_has_kw: bool,
+                        child_has_kw: bool) -> list[KeywordVal]:
+    """
+    Find the keys passed through **kwargs when par_fn calls child_fn
+    through the call at site. Keys of par_fn's **kwargs are PARENT values,
+    keys of child_fn's **kwargs are CHILD values.
+    """
+    res: list[KeywordVal] = []
+
+    params = child_fn.get_formal_params()
+    posonly_params = list(
+        filter(lambda p: p.kind == FormalParamKind.POSONLY, params))
+    norm_params = list(
+        filter(lambda p: p.kind == FormalParamKind.NORMAL and p.name != "self", params))
+    kwonly_params = list(
+        filter(lambda p: p.kind == FormalParamKind.KWONLY, params))
+
+    # Figure out child kw
+    if child_has_kw:
+        param_names = list(
+            map(lambda p: p.name, norm_params + kwonly_params))
+        for name in site.keywords:
+            if name not in param_names:
+                res.append(KeywordVal(KeywordValKind.CHILD, name))
+            # TODO: Extract information from the fun(**args) case.
+
+    # Figure out par kw
+    if par_has_kw:
+        par_kw_name = par_fn.get_kwargs_name()
+
+        if site.forwards(par_kw_name):
+            kwds_covered = site.keywords
+
+            if not site.star_args:
+                pos_covered_cnt = site.arg_cnt
+            else:
+                pos_covered_cnt = len(posonly_params) + len(norm_params)
+
+            # First remove all positional params
+            norm_params_covered = max(0, min(
+                len(norm_params), pos_covered_cnt - len(posonly_params)))
+            # Then remove all normal params with default values or is in kwds_covered
+            # TODO: Strict mode for required keyword arguments
+            norm_params_left = list(
+                filter(lambda p: p.name not in kwds_covered,
+                       norm_params[norm_params_covered:]))
+            # Find kwonly args that have not been covered
+            kwonly_params_left = list(
+                filter(lambda p: p.name not in kwds_covered, kwonly_params))
+
+            # That all must be accounted for by **kwargs
+            for param in chain(norm_params_left, kwonly_params_left):
+                res.append(KeywordVal(KeywordValKind.PARENT, param.name))
+
+    return res
+
+
+def callee_name(call_expr: ast.Call) -> str | None:
+    match call_expr.func:
+        case ast.Name(id=name):
+            return name
+        case ast.Attribute(attr=attr):
+            return attr
+    return None
+
+
+def forwards_kwargs(call_expr: ast.Call, kw_name: str) -> bool:
+    for kwd in call_expr.keywords:
+        if not kwd.arg and isinstance(kwd.value, ast.Name) and kwd.value.id == kw_name:
+            return True
+    return False
+
+
+class LinePlan:
+    """
+    The lines of each function which CallTracer needs to look at. A line is
+    interesting only if it has a call which can produce keys: either a call
+    forwarding the function's own **kwargs, or a call with explicit keyword
+    arguments to something which may be a **kwargs function (going by the
+    names such functions can be called by). Every other line is ignored.
+    """
+
+    kw_fns: list[ObjectDb]
+    kw_names: set[str] | None
+    static_calls: set[CallSite]
+    lines: dict[Function, frozenset[int]]
+
+    def __init__(self, kw_fns: ObjectDb | list[ObjectDb],
+                 static_calls: set[CallSite] | None = None) -> None:
+        self.kw_fns = kw_fns if isinstance(kw_fns, list) else [kw_fns]
+        self.static_calls = static_calls if static_calls is not None else set()
+        self.lines = {}
+        self.kw_names = set()
+        for kw_db in self.kw_fns:
+            if kw_db.index_file is not None:
+                # Functions indexed later may take **kwargs under any name
+                self.kw_names = None
+                break
+            for fn in kw_db.values():
+                if fn.name == '__call__':
+                    # Any callable object could be an instance of this class
+                    self.kw_names = None
+                    break
+                self.kw_names.add(fn.name)
+                if fn.name == '__init__' and fn.parent is not None:
+                    self.kw_names.add(fn.parent.name)
+            if self.kw_names is None:
+                break
+
+    def _is_kwd_fn(self, fn: Function) -> bool:
+        return any(map(lambda dt: dt.has_ob(fn), self.kw_fns))
+
+    def _may_call_kwd_fn(self, site: CallSite) -> bool:
+        if not site.keywords:
+            return False
+        if self.kw_names is None:
+            return True
+        return site.name in self.kw_names
+
+    def _compute(self, fn: Function) -> frozenset[int]:
+        kw_name = fn.get_kwargs_name() if self._is_kwd_fn(fn) else None
+        lines = set()
+        for lineno, sites in function_calls(fn)[0].items():
+            for site in sites:
+                if site in self.static_calls:
+                    continue
+                if (kw_name and site.forwards(kw_name)) or self._may_call_kwd_fn(site):
+                    lines.add(lineno)
+                    break
+        return frozenset(lines)
+
+    def lines_of(self, fn: Function) -> frozenset[int]:
+        if fn not in self.lines:
+            self.lines[fn] = self._compute(fn)
+        return self.lines[fn]
+
+    def precompute(self, dbs: ObjectDb | list[ObjectDb]) -> "LinePlan":
+        for db in dbs if isinstance(dbs, list) else [dbs]:
+            for ob in db.values():
+                if isinstance(ob, Function):
+                    self.lines_of(ob)
+        return self
+
+
+_NO_LINES: frozenset[int] = frozenset()
+
+
 def _enc_ob_pos(frame: FrameType) -> Position:
     filename = frame.f_code.co_filename
     lineno = frame.f_code.co_firstlineno
@@ -350,11 +588,20 @@ class CallTracer(Tracer):
     dbs: list[ObjectDb]
     kw_fns: list[ObjectDb]
     kwd_db: KeywordDb
+    static_calls: set[CallSite]
 
     def __init__(self, dbs: ObjectDb | list[ObjectDb],
                  kw_fns: ObjectDb | list[ObjectDb],
-                 kwd_db: KeywordDb) -> None:
-        super().__init__()
+                 kwd_db: KeywordDb,
+                 collect_stats: bool = False,
+                 static_calls: set[CallSite] | None = None,
+                 line_plan: LinePlan | None = None) -> None:
+        """
+        static_calls are the call sites already resolved by a static pass
+        (see pyhole.static), which are skipped while tracing. line_plan is
+        computed lazily if not given (see Project.line_plan).
+        """
+        super().__init__(collect_stats)
         if not isinstance(dbs, list):
             self.dbs = [dbs]
         else:
@@ -364,6 +611,15 @@ class CallTracer(Tracer):
         else:
             self.kw_fns = kw_fns
         self.kwd_db = kwd_db
+        self.static_calls = static_calls if static_calls is not None else set()
+        if line_plan is None:
+            line_plan = LinePlan(self.kw_fns, self.static_calls)
+        self.line_plan = line_plan
+        self._code_plans: dict[CodeType, tuple[Function | None, frozenset[int]]] = {}
+        # Indexed functions called while tracing, if set to a set (see pyhole.impact)
+        self.reached: set[Function] | None = None
+        # Functions whose keys are already known (see pyhole.results)
+        self.saturated: set[Function] = set()
 
     def _is_kwd_fn(self, fn: Function) -> bool:
         return any(map(lambda dt: dt.has_ob(fn), self.kw_fns))
@@ -385,87 +641,45 @@ class CallTracer(Tracer):
                     return ob
         return None
 
+    def _code_plan(self, frame: FrameType) -> tuple[Function | None, frozenset[int]]:
+        """
+        Enclosing function of the frame and its interesting lines, cached
+        by code object.
+        """
+        code = frame.f_code
+        plan = self._code_plans.get(code)
+        if plan is None:
+            enc_ob = self._enc_fn(frame)
+            lines = self.line_plan.lines_of(enc_ob) if enc_ob else _NO_LINES
+            plan = (enc_ob, lines)
+            self._code_plans[code] = plan
+        if self.stats is not None:
+            if plan[0] is None:
+                self.stats.enc_fn_misses += 1
+            else:
+                self.stats.enc_fn_hits += 1
+        return plan
+
     def _find_keyword_params(self,
                              par_fn: Function,
                              child_fn: Function,
-                             call_expr: ast.Call) -> list[KeywordVal]:
-        par_has_kw = self._is_kwd_fn(par_fn)
-        child_has_kw = self._is_kwd_fn(child_fn)
-
-        res: list[KeywordVal] = []
-
-        params = child_fn.get_formal_params()
-        posonly_params = list(
-            filter(lambda p: p.kind == FormalParamKind.POSONLY, params))
-        norm_params = list(
-            filter(lambda p: p.kind == FormalParamKind.NORMAL and p.name != "self", params))
-        kwonly_params = list(
-            filter(lambda p: p.kind == FormalParamKind.KWONLY, params))
-
-        # Figure out child kw
-        if child_has_kw:
-            kwds = call_expr.keywords
-            param_names = list(
-                filter(lambda p: p.name, norm_params + kwonly_params))
-            for kwd in kwds:
-                name = kwd.arg
-                if name and name not in param_names:
-                    res.append(KeywordVal(KeywordValKind.CHILD, name))
-                # TODO: Extract information from the fun(**args) case.
-
-        # Figure out par kw
-        if par_has_kw:
-            par_kw_name = par_fn.get_kwargs_name()
-            kwds = call_expr.keywords
-            args = call_expr.args
-
-            targ_kwd_found = False
-            star_pos_found = False
-            for kwd in kwds:
-                if not kwd.arg and isinstance(kwd.value, ast.Name) and kwd.value.id == par_kw_name:
-                    targ_kwd_found = True
-                    break
-            for arg in args:
-                if isinstance(arg, ast.Starred):
-                    star_pos_found = True
-                    break
-
-            if targ_kwd_found:
-                kwds_covered = list(map(lambda k: k.arg,
-                                        filter(lambda k: k.arg, kwds)))
-
-                if not star_pos_found:
-                    pos_covered_cnt = len(args)
-                else:
-                    pos_covered_cnt = len(posonly_params) + len(norm_params)
-
-                # First remove all positional params
-                norm_params_covered = max(0, min(
-                    len(norm_params), pos_covered_cnt - len(posonly_params)))
-                # Then remove all normal params with default values or is in kwds_covered
-                # TODO: Strict mode for required keyword arguments
-                norm_params_left = list(
-                    filter(lambda p: p.name not in kwds_covered,
-                           norm_params[norm_params_covered:]))
-                # Find kwonly args that have not been covered
-                kwonly_params_left = list(
-                    filter(lambda p: p.name not in kwds_covered, kwonly_params))
-
-                # That all must be accounted for by **kwargs
-                for param in chain(norm_params_left, kwonly_params_left):
-                    res.append(KeywordVal(KeywordValKind.PARENT, param.name))
-
-        return res
+                             site: CallSite) -> list[KeywordVal]:
+        return find_keyword_params(par_fn, child_fn, site,
+                                   self._is_kwd_fn(par_fn), self._is_kwd_fn(child_fn))
 
     def trace_call(self, frame: FrameType):
-        enc_ob = self._enc_fn(frame)
+        enc_ob, lines = self._code_plan(frame)
+        if not lines:
+            # Nothing to see in this frame on a line by line basis
+            frame.f_trace_lines = False
         if not enc_ob:
             return
         assert isinstance(enc_ob, Function)
-        if not self._is_kwd_fn(enc_ob):
+        if self.reached is not None:
+            self.reached.add(enc_ob)
+        if not self._is_kwd_fn(enc_ob) or enc_ob in self.saturated:
             return
-        sym_tab = SymbolTable(
-            frame.f_locals, frame.f_globals, frame.f_builtins)
+        sym_tab = FrameSymbolTable(frame)
         _, fn_kind = sym_tab.lookup(enc_ob.name)
         if fn_kind == SymbolKind.BUILTIN or fn_kind == SymbolKind.NOT_FOUND:
             return
@@ -473,37 +687,43 @@ class CallTracer(Tracer):
         kw_dict, kw_kind = sym_tab.lookup(kw_name)
         assert kw_kind == SymbolKind.LOC
         assert isinstance(kw_dict, dict)
+        caller = self._code_plan(frame.f_back)[0] if frame.f_back else None
         for key in kw_dict.keys():
-            self.kwd_db.append_possibility(enc_ob, key)
+            self.kwd_db.append_possibility(enc_ob, key, source=caller)
 
     def trace_line(self, frame: FrameType):
-        enc_ob = self._enc_fn(frame)
+        enc_ob, lines = self._code_plan(frame)
         ln = frame.f_lineno
-        if not enc_ob:
-            return
-        if ln not in enc_ob.stmts:
+        if ln not in lines:
             return
-        stmt = enc_ob.stmts[ln]
-        call_exprs = stmt_call_expressions(stmt)
-        if not call_exprs:
+        sites = function_calls(enc_ob)[0][ln]
+        if self.static_calls:
+            sites = [c for c in sites if c not in self.static_calls]
+        if not sites:
             return
-        sym_tab = SymbolTable(
-            frame.f_locals, frame.f_globals, frame.f_builtins)
-        for call_expr in call_exprs:
-            called_fn, kind = resolve_function(
-                *find_called_fn(call_expr.func, sym_tab))
+        sym_tab = FrameSymbolTable(frame)
+        for site in sites:
+            called_fn, kind = resolve_function(*find_site_fn(site, sym_tab))
             if called_fn is not None and kind != FunctionKind.BUILTIN:
                 fn_ob = self._lookup_fn(called_fn)
                 if fn_ob:
-                    lg.info("Parent: %s", enc_ob)
-                    lg.info("Child: %s", fn_ob)
-                    lg.info("Kwd args: %s",
-                            list(map(lambda arg: arg.arg, call_expr.keywords)))
-                    kwds = self._find_keyword_params(enc_ob, fn_ob, call_expr)
-                    lg.info("Kwds: [%s]", ', '.join(map(str, kwds)))
+                    if self.stats is not None:
+                        self.stats.calls_resolved += 1
+                    if enc_ob in self.saturated and fn_ob in self.saturated:
+                        continue
+                    kwds = self._find_keyword_params(enc_ob, fn_ob, site)
+                    if lg.getLogger().isEnabledFor(lg.INFO):
+                        lg.info("Parent: %s", enc_ob)
+                        lg.info("Child: %s", fn_ob)
+                        lg.info("Kwd args: %s", list(site.keywords))
+                        lg.info("Kwds: [%s]", ', '.join(map(str, kwds)))
                     for kwd in kwds:
-                        fn = enc_ob if kwd.kind == KeywordValKind.PARENT else fn_ob
-                        self.kwd_db.append_possibility(fn, kwd.name)
-            elif called_fn is None and kind != FunctionKind.UNKNOWN:
-                pos = get_position(frame)
-                lg.error("called_fn not found at %s", pos)
+                        if kwd.kind == KeywordValKind.PARENT:
+                            self.kwd_db.append_possibility(enc_ob, kwd.name, source=fn_ob)
+                        else:
+                            self.kwd_db.append_possibility(fn_ob, kwd.name, source=enc_ob)
+            elif called_fn is None:
+                if self.stats is not None:
+                    self.stats.find_fn_failures += 1
+                if kind != FunctionKind.UNKNOWN:
+                    lg.error("called_fn not found at %s", get_position(frame))
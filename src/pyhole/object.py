@@ -1,8 +1,10 @@
 import enum
 from pathlib import PurePath
 from typing import Any, Union
-from types import NoneType
+from types import CodeType, NoneType
 import ast
+import dis
+import inspect
 import termcolor
 
 
@@ -153,6 +155,9 @@ class AltObject(Object):
         self.alt_name = alt_name
         self.sub_ob = sub_ob
 
+    def ob_type(self) -> str:
+        return self.sub_ob.ob_type()
+
 
 class Module(Object):
     def __init__(
@@ -213,6 +218,104 @@ class FormalParam:
         return 'FormalParam{{name={}, has_default={}, kind={}}}'.format(self.name, self.has_default, self.kind)
 
 
+class Signature:
+    """
+    The parameter names of a function, and which have defaults, without its
+    ast.arguments.
+    """
+
+    __slots__ = ('posonly', 'args', 'kwonly', 'default_cnt', 'kw_defaults', 'vararg', 'kwarg')
+    posonly: tuple[str, ...]
+    args: tuple[str, ...]
+    kwonly: tuple[str, ...]
+    default_cnt: int
+    # Whether each kwonly parameter has a default
+    kw_defaults: tuple[bool, ...]
+    vararg: str | None
+    kwarg: str | None
+
+    def __init__(self, args: ast.arguments) -> None:
+        self.posonly = tuple(arg_names(args.posonlyargs))
+        self.args = tuple(arg_names(args.args))
+        self.kwonly = tuple(arg_names(args.kwonlyargs))
+        self.default_cnt = len(args.defaults)
+        self.kw_defaults = tuple(d is not None for d in args.kw_defaults)
+        self.vararg = args.vararg.arg if args.vararg else None
+        self.kwarg = args.kwarg.arg if args.kwarg else None
+
+
+def _attr_parts(expr: ast.Attribute) -> tuple[str, ...] | None:
+    parts = []
+    while isinstance(expr, ast.Attribute):
+        parts.append(expr.attr)
+        expr = expr.value
+    if not isinstance(expr, ast.Name):
+        return None
+    parts.append(expr.id)
+    return tuple(reversed(parts))
+
+
+class CallSite:
+    """
+    What the tracers need of a call expression, without its AST: the name it
+    calls (the id of a Name or the attr of an Attribute), the names of the
+    Attribute chain if it is one on a Name, the keyword arguments, the names
+    passed as **name, and the positional arguments.
+    """
+
+    __slots__ = ('line', 'col', 'name', 'parts', 'keywords', 'forwarded', 'arg_cnt', 'star_args')
+    line: int
+    col: int
+    name: str | None
+    parts: tuple[str, ...] | None
+    keywords: tuple[str, ...]
+    forwarded: tuple[str, ...]
+    arg_cnt: int
+    star_args: bool
+
+    def __init__(self, call: ast.Call) -> None:
+        self.line = call.lineno
+        self.col = call.col_offset
+        match call.func:
+            case ast.Name(id=name):
+                self.name = name
+                self.parts = (name,)
+            case ast.Attribute(attr=attr):
+                self.name = attr
+                self.parts = _attr_parts(call.func)
+            case _:
+                self.name = None
+                self.parts = None
+        self.keywords = tuple(kwd.arg for kwd in call.keywords if kwd.arg)
+        self.forwarded = tuple(kwd.value.id for kwd in call.keywords
+                               if not kwd.arg and isinstance(kwd.value, ast.Name))
+        self.arg_cnt = len(call.args)
+        self.star_args = any(isinstance(arg, ast.Starred) for arg in call.args)
+
+    def forwards(self, kw_name: str) -> bool:
+        return kw_name in self.forwarded
+
+    def __str__(self) -> str:
+        return f'call of {self.name} at {self.line}:{self.col}'
+
+
+def index_calls(stmts: dict[int, ast.stmt]) -> tuple[dict[int, tuple[CallSite, ...]], dict[int, int]]:
+    """
+    The call sites of each statement of stmts which has calls, and the end
+    line of every statement.
+    """
+    from .keyword import stmt_call_expressions
+
+    call_sites = {}
+    stmt_ends = {}
+    for lineno, stmt in stmts.items():
+        stmt_ends[lineno] = stmt.end_lineno or lineno
+        calls = stmt_call_expressions(stmt)
+        if calls:
+            call_sites[lineno] = tuple(map(CallSite, calls))
+    return call_sites, stmt_ends
+
+
 class Function(Object):
     args: ast.arguments
 
@@ -227,21 +330,59 @@ class Function(Object):
         super().__init__(source_span, name, parent)
         self.args = args
         self.stmts = stmts
+        self._signature: Signature | None = None
+        self._call_sites: dict[int, tuple[CallSite, ...]] | None = None
+        self._stmt_ends: dict[int, int] | None = None
+
+    @property
+    def signature(self) -> Signature:
+        if self._signature is None:
+            self._signature = Signature(self.args)
+        return self._signature
+
+    @property
+    def call_sites(self) -> dict[int, tuple[CallSite, ...]]:
+        """
+        Statement line => the calls in the statement, for statements with
+        calls.
+        """
+        if self._call_sites is None:
+            self._call_sites, self._stmt_ends = index_calls(self.stmts)
+        return self._call_sites
+
+    @property
+    def stmt_ends(self) -> dict[int, int]:
+        """
+        Statement line => end line of the statement
+        """
+        if self._stmt_ends is None:
+            self._call_sites, self._stmt_ends = index_calls(self.stmts)
+        return self._stmt_ends
 
     def has_kwargs_dict(self) -> bool:
-        return self.args.kwarg is not None
+        return self.signature.kwarg is not None
 
     def get_kwargs_name(self) -> str:
         if not self.has_kwargs_dict():
             raise RuntimeError(f"{self} has not keyword arguments")
-        return self.args.kwarg.arg
+        return self.signature.kwarg
+
+    def kwargs_key_accesses(self) -> list[str]:
+        """
+        Constant keys read from the **kwargs dict in the body, eg,
+        kwargs['x'], kwargs.get('x'), kwargs.pop('x') or 'x' in kwargs.
+        """
+        if not self.has_kwargs_dict():
+            return []
+        return _kwargs_key_accesses(self.get_kwargs_name(), self.stmts)
 
     def get_formal_params(self) -> list[FormalParam]:
-        posonly = arg_names(self.args.posonlyargs)
-        normal = arg_names(self.args.args)
-        kwonly = arg_names(self.args.kwonlyargs)
+        sig = self.signature
+        posonly = sig.posonly
+        normal = sig.args
+        kwonly = sig.kwonly
 
-        def_cnt = len(self.args.defaults)
+        def_cnt = sig.default_cnt
         norm_def_cnt = min(len(normal), def_cnt)
         posonly_def_cnt = min(len(posonly), def_cnt - norm_def_cnt)
 
@@ -252,9 +393,8 @@ class Function(Object):
         for i, arg in enumerate(normal):
             has_def = i >= (len(normal) - norm_def_cnt)
             params.append(FormalParam(arg, has_def, FormalParamKind.NORMAL))
-        for arg, def_val in zip(kwonly, self.args.kw_defaults):
-            params.append(FormalParam(
-                arg, def_val is not None, FormalParamKind.KWONLY))
+        for arg, has_def in zip(kwonly, sig.kw_defaults):
+            params.append(FormalParam(arg, has_def, FormalParamKind.KWONLY))
 
         return params
 
@@ -262,28 +402,26 @@ class Function(Object):
         return "func"
 
     def _format_args(self) -> str:
-        def make_arg_list(args_list):
-            return ", ".join(map(lambda x: x.arg, args_list))
-
-        args = make_arg_list(self.args.args)
-        posonly = make_arg_list(self.args.posonlyargs)
-        kwonly = make_arg_list(self.args.kwonlyargs)
+        sig = self.signature
+        args = ", ".join(sig.args)
+        posonly = ", ".join(sig.posonly)
+        kwonly = ", ".join(sig.kwonly)
 
         out = ""
         if len(posonly) > 0:
             out += posonly
             out += "/"
         out += args
-        if self.args.vararg:
+        if sig.vararg:
             if (len(out) > 0 and out[-1] != "/") or len(out) > 0:
                 out += ", "
-            out += "*{}".format(self.args.vararg.arg)
+            out += "*{}".format(sig.vararg)
             if len(kwonly) > 0:
                 out += ", {}".format(kwonly)
-        if self.args.kwarg:
+        if sig.kwarg:
             if (len(out) > 0 and out[-1] != "/") or len(out) > 0:
                 out += ", "
-            out += "**{}".format(self.args.kwarg.arg)
+            out += "**{}".format(sig.kwarg)
 
         return out
 
@@ -292,6 +430,199 @@ class Function(Object):
                                         self._format_args())
 
 
+# Call sites of the functions of the Rust indexer, which can't keep them
+# themselves, by id. The function is kept too, so that its id isn't reused.
+_foreign_calls: dict[int, tuple[object, dict[int, tuple[CallSite, ...]], dict[int, int]]] = {}
+
+
+def function_calls(fn: Function) -> tuple[dict[int, tuple[CallSite, ...]], dict[int, int]]:
+    """
+    fn.call_sites and fn.stmt_ends, also for the functions of the Rust
+    indexer, which only have stmts. Every lookup for a function returns the
+    same CallSites, which are compared by identity (eg, with static_calls).
+    """
+    if isinstance(fn, Function):
+        return fn.call_sites, fn.stmt_ends
+    cached = _foreign_calls.get(id(fn))
+    if cached is None:
+        cached = (fn, *index_calls(fn.stmts))
+        _foreign_calls[id(fn)] = cached
+    return cached[1], cached[2]
+
+
+def call_sites_at(fn: Function, line: int) -> tuple[CallSite, ...]:
+    """
+    The calls of the statement of fn at line, which may be a continuation
+    line of a multi-line statement.
+    """
+    call_sites, stmt_ends = function_calls(fn)
+    if line not in stmt_ends:
+        found = None
+        for lineno, end in stmt_ends.items():
+            if lineno <= line <= end and (found is None or lineno > found):
+                found = lineno
+        if found is None:
+            return ()
+        line = found
+    return call_sites.get(line, ())
+
+
+# The function definitions of the module parsed last, see ModuleSource
+_last_defs: tuple["ModuleSource", dict[int, ast.FunctionDef]] | None = None
+
+
+class ModuleSource:
+    """
+    The AST of a module, parsed when needed, for functions which don't keep
+    theirs (see CodeFunction and CompactFunction). Only the definitions of
+    the module parsed last are kept, so that going over the functions of a
+    module parses it once, without keeping the AST of every module.
+    """
+
+    filename: PurePath
+
+    def __init__(self, filename: PurePath) -> None:
+        self.filename = filename
+
+    def function_def(self, line: int) -> ast.FunctionDef:
+        global _last_defs
+        if _last_defs is None or _last_defs[0] is not self:
+            with open(self.filename) as f:
+                tree = ast.parse(f.read(), str(self.filename))
+            _last_defs = (self, {node.lineno: node for node in ast.walk(tree)
+                                 if isinstance(node, ast.FunctionDef)})
+        return _last_defs[1][line]
+
+
+class LazyFunction(Function):
+    """
+    Function whose args and stmts, which need the AST of the module, are
+    parsed each time one of them is used (see ModuleSource). Subclasses say
+    whether it takes **kwargs without the AST.
+    """
+
+    source: ModuleSource
+
+    def __init__(self, source_span: SourceSpan, name: str, source: ModuleSource,
+                 parent: "Object" = None) -> None:
+        Object.__init__(self, source_span, name, parent)
+        self.source = source
+        self._signature = None
+        self._call_sites = None
+        self._stmt_ends = None
+
+    @property
+    def args(self) -> ast.arguments:
+        return self.source.function_def(self.source_span.start_line).args
+
+    @property
+    def stmts(self) -> dict[int, ast.stmt]:
+        node = self.source.function_def(self.source_span.start_line)
+        return extract_statements_from_body(node.body)
+
+
+class CompactFunction(LazyFunction):
+    """
+    Function indexed from the AST of its module, keeping its Signature and
+    call sites instead of the AST, which is parsed again if args or stmts are
+    needed.
+    """
+
+    def __init__(self, signature: Signature, source_span: SourceSpan, name: str,
+                 source: ModuleSource, parent: "Object" = None) -> None:
+        super().__init__(source_span, name, source, parent)
+        self._signature = signature
+
+
+class CodeFunction(LazyFunction):
+    """
+    Function indexed from its compiled code object. Whether it takes
+    **kwargs, and their name, come from the code.
+    """
+
+    code: CodeType
+
+    def __init__(self, code: CodeType, source_span: SourceSpan, name: str,
+                 source: ModuleSource, parent: "Object" = None) -> None:
+        super().__init__(source_span, name, source, parent)
+        self.code = code
+
+    def has_kwargs_dict(self) -> bool:
+        return bool(self.code.co_flags & inspect.CO_VARKEYWORDS)
+
+    def get_kwargs_name(self) -> str:
+        if not self.has_kwargs_dict():
+            raise RuntimeError(f"{self} has not keyword arguments")
+        code = self.code
+        i = code.co_argcount + code.co_kwonlyargcount
+        if code.co_flags & inspect.CO_VARARGS:
+            i += 1
+        return code.co_varnames[i]
+
+
+class StubFunction(LazyFunction):
+    """
+    Function of a module indexed without its AST because none of its
+    functions takes **kwargs (see pyhole.stub).
+    """
+
+    def has_kwargs_dict(self) -> bool:
+        return False
+
+
+_KWARGS_KEY_METHODS = {'get', 'pop', 'setdefault'}
+
+
+def _const_str(node: ast.AST) -> str | None:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _is_name(node: ast.AST, name: str) -> bool:
+    return isinstance(node, ast.Name) and node.id == name
+
+
+def _kwargs_key_access(node: ast.AST, kw_name: str) -> str | None:
+    match node:
+        case ast.Subscript(value=value, slice=key, ctx=ast.Load() | ast.Del()) if _is_name(value, kw_name):
+            return _const_str(key)
+        case ast.Call(func=ast.Attribute(value=value, attr=attr), args=[key, *_]) \
+                if attr in _KWARGS_KEY_METHODS and _is_name(value, kw_name):
+            return _const_str(key)
+        case ast.Compare(left=key, ops=[ast.In() | ast.NotIn()], comparators=[value]) \
+                if _is_name(value, kw_name):
+            return _const_str(key)
+    return None
+
+
+def _kwargs_key_accesses(kw_name: str, stmts: dict[int, ast.stmt]) -> list[str]:
+    """
+    Constant keys accessed on the dict named kw_name in stmts, see
+    Function.kwargs_key_accesses. Nested functions, lambdas and classes are
+    skipped, since they may rebind the name.
+    """
+    found: list[tuple[int, int, str]] = []
+    seen: set[int] = set()
+    todo: list[ast.AST] = list(stmts.values())
+    while todo:
+        node = todo.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        key = _kwargs_key_access(node, kw_name)
+        if key is not None:
+            found.append((node.lineno, node.col_offset, key))
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+                todo.append(child)
+    keys: list[str] = []
+    for _, _, key in sorted(found):
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
 def extract_statements_from_body(body):
     stmts = {}
     for stmt in body:
@@ -333,17 +664,27 @@ def extract_statements(node):
     return stmts
 
 
+# try/except* is new in 3.11
+_TRY_STAR = (ast.TryStar,) if hasattr(ast, 'TryStar') else ()
+
+
 class ObjectCreator(ast.NodeVisitor):
     ob_stack: list[Object]
     filename: PurePath
     line_cnt: int
     mod_name: str | NoneType
 
-    def __init__(self, filename: PurePath, line_cnt: int, mod_name: str | NoneType = None):
+    def __init__(self, filename: PurePath, line_cnt: int, mod_name: str | NoneType = None,
+                 compact: bool = False):
+        """
+        If compact, functions are CompactFunctions, which don't keep the AST
+        (filename must then be readable, to parse it again if needed).
+        """
         self.ob_stack = []
         self.filename = filename
         self.line_cnt = line_cnt
         self.mod_name = mod_name
+        self.source = ModuleSource(filename) if compact else None
 
     def _parent(self) -> Union[Object, None]:
         if len(self.ob_stack) > 0:
@@ -374,7 +715,7 @@ class ObjectCreator(ast.NodeVisitor):
 
         # Now visit children
         self.ob_stack.append(ob)
-        self.generic_visit(mod)
+        self._visit_body(mod.body, None)
         self.ob_stack.pop()
 
         return ob
@@ -390,7 +731,7 @@ class ObjectCreator(ast.NodeVisitor):
 
         # Now visit children
         self.ob_stack.append(ob)
-        self.generic_visit(node)
+        self._visit_body(node.body, None)
         self.ob_stack.pop()
 
         return ob
@@ -400,14 +741,174 @@ class ObjectCreator(ast.NodeVisitor):
         ss = self._source_span(node)
         name = node.name
 
-        stmts = extract_statements_from_body(node.body)
-        ob = Function(node.args, ss, name, stmts, par)
+        # Filled in while visiting the body
+        stmts: dict[int, ast.stmt] = {}
+        if self.source is None:
+            ob = Function(node.args, ss, name, stmts, par)
+        else:
+            ob = CompactFunction(Signature(node.args), ss, name, self.source, par)
         if par:
             par.append_child(name, ob)
 
         # Now visit children
         self.ob_stack.append(ob)
-        self.generic_visit(node)
+        self._visit_body(node.body, stmts)
         self.ob_stack.pop()
+        if self.source is not None:
+            ob._call_sites, ob._stmt_ends = index_calls(stmts)
 
         return ob
+
+    def _visit_body(self, body: list[ast.stmt], stmts: dict[int, ast.stmt] | None) -> None:
+        """
+        Visit the statements of body, and those nested in them, for
+        definitions. Expressions can't hold any, so they are skipped. If
+        stmts is given, the statements are added to it as by
+        extract_statements_from_body.
+        """
+        for node in body:
+            match node:
+                case ast.FunctionDef():
+                    self.visit_FunctionDef(node)
+                    continue
+                case ast.ClassDef():
+                    self.visit_ClassDef(node)
+                    continue
+                case ast.AsyncFunctionDef():
+                    # Not an object, but what it defines is
+                    self._visit_body(node.body, None)
+                    continue
+            if stmts is not None:
+                stmts[node.lineno] = node
+            match node:
+                case ast.For() | ast.AsyncFor() | ast.While() | ast.If():
+                    # extract_statements leaves out else branches
+                    self._visit_body(node.body, stmts)
+                    self._visit_body(node.orelse, None)
+                case ast.With() | ast.AsyncWith():
+                    self._visit_body(node.body, stmts)
+                case ast.Match():
+                    for case in node.cases:
+                        self._visit_body(case.body, stmts)
+                case ast.Try():
+                    if stmts is None:
+                        for branch in [node.body] + [h.body for h in node.handlers] + \
+                                [node.orelse, node.finalbody]:
+                            self._visit_body(branch, None)
+                        continue
+                    # Definitions are visited in source order, but statements
+                    # are added in the order of extract_statements
+                    found = {}
+                    for key, branch in [('body', node.body),
+                                        *((h, h.body) for h in node.handlers),
+                                        ('orelse', node.orelse), ('finalbody', node.finalbody)]:
+                        found[key] = {}
+                        self._visit_body(branch, found[key])
+                    for key in ['body', 'orelse', 'finalbody', *node.handlers]:
+                        stmts.update(found[key])
+                case _ if isinstance(node, _TRY_STAR):
+                    for branch in [node.body] + [h.body for h in node.handlers] + \
+                            [node.orelse, node.finalbody]:
+                        self._visit_body(branch, None)
+
+
+_LOAD_CONST = dis.opmap['LOAD_CONST']
+_EXTENDED_ARG = dis.opmap['EXTENDED_ARG']
+_ASYNC_FLAGS = inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+
+def _instruction_lines(code: CodeType) -> list[int | None]:
+    """
+    The line of each instruction of code, from co_lines.
+    """
+    lines: list[int | None] = [None] * (len(code.co_code) // 2)
+    for start, end, line in code.co_lines():
+        lines[start // 2:end // 2] = [line] * ((end - start) // 2)
+    return lines
+
+
+def _last_line(code: CodeType) -> int:
+    """
+    The last line of code, or of the code objects defined in it.
+    """
+    lines = [ln for _, _, ln in code.co_lines() if ln is not None]
+    lines.extend(_last_line(const) for const in code.co_consts if isinstance(const, CodeType))
+    return max(lines, default=code.co_firstlineno)
+
+
+# co_positions is new in 3.11, before that instructions only have a line
+_HAS_POSITIONS = hasattr(CodeType, 'co_positions')
+
+
+def _nested_code_spans(code: CodeType) -> list[tuple[CodeType, int, int]]:
+    """
+    The code objects defined in code, with the span of their definition,
+    which is that of the instruction loading them: from the def line (not
+    that of the first decorator, like co_firstlineno) to the end of the body.
+    Without co_positions, the end is the last line of the code object.
+    """
+    if not any(isinstance(const, CodeType) for const in code.co_consts):
+        return []
+    if _HAS_POSITIONS:
+        positions = ((pos[0], pos[1]) for pos in code.co_positions())
+    else:
+        positions = ((line, None) for line in _instruction_lines(code))
+    found = []
+    raw = code.co_code
+    ext = 0
+    for i, (start, end) in enumerate(positions):
+        op = raw[2 * i]
+        arg = raw[2 * i + 1] | ext
+        ext = arg << 8 if op == _EXTENDED_ARG else 0
+        if op != _LOAD_CONST:
+            continue
+        const = code.co_consts[arg]
+        if isinstance(const, CodeType):
+            if start is None:
+                start = const.co_firstlineno
+            if end is None:
+                end = _last_line(const)
+            found.append((const, start, end))
+    # In source order, which decides which duplicate definition is an AltObject
+    found.sort(key=lambda item: (item[1], item[0].co_firstlineno))
+    return found
+
+
+class CodeObjectCreator:
+    """
+    Builds the objects of a module from its compiled code, like
+    ObjectCreator does from its AST: nested code objects are classes (class
+    bodies don't get fresh locals) or functions. Async functions, lambdas and
+    comprehensions aren't objects, like in ObjectCreator, but the functions
+    they define are children of the enclosing object.
+    """
+
+    filename: PurePath
+    line_cnt: int
+    mod_name: str | NoneType
+
+    def __init__(self, filename: PurePath, line_cnt: int, mod_name: str | NoneType = None):
+        self.filename = filename
+        self.line_cnt = line_cnt
+        self.mod_name = mod_name
+        self.source = ModuleSource(filename)
+
+    def create(self, code: CodeType) -> Module:
+        name = self.mod_name or ObjectCreator(self.filename, self.line_cnt)._mod_name()
+        mod = Module(SourceSpan(self.filename, 0, self.line_cnt), name, None)
+        self._visit(code, mod)
+        return mod
+
+    def _visit(self, code: CodeType, par: Object) -> None:
+        for child, start, end in _nested_code_spans(code):
+            name = child.co_name
+            if name.startswith('<') or child.co_flags & _ASYNC_FLAGS:
+                self._visit(child, par)
+                continue
+            ss = SourceSpan(self.filename, start, end)
+            if child.co_flags & inspect.CO_NEWLOCALS:
+                ob = CodeFunction(child, ss, name, self.source, par)
+            else:
+                ob = Class(ss, name, par)
+            par.append_child(name, ob)
+            self._visit(child, ob)
@@ -1,67 +1,65 @@
-from pathlib import PurePath, Path
+from pathlib import PurePath
 from . import Object, Module, SourceSpan, Function
 from . import indexer, Indexer
+from .crawl import Crawler, DirChildren
 from .db import ObjectDb, Position
+from .keyword import LinePlan
+from .object import CallSite
+from types import CodeType
 from typing import Tuple
-import re
 import ast
-
-
-pyfile_re = re.compile(r"^.*\.py$")
-
-
-class DirChildren:
-    init: PurePath | None
-    files: list[PurePath]
-    dirs: list[PurePath]
-
-    def __init__(
-        self, init: PurePath | None, files: list[PurePath], dirs: list[PurePath]
-    ) -> None:
-        self.init = init
-        self.files = files
-        self.dirs = dirs
+import importlib.util
+import os
 
 
 # Children of a directory, with files at first and directory at last
 # Files must end with .py, and the __init__.py file comes at first.
 def dir_children(path: PurePath) -> DirChildren:
-    path = Path(path)
-    files: list[PurePath] = []
-    dirs: list[PurePath] = []
-    init: PurePath | None = None
-    for child in path.iterdir():
-        if child.is_dir() and child.name != "__pycache__":
-            dirs.append(child)
-        elif child.is_file():
-            name = child.name
-            if not pyfile_re.fullmatch(name):
-                continue
-            if name == "__init__.py":
-                init = child
-            else:
-                files.append(child)
-    return DirChildren(init, files, dirs)
+    return Crawler(path, exclude=['__pycache__']).dir_children(path)
 
 
 class InitPyNotFound(Exception):
     pass
 
 
-def mod_from_file(path: PurePath | str, mod_name: str | None = None) -> Module:
+def mod_from_file(path: PurePath | str, mod_name: str | None = None,
+                  kwargs_focused: bool = False) -> Module:
+    """
+    If kwargs_focused, modules in which no function takes **kwargs are
+    stubs, see pyhole.stub.
+    """
     from .object import ObjectCreator
+    from .stub import stub_module
 
     if isinstance(path, str):
         path = PurePath(path)
     with open(path) as f:
         code = f.read()
+        if kwargs_focused:
+            mod = stub_module(path, code, mod_name)
+            if mod is not None:
+                return mod
         line_cnt = len(code.split("\n"))
-        obc = ObjectCreator(path, line_cnt, mod_name)
+        obc = ObjectCreator(path, line_cnt, mod_name, compact=True)
         tree = ast.parse(code, str(path))
         assert isinstance(tree, ast.Module)
         return obc.visit(tree)
 
 
+def mod_from_code(code: CodeType, path: PurePath | str, mod_name: str | None = None) -> Module:
+    """
+    Like mod_from_file, from the compiled code of the module instead of its
+    source, which is only parsed if the AST of one of its functions is needed.
+    """
+    from .object import CodeObjectCreator
+
+    if isinstance(path, str):
+        path = PurePath(path)
+    with open(path, 'rb') as f:
+        line_cnt = f.read().count(b'\n') + 1
+    return CodeObjectCreator(path, line_cnt, mod_name).create(code)
+
+
 def position_from_source_span(span: SourceSpan) -> Position:
     return Position(span.filename, span.start_line)
 
@@ -74,8 +72,18 @@ class Project:
     kw_fns: ObjectDb
     root_ob: Object | None
 
-    def __init__(self, root: PurePath) -> None:
+    def __init__(self, root: PurePath, kwargs_focused: bool = False,
+                 crawler: Crawler | None = None, lazy: bool = False) -> None:
+        """
+        If kwargs_focused, modules in which no function takes **kwargs are
+        indexed without parsing them (see pyhole.stub). Directories are
+        listed by crawler, by default one with the default exclude globs (see
+        pyhole.crawl). If lazy, modules are indexed on demand, see
+        from_import_name. Only the Python indexer does these.
+        """
         self.root = root
+        self.kwargs_focused = kwargs_focused
+        self.crawler = crawler or Crawler(root)
         self.db = ObjectDb()  # All objects
         self.kw_fns = ObjectDb()  # Functions with keyword arguments
         self.root_ob = None
@@ -85,10 +93,119 @@ class Project:
             mod = module_from_dir(str(root))
             self.root_ob = mod
             self._populate_db_from_ob(mod)
+        elif lazy:
+            self._start_lazy()
         else:
             self._populate_db()
             self._find_kw_fns()
 
+    @staticmethod
+    def from_import_name(name: str, kwargs_focused: bool = False,
+                         crawler: Crawler | None = None) -> "Project":
+        """
+        The project of the package (or module) imported as name, located
+        through the import system, which imports the parent packages of a
+        dotted name. Only the __init__ module of a package is indexed up
+        front. Other modules are indexed when a lookup in db or kw_fns first
+        needs them, eg, when a tracer looks up the function of a frame in one
+        of them. Iterating over db only sees the modules indexed so far, call
+        index_all before eg, static inference.
+        """
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+        if spec.origin is None or not spec.origin.endswith('.py'):
+            raise ValueError(f'{name} has no Python source')
+        root = spec.origin
+        if spec.submodule_search_locations is not None:
+            root = os.path.dirname(root)
+        return Project(PurePath(root), kwargs_focused, crawler, lazy=True)
+
+    def _start_lazy(self) -> None:
+        if not os.path.isdir(self.root):
+            # A plain module, nothing to defer
+            self.root_ob = mod_from_file(self.root, kwargs_focused=self.kwargs_focused)
+            self._populate_db_from_ob(self.root_ob)
+            return
+        # Package directory => its module, or None if it isn't a package
+        self._packages: dict[str, Module | None] = {}
+        self._listings: dict[str, DirChildren] = {}
+        self._seen_files: set[str] = set()
+        self._prefix = os.path.join(str(self.root), '')
+        self.crawler.restart()
+        self.root_ob = self._package(str(self.root))
+        self.db.index_file = self.kw_fns.index_file = self._index_file
+
+    def _listing(self, directory: str) -> DirChildren:
+        if directory not in self._listings:
+            self._listings[directory] = self.crawler.dir_children(PurePath(directory))
+        return self._listings[directory]
+
+    def _package(self, directory: str) -> Module | None:
+        """
+        The module of the package in directory, indexed if it wasn't yet
+        (along with its parent packages).
+        """
+        if directory in self._packages:
+            return self._packages[directory]
+        self._packages[directory] = None
+        par = None
+        if directory != str(self.root):
+            parent_dir = os.path.dirname(directory)
+            par = self._package(parent_dir)
+            if par is None or PurePath(directory) not in self._listing(parent_dir).dirs:
+                return None
+        init = self._listing(directory).init
+        if init is None:
+            return None
+        mod = mod_from_file(init, kwargs_focused=self.kwargs_focused)
+        mod.parent = par
+        if par:
+            par.append_child(mod.name, mod)
+        self._populate_db_from_ob(mod)
+        self._packages[directory] = mod
+        return mod
+
+    def _index_file(self, filename: str) -> None:
+        if filename in self._seen_files:
+            return
+        self._seen_files.add(filename)
+        if not filename.startswith(self._prefix):
+            return
+        directory = os.path.dirname(filename)
+        par = self._package(directory)
+        if par is None or PurePath(filename) not in self._listing(directory).files:
+            # Not a package, or an __init__ module indexed with its package
+            return
+        mod = mod_from_file(filename, kwargs_focused=self.kwargs_focused)
+        mod.parent = par
+        par.append_child(mod.name, mod)
+        self._populate_db_from_ob(mod)
+
+    def index_all(self) -> None:
+        """
+        Index the modules of a lazy project which aren't indexed yet.
+        """
+        if self.db.index_file is None:
+            return
+        pending = [str(self.root)]
+        while pending:
+            directory = pending.pop()
+            if self._package(directory) is None:
+                continue
+            drc = self._listing(directory)
+            for file in drc.files:
+                self._index_file(str(file))
+            pending.extend(str(d) for d in drc.dirs)
+
+    def line_plan(self, static_calls: set[CallSite] | None = None) -> LinePlan:
+        """
+        The interesting lines of every function in the project, for CallTracer.
+        static_calls are call sites already resolved statically, which need
+        not be traced.
+        """
+        return LinePlan(self.kw_fns, static_calls).precompute(self.db)
+
     def _populate_db_from_ob(self, ob: Object) -> None:
         pos = position_from_source_span(ob.source_span)
         self.db[pos] = ob
@@ -104,6 +221,7 @@ class Project:
 
     def _populate_db(self) -> None:
         par_st: list[Object | None] = [None]
+        self.crawler.restart()
         self._populate_db_intern(par_st, self.root)
 
     def _populate_db_intern(self, par_st: list[Object], directory: PurePath) -> None:
@@ -126,18 +244,18 @@ class Project:
     def _populate_from_directory(
         self, directory: PurePath, par: Object | None
     ) -> Tuple[Module | None, list[PurePath]]:
-        drc = dir_children(directory)
+        drc = self.crawler.dir_children(directory)
         if drc.init is None:
             return None, []
 
         # Find main module of this directory
-        main_mod = mod_from_file(drc.init)
+        main_mod = mod_from_file(drc.init, kwargs_focused=self.kwargs_focused)
         main_mod.parent = par
         self._populate_from_object(main_mod)
 
         # Then do the direct sub-modules
         for file in drc.files:
-            mod = mod_from_file(file)
+            mod = mod_from_file(file, kwargs_focused=self.kwargs_focused)
             mod.parent = main_mod
             main_mod.append_child(mod.name, mod)
             self._populate_from_object(mod)
@@ -169,15 +287,23 @@ class IncrementalProject:
         self.mod_db = {}
 
     def add_file(self, path: str, fullname: str) -> None:
+        self._add_module(mod_from_file(path, fullname.split('.')[-1]), fullname)
+
+    def add_code(self, code: CodeType, path: str, fullname: str) -> None:
+        """
+        Like add_file, from the code object compiled for the module (eg, by
+        its loader), without parsing its source.
+        """
+        self._add_module(mod_from_code(code, path, fullname.split('.')[-1]), fullname)
+
+    def _add_module(self, mod: Module, fullname: str) -> None:
         name_parts = fullname.split('.')
         par_mod: Module | None = None
-        mod_name = name_parts[-1]
         if len(name_parts) > 1:
             par_name = '.'.join(name_parts[:-1])
             if par_name in self.mod_db:
                 par_mod = self.mod_db[par_name]
 
-        mod = mod_from_file(path, mod_name)
         mod.parent = par_mod
         if par_mod:
             par_mod.children[mod.name] = mod
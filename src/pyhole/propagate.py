@@ -0,0 +1,262 @@
+"""
+Tracing of child interpreters: subprocesses running Python, and
+multiprocessing children.
+
+While a Propagation is started, the environment of this process points
+children to a directory holding the function table of the projects (see
+pyhole.deferred.function_table), and puts a startup directory on PYTHONPATH
+whose sitecustomize module starts a TableEventRecorder in the child. Children
+thus don't index the projects. They write their call events to the directory
+when they exit, and collect resolves the events written so far, in this
+process or by the daemon.
+
+Children forked without exec (eg, by multiprocessing with the fork start
+method) are handled by an at-fork hook instead. Children terminated with
+SIGTERM, like the workers of a Pool leaving its with block, write their events
+before exiting. Only the main thread of children is traced. Children started
+with an environment of their own, or with python -S or -I, aren't traced.
+"""
+from types import FrameType
+from typing import Any, Callable
+import atexit
+import itertools
+import json
+import logging as lg
+import multiprocessing.util
+import os
+import shutil
+import signal
+import site
+import sys
+import tempfile
+from .db import Position
+from .deferred import DeferredCallTracer, TableEventRecorder, function_table
+
+
+# Directory shared with children, set in their environment
+PROPAGATE_ENV = 'PYHOLE_PROPAGATE_DIR'
+TABLE_FILE = 'functions.json'
+STARTUP_DIR = os.path.join(os.path.dirname(__file__), '_startup')
+
+
+class ChildRecorder(TableEventRecorder):
+    """
+    Recorder of a child, which keeps its events until they are written.
+    """
+
+    recorded: set[tuple[int, int, int, tuple[str, ...]]]
+
+    def __init__(self, table: dict[str, dict[int, str | None]]) -> None:
+        super().__init__(table)
+        self.recorded = set()
+
+    def process(self, events: set[tuple[int, int, int, tuple[str, ...]]]) -> None:
+        self.recorded |= events
+
+
+# The recorder of this process, if it is a traced child
+child_recorder: ChildRecorder | None = None
+_write_ids = itertools.count()
+# Whether the at-fork hooks are registered (inherited by forked children)
+_fork_hooks = False
+
+
+def _load_table(directory: str) -> dict[str, dict[int, str | None]]:
+    with open(os.path.join(directory, TABLE_FILE)) as f:
+        table = json.load(f)
+    return {filename: {int(line): kw_name or None for line, kw_name in fns.items()}
+            for filename, fns in table.items()}
+
+
+def write_child_events() -> None:
+    """
+    Write the events recorded in this child since the last write.
+    """
+    global child_recorder
+    directory = os.environ.get(PROPAGATE_ENV)
+    if child_recorder is None or directory is None:
+        return
+    recorder = child_recorder
+    recorder.disable_tracing()
+    recorder.flush()
+    if recorder.recorded:
+        name = f'events-{os.getpid()}-{next(_write_ids)}.json'
+        tmp_path = os.path.join(directory, f'.{name}')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(recorder.positions_of(recorder.recorded), f)
+            # Atomic, so that collect never reads a partial file
+            os.replace(tmp_path, os.path.join(directory, name))
+        except OSError as e:
+            lg.warning('pyhole: could not write events of child %d: %s', os.getpid(), e)
+        recorder.recorded = set()
+    recorder.enable_tracing()
+
+
+def _exit_child() -> None:
+    global child_recorder
+    write_child_events()
+    if child_recorder is not None:
+        child_recorder.disable_tracing()
+        child_recorder = None
+
+
+def _on_sigterm(signum: int, frame: FrameType | None) -> None:
+    _exit_child()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def start_child() -> bool:
+    """
+    Start recording events if this process is a child of a Propagation.
+    Called by the sitecustomize module of the startup directory, and after
+    forks. Returns whether recording started.
+    """
+    global child_recorder
+    directory = os.environ.get(PROPAGATE_ENV)
+    if directory is None:
+        return False
+    try:
+        table = _load_table(directory)
+    except (OSError, ValueError):
+        # The parent stopped propagating
+        return False
+    # Tracing inherited through a fork is of the parent's tracer
+    sys.settrace(None)
+    sys.setprofile(None)
+    child_recorder = ChildRecorder(table)
+    child_recorder.enable_tracing()
+    # For the children of this child
+    _register_fork_hooks()
+    atexit.register(_exit_child)
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _on_sigterm)
+    return True
+
+
+def _after_process_fork(_: Any) -> None:
+    # Forked multiprocessing children exit with os._exit, skipping atexit, but
+    # run the finalizers registered after their fork
+    if child_recorder is not None:
+        multiprocessing.util.Finalize(None, _exit_child, exitpriority=0)
+
+
+def _register_fork_hooks() -> None:
+    """
+    Start recording in forked children, once a Propagation started (or in a
+    traced child), rather than in every process importing this module.
+    """
+    global _fork_hooks
+    if _fork_hooks:
+        return
+    _fork_hooks = True
+    os.register_at_fork(after_in_child=start_child)
+    multiprocessing.util.register_after_fork(sys.modules[__name__], _after_process_fork)
+
+
+def _on_default_path(directory: str) -> bool:
+    """
+    Whether children find modules in directory without adding it to their
+    PYTHONPATH: it is a site directory, or already on PYTHONPATH (relative
+    entries aren't counted, children may run elsewhere).
+    """
+    paths = site.getsitepackages() + [site.getusersitepackages()]
+    paths += [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if os.path.isabs(p)]
+    directory = os.path.realpath(directory)
+    return any(os.path.realpath(p) == directory for p in paths)
+
+
+class Propagation:
+    """
+    Propagates tracing to the children of this process while started, see the
+    module docstring. Their events are passed to resolve by collect, as lists
+    of [caller [filename, def line] or None, line, callee [filename, def
+    line], keys].
+    """
+
+    table: dict[str, dict[int, str | None]]
+    resolve: Callable[[list[list]], None]
+    directory: str | None
+
+    def __init__(self, table: dict[str, dict[int, str | None]],
+                 resolve: Callable[[list[list]], None]) -> None:
+        self.table = table
+        self.resolve = resolve
+        self.directory = None
+        self._old_env: dict[str, str | None] = {}
+
+    @staticmethod
+    def resolving_with(resolver: DeferredCallTracer) -> "Propagation":
+        """
+        A Propagation over the functions of resolver, which resolves the
+        events of children into its kwd_db.
+        """
+        def resolve(events: list[list]) -> None:
+            resolver.resolve_events(
+                (Position(*caller) if caller else None, line, Position(*callee), keys)
+                for caller, line, callee, keys in events)
+
+        return Propagation(function_table(resolver.dbs, resolver.kw_fns), resolve)
+
+    def _set_env(self, name: str, value: str) -> None:
+        self._old_env.setdefault(name, os.environ.get(name))
+        os.environ[name] = value
+
+    def start(self) -> None:
+        self.directory = tempfile.mkdtemp(prefix='pyhole-children-')
+        with open(os.path.join(self.directory, TABLE_FILE), 'w') as f:
+            json.dump({filename: {str(line): kw_name or '' for line, kw_name in fns.items()}
+                       for filename, fns in self.table.items()}, f)
+        python_path = [STARTUP_DIR]
+        if os.environ.get('PYTHONPATH'):
+            python_path.append(os.environ['PYTHONPATH'])
+        # Only if needed, PYTHONPATH comes before the standard library, which
+        # old backports in a site-packages would shadow. Last, after the
+        # entries of the user.
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if not _on_default_path(package_parent):
+            python_path.append(package_parent)
+        self._set_env('PYTHONPATH', os.pathsep.join(python_path))
+        self._set_env(PROPAGATE_ENV, self.directory)
+        _register_fork_hooks()
+
+    def collect(self) -> int:
+        """
+        Resolve the events written by children since the last collect.
+        Returns the number of event files read.
+        """
+        if self.directory is None:
+            return 0
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith('events-'))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    events = json.load(f)
+            except (OSError, ValueError) as e:
+                lg.warning('pyhole: ignoring unreadable child events %s: %s', path, e)
+            else:
+                self.resolve(events)
+            os.unlink(path)
+        return len(names)
+
+    def stop(self) -> None:
+        self.collect()
+        for name, value in self._old_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self._old_env = {}
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def __enter__(self) -> "Propagation":
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.stop()
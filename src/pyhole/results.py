@@ -0,0 +1,118 @@
+"""
+Keys found in earlier runs, cached per function.
+
+Each function with keys is stored under its full path (its ObjectPath), with
+the hash of its source, its keys and their evidence, and the hashes of the
+functions its keys were found through (KeywordDb.sources). A stored result is
+still valid when none of these hashes changed. Valid results warm-start the
+KeywordDb of a new run, with CACHED evidence, and their functions are
+saturated, along with the unchanged functions they depend on which had no
+keys: tracers don't look for more keys passed to a saturated function, nor
+analyze calls between two saturated functions.
+
+Tests aren't part of the key, so keys only reachable by a new test are missed
+for saturated functions until their result is invalidated.
+"""
+from pathlib import PurePath
+import json
+import logging as lg
+from .cache import FileCache
+from .db import Evidence, KeywordDb
+from . import Function
+
+
+RESULTS_VERSION = 1
+
+
+def results_path(rst_path: PurePath) -> PurePath:
+    """
+    Where the result cache of a run is kept, next to its results
+    """
+    return rst_path.with_suffix('.results.json')
+
+
+class ResultCache:
+    # function full path => {'hash': str, 'keys': {key: [evidence names]},
+    #                        'deps': {function full path: hash}}
+    entries: dict[str, dict]
+
+    def __init__(self) -> None:
+        self.entries = {}
+
+    @staticmethod
+    def load(path: PurePath) -> "ResultCache":
+        cache = ResultCache()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cache
+        except (OSError, ValueError) as e:
+            lg.warning('Ignoring unreadable result cache %s: %s', path, e)
+            return cache
+        if data.get('version') == RESULTS_VERSION:
+            cache.entries = data['functions']
+        return cache
+
+    def save(self, path: PurePath) -> None:
+        with open(path, 'w') as f:
+            json.dump({'version': RESULTS_VERSION, 'functions': self.entries}, f)
+
+    def valid_functions(self, fns: dict[str, Function], file_cache: FileCache) -> set[str]:
+        hashes: dict[str, str | None] = {}
+
+        def current(path: str) -> str | None:
+            if path not in hashes:
+                fn = fns.get(path)
+                hashes[path] = file_cache.object_hash(fn) if fn is not None else None
+            return hashes[path]
+
+        valid = set()
+        for path, entry in self.entries.items():
+            if current(path) != entry['hash']:
+                continue
+            if all(current(dep) == dep_hash for dep, dep_hash in entry['deps'].items()):
+                valid.add(path)
+        return valid
+
+    def warm_start(self, fns: dict[str, Function], file_cache: FileCache,
+                   kwd_db: KeywordDb) -> set[Function]:
+        """
+        Add the keys of the still valid results to kwd_db. Returns the
+        functions to saturate.
+        """
+        valid = self.valid_functions(fns, file_cache)
+        for path in valid:
+            fn = fns[path]
+            # Kept as dependencies when the cache is updated
+            kwd_db.sources.setdefault(fn, set()).update(
+                fns[dep] for dep in self.entries[path]['deps'])
+            for key, evidence in self.entries[path]['keys'].items():
+                kinds = {Evidence[name] for name in evidence}
+                # Traced keys are marked as cached, the others are found again
+                # by the static passes if enabled
+                if Evidence.TRACE in kinds or Evidence.CACHED in kinds:
+                    kwd_db.append_possibility(fn, key, Evidence.CACHED)
+        saturated = {fns[path] for path in valid}
+        for path in valid:
+            for dep in self.entries[path]['deps']:
+                # Unchanged, and no keys were found for it in the earlier run
+                if dep not in self.entries:
+                    saturated.add(fns[dep])
+        return saturated
+
+    def update(self, kwd_db: KeywordDb, file_cache: FileCache) -> None:
+        """
+        Replace the cached results by those in kwd_db, which holds the
+        warm-started keys as well as fresh ones.
+        """
+        self.entries = {}
+        for fn, kwds in kwd_db.items():
+            evidence = {kwd: sorted(e.name for e in kwd_db.evidence_of(fn, kwd)) for kwd in kwds}
+            deps = {str(src.full_path()): file_cache.object_hash(src)
+                    for src in kwd_db.sources.get(fn, ())}
+            self.entries[str(fn.full_path())] = {
+                'hash': file_cache.object_hash(fn),
+                'keys': evidence,
+                'deps': deps,
+            }
@@ -0,0 +1,288 @@
+import ast
+import logging as lg
+from typing import Iterable, Iterator
+from . import Object, Module, Class, Function
+from .object import CallSite, extract_statements_from_body, function_calls
+from .db import Evidence, KeywordDb, ObjectDb
+from .keyword import KeywordValKind, find_keyword_params
+from .project import Project
+
+
+# Marks a name bound more than once at module level, which can't be resolved
+_AMBIGUOUS = object()
+
+
+def _module_level_stmts(body: list[ast.stmt]) -> Iterator[ast.stmt]:
+    """
+    Statements executed at module level, including those nested inside
+    compound statements (eg, imports in try/except or if blocks).
+    """
+    for stmt in body:
+        yield stmt
+        match stmt:
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                continue
+            case ast.If() | ast.For() | ast.AsyncFor() | ast.While():
+                yield from _module_level_stmts(stmt.body)
+                yield from _module_level_stmts(stmt.orelse)
+            case ast.With() | ast.AsyncWith():
+                yield from _module_level_stmts(stmt.body)
+            case ast.Try():
+                for b in [stmt.body, stmt.orelse, stmt.finalbody]:
+                    yield from _module_level_stmts(b)
+                for h in stmt.handlers:
+                    yield from _module_level_stmts(h.body)
+
+
+def _stored_names(node: ast.AST) -> Iterator[str]:
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.Name) and isinstance(sub.ctx, (ast.Store, ast.Del)):
+            yield sub.id
+
+
+def _local_names(args: ast.arguments, stmts: Iterable[ast.stmt]) -> set[str]:
+    """
+    Names bound in a function with args and stmts: its parameters, and names
+    stored or imported in its body, unless declared global or nonlocal.
+    """
+    names = {arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs}
+    for arg in [args.vararg, args.kwarg]:
+        if arg is not None:
+            names.add(arg.arg)
+    declared_global = set()
+    for stmt in stmts:
+        names.update(_stored_names(stmt))
+        match stmt:
+            case ast.Import(names=aliases) | ast.ImportFrom(names=aliases):
+                for alias in aliases:
+                    names.add(alias.asname or alias.name.split('.')[0])
+            case ast.Global(names=globs) | ast.Nonlocal(names=globs):
+                declared_global.update(globs)
+    return names - declared_global
+
+
+class ModuleScope:
+    """
+    Module-level name bindings of a project module, as full dotted paths
+    (eg, "requests.api.get") of what each name refers to, and the local names
+    of its functions, by the line of their def.
+    """
+
+    fullname: str
+    is_package: bool
+    bindings: dict[str, object]
+    fn_locals: dict[int, set[str]]
+
+    def __init__(self, fullname: str, is_package: bool) -> None:
+        self.fullname = fullname
+        self.is_package = is_package
+        self.bindings = {}
+        self.fn_locals = {}
+
+    def _bind(self, name: str, target: str | None) -> None:
+        if name in self.bindings and self.bindings[name] != target:
+            self.bindings[name] = _AMBIGUOUS
+        else:
+            self.bindings[name] = target
+
+    def _import_base(self, node: ast.ImportFrom) -> str | None:
+        if node.level == 0:
+            return node.module
+        package = self.fullname if self.is_package else self.fullname.rpartition('.')[0]
+        parts = package.split('.') if package else []
+        if node.level - 1 > len(parts):
+            return None
+        base = '.'.join(parts[:len(parts) - node.level + 1])
+        if node.module:
+            base = f'{base}.{node.module}' if base else node.module
+        return base
+
+    def collect(self, tree: ast.Module) -> None:
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                stmts = extract_statements_from_body(node.body).values()
+                self.fn_locals[node.lineno] = _local_names(node.args, stmts)
+        for stmt in _module_level_stmts(tree.body):
+            match stmt:
+                case ast.FunctionDef(name=name) | ast.AsyncFunctionDef(name=name) | ast.ClassDef(name=name):
+                    self._bind(name, f'{self.fullname}.{name}')
+                case ast.Import(names=names):
+                    for alias in names:
+                        if alias.asname:
+                            self._bind(alias.asname, alias.name)
+                        else:
+                            top = alias.name.split('.')[0]
+                            self._bind(top, top)
+                case ast.ImportFrom(names=names):
+                    base = self._import_base(stmt)
+                    for alias in names:
+                        if alias.name == '*':
+                            continue
+                        target = f'{base}.{alias.name}' if base else None
+                        self._bind(alias.asname or alias.name, target)
+                case ast.Assign() | ast.AugAssign() | ast.AnnAssign() | ast.For() | ast.With() | ast.Delete():
+                    for name in _stored_names(stmt):
+                        self._bind(name, None)
+
+    def lookup(self, name: str) -> str | None:
+        target = self.bindings.get(name)
+        if target is _AMBIGUOUS:
+            return None
+        return target
+
+
+class StaticKeywordPass:
+    """
+    Static analysis over a Project, which finds **kwargs keys without running
+    anything. Calls inside project functions are resolved through import and
+    module-level name bindings to project functions. Keys passed explicitly
+    to a **kwargs callee, or required by a callee to which **kwargs is
+    forwarded, are added to a KeywordDb. The call sites which could be
+    resolved are recorded in resolved_calls, so that CallTracer only needs to
+    do runtime work for the others.
+    """
+
+    project: Project
+    obs: dict[str, Object]
+    scopes: dict[str, ModuleScope]
+    kw_fns: set[Object]
+    resolved_calls: set[CallSite]
+
+    def __init__(self, project: Project) -> None:
+        self.project = project
+        self.obs = {}
+        self.scopes = {}
+        self.kw_fns = set(project.kw_fns.values())
+        self.resolved_calls = set()
+        if project.root_ob is not None:
+            self._collect_obs(project.root_ob)
+
+    def _collect_obs(self, ob: Object) -> None:
+        self.obs[str(ob.full_path())] = ob
+        for child in ob.children.values():
+            self._collect_obs(child)
+
+    def _scope(self, mod: Module) -> ModuleScope | None:
+        fullname = str(mod.full_path())
+        if fullname in self.scopes:
+            return self.scopes[fullname]
+        filename = str(mod.source_span.filename)
+        scope = ModuleScope(fullname, filename.endswith('__init__.py'))
+        try:
+            with open(filename) as f:
+                scope.collect(ast.parse(f.read(), filename))
+        except (OSError, SyntaxError) as e:
+            lg.warning('Could not collect bindings of %s: %s', filename, e)
+            scope = None
+        self.scopes[fullname] = scope
+        return scope
+
+    def _resolve_path(self, path: str, depth: int = 0) -> Object | None:
+        """
+        Resolve a full dotted path to a project object, following names
+        re-exported by modules (eg, "pkg.get" where pkg does "from .api import get").
+        """
+        if path in self.obs:
+            return self.obs[path]
+        if depth > 8:
+            return None
+        mod_path, _, attr = path.rpartition('.')
+        if not mod_path:
+            return None
+        mod = self._resolve_path(mod_path, depth + 1)
+        if isinstance(mod, Module):
+            if attr in mod.children:
+                return mod.children[attr]
+            scope = self._scope(mod)
+            target = scope.lookup(attr) if scope else None
+            if target and target != path:
+                return self._resolve_path(target, depth + 1)
+        elif isinstance(mod, Class) and attr in mod.children:
+            return mod.children[attr]
+        return None
+
+    @staticmethod
+    def _enclosing_module(ob: Object) -> Module | None:
+        while ob is not None and not isinstance(ob, Module):
+            ob = ob.parent
+        return ob
+
+    @staticmethod
+    def _local_names(fn: Function, scope: ModuleScope) -> set[str]:
+        # Collected with the scope, which saves parsing the module again for
+        # functions which don't keep their AST
+        names = scope.fn_locals.get(fn.source_span.start_line)
+        if names is None:
+            names = _local_names(fn.args, fn.stmts.values())
+        return names | fn.children.keys()
+
+    def _resolve_callee(self, site: CallSite, scope: ModuleScope,
+                        local_names: set[str]) -> Function | None:
+        parts = site.parts
+        if parts is None:
+            return None
+        # Locals (including self) can be bound to anything at runtime
+        if parts[0] in local_names:
+            return None
+        base = scope.lookup(parts[0])
+        if base is None:
+            return None
+        ob = self._resolve_path('.'.join([base, *parts[1:]]))
+        if isinstance(ob, Class):
+            ob = ob.children.get('__init__')
+        if not isinstance(ob, Function):
+            return None
+        # Conditionally redefined, so the definition used depends on runtime
+        if ob.parent is not None and ob.name in ob.parent.alt_counts:
+            return None
+        return ob
+
+    def run(self, kwd_db: KeywordDb) -> set[CallSite]:
+        for ob in self.project.db.values():
+            if not isinstance(ob, Function):
+                continue
+            mod = self._enclosing_module(ob)
+            scope = self._scope(mod) if mod else None
+            if scope is None:
+                continue
+            self._analyze_function(ob, scope, kwd_db)
+        return self.resolved_calls
+
+    def _analyze_function(self, fn: Function, scope: ModuleScope, kwd_db: KeywordDb) -> None:
+        local_names = self._local_names(fn, scope)
+        for sites in function_calls(fn)[0].values():
+            for site in sites:
+                callee = self._resolve_callee(site, scope, local_names)
+                if callee is None:
+                    continue
+                self.resolved_calls.add(site)
+                par_has_kw = fn in self.kw_fns
+                child_has_kw = callee in self.kw_fns
+                if not par_has_kw and not child_has_kw:
+                    continue
+                kwds = find_keyword_params(fn, callee, site, par_has_kw, child_has_kw)
+                for kwd in kwds:
+                    if kwd.kind == KeywordValKind.PARENT:
+                        kwd_db.append_possibility(fn, kwd.name, Evidence.STATIC_CALL, callee)
+                    else:
+                        kwd_db.append_possibility(callee, kwd.name, Evidence.STATIC_CALL, fn)
+
+
+def infer_static_keywords(project: Project, kwd_db: KeywordDb) -> set[CallSite]:
+    """
+    Pre-fill kwd_db with the keys that can be found statically in project.
+    Returns the call sites that were resolved, to be passed on to CallTracer.
+    """
+    return StaticKeywordPass(project).run(kwd_db)
+
+
+def infer_dict_access_keywords(kw_fns: ObjectDb, kwd_db: KeywordDb) -> None:
+    """
+    Add the constant keys each function in kw_fns reads from its **kwargs
+    dict (eg, kwargs.get('x')) to kwd_db.
+    """
+    for fn in kw_fns.values():
+        if not isinstance(fn, Function):
+            continue
+        for key in fn.kwargs_key_accesses():
+            kwd_db.append_possibility(fn, key, Evidence.DICT_ACCESS)
@@ -0,0 +1,110 @@
+"""
+Kwargs-focused indexing: modules in which no function takes **kwargs are
+indexed from a shallow scan of their source instead of its AST.
+
+The scan blanks out strings and comments, splits the rest into logical lines
+by counting brackets and line continuations, and finds the def and class
+statements among them, their nesting (by indentation) and their spans.
+Modules with ** in the header of a def statement are left to the full
+indexer. Functions of the other modules are StubFunctions, which parse the
+module if their args or stmts are needed, eg, when they are called by a
+function taking **kwargs.
+"""
+from pathlib import PurePath
+import re
+from .object import (Class, Module, ModuleSource, Object, ObjectCreator, SourceSpan,
+                     StubFunction)
+
+
+_STRING = re.compile(r'''
+    """(?:\\.|[^\\])*?"""|\'\'\'(?:\\.|[^\\])*?\'\'\'
+  | "(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'
+  | \#[^\n]*
+''', re.X | re.S)
+_INDENT = re.compile(r'[ \t\f]*')
+_HEADER = re.compile(r'(async[ \t]+)?(def|class)[ \t]+(\w+)')
+
+
+def _blank_string(m: re.Match) -> str:
+    text = m.group()
+    if text[0] == '#':
+        return ''
+    breaks = text.count('\n')
+    # The lines of a multi-line string continue the same logical line
+    return '(' + '\n' * breaks + ')' if breaks else '""'
+
+
+def code_lines(source: str) -> list[str]:
+    """
+    The lines of source, with comments removed and strings replaced, so
+    that brackets in the lines are those of the code.
+    """
+    return _STRING.sub(_blank_string, source).split('\n')
+
+
+def logical_lines(lines: list[str]) -> list[tuple[int, int]]:
+    """
+    (first line, last line) of the logical lines of code_lines, but blank
+    (and comment) lines.
+    """
+    found = []
+    depth = 0
+    first = None
+    for i, text in enumerate(lines):
+        if first is None:
+            if not text.strip():
+                continue
+            first = i
+        depth += (text.count('(') + text.count('[') + text.count('{')
+                  - text.count(')') - text.count(']') - text.count('}'))
+        if depth <= 0 and not text.endswith('\\'):
+            depth = 0
+            found.append((first + 1, i + 1))
+            first = None
+    if first is not None:
+        found.append((first + 1, len(lines)))
+    return found
+
+
+def stub_module(path: PurePath, source: str, mod_name: str | None = None) -> Module | None:
+    """
+    The module of source, with StubFunctions, or None if one of its def
+    statements has ** in its header, ie, it may take **kwargs.
+    """
+    mod = Module(SourceSpan(path, 0, source.count('\n') + 1),
+                 mod_name or ObjectCreator(path, 0)._mod_name())
+    mod_source = ModuleSource(path)
+    # (indent, object, or None for the blocks of async defs which aren't objects)
+    stack: list[tuple[int, Object | None]] = [(-1, mod)]
+    prev_last = 0
+
+    def close(last: int) -> None:
+        _, ob = stack.pop()
+        if ob is not None:
+            ob.source_span.end_line = last
+
+    lines = code_lines(source)
+    for first, last in logical_lines(lines):
+        text = lines[first - 1]
+        leading = _INDENT.match(text).end()
+        indent = len(text[:leading].expandtabs())
+        while indent <= stack[-1][0]:
+            close(prev_last)
+        prev_last = last
+        header = _HEADER.match(text, leading)
+        if header is None:
+            continue
+        is_async, kind, name = header.groups()
+        if is_async is None and kind == 'def' and '**' in ''.join(lines[first - 1:last]):
+            return None
+        par = next(ob for _, ob in reversed(stack) if ob is not None)
+        if is_async is not None:
+            stack.append((indent, None))
+            continue
+        ss = SourceSpan(path, first, last)
+        ob = Class(ss, name, par) if kind == 'class' else StubFunction(ss, name, mod_source, par)
+        par.append_child(name, ob)
+        stack.append((indent, ob))
+    while len(stack) > 1:
+        close(prev_last)
+    return mod
@@ -1,11 +1,22 @@
 from types import CodeType, FunctionType
-from typing import Any
+from typing import Any, TYPE_CHECKING
+from pathlib import PurePath
+import multiprocessing as mp
 from pyhole.db import KeywordDb
 from pyhole.keyword import CallTracer
 from pyhole.project import Project
 from pyhole.tracer import Tracer
+from pyhole.deferred import CallEventRecorder
+
+if TYPE_CHECKING:
+    # Imported lazily, so that python -m pyhole.daemon doesn't import itself twice
+    from pyhole.daemon import DaemonClient, RemoteCallTracer
 
 projects: list[Project] = []
+# Roots indexed by a daemon, see attach_project
+attached_roots: list[str] = []
+daemon: "DaemonClient | None" = None
+daemon_session: str | None = None
 kwd_db = KeywordDb()
 tracer: Tracer | None = None
 
@@ -36,15 +47,77 @@ def test_case(fn: FunctionType) -> None:
     test_cases.append(case)
 
 
-def exec_cases() -> None:
+def _remote_tracer() -> "RemoteCallTracer":
+    global daemon, daemon_session
+    from pyhole.daemon import DaemonClient, RemoteCallTracer
+
+    if projects:
+        raise RuntimeError('Projects added with add_project and attach_project '
+                           'cannot be mixed')
+    daemon = DaemonClient.connect()
+    if daemon is None:
+        raise RuntimeError('The pyhole daemon is not running anymore')
+    daemon_session = daemon.call('open', roots=attached_roots)['session']
+    return RemoteCallTracer(daemon, daemon_session)
+
+
+def _new_tracer() -> Tracer:
+    dbs = list(map(lambda x: x.db, projects))
+    kw_fns = list(map(lambda x: x.kw_fns, projects))
+    return CallTracer(dbs, kw_fns, kwd_db)
+
+
+def _exec_case_in_worker(index: int) -> list[list]:
+    global tracer, kwd_db
+
+    # The worker is forked, so projects and cases are those of the parent.
+    # Each case gets its own KeywordDb, so that the parent merges results in
+    # the order of the cases whichever worker ran them.
+    kwd_db = KeywordDb()
+    if tracer is None:
+        tracer = _new_tracer()
+    tracer.kwd_db = kwd_db
+    test_cases[index].exec()
+    return kwd_db.to_shard()
+
+
+def _exec_cases_parallel(workers: int) -> None:
+    if attached_roots:
+        raise RuntimeError('Cases against attached projects cannot be executed '
+                           'in parallel')
+    try:
+        ctx = mp.get_context('fork')
+    except ValueError:
+        raise RuntimeError('Executing cases in parallel needs the fork start method')
+    dbs = list(map(lambda x: x.db, projects))
+    with ctx.Pool(workers) as pool:
+        shards = pool.map(_exec_case_in_worker, range(len(test_cases)),
+                          chunksize=max(1, len(test_cases) // (workers * 4)))
+    for shard in shards:
+        kwd_db.merge_shard(shard, dbs)
+
+
+def exec_cases(workers: int = 1) -> None:
+    """
+    Execute the registered cases. With workers > 1, they are spread over a
+    pool of that many forked processes, each tracing with its own tracer over
+    the projects indexed in this process, and the keys are merged into
+    kwd_db in the order of the cases.
+    """
     global tracer, test_cases, projects, kwd_db
 
+    if workers > 1:
+        _exec_cases_parallel(workers)
+        return
     if not tracer:
-        dbs = list(map(lambda x: x.db, projects))
-        kw_fns = list(map(lambda x: x.kw_fns, projects))
-        tracer = CallTracer(dbs, kw_fns, kwd_db)
+        if attached_roots:
+            tracer = _remote_tracer()
+        else:
+            tracer = _new_tracer()
     for case in test_cases:
         case.exec()
+    if isinstance(tracer, CallEventRecorder):
+        tracer.flush()
 
 
 def add_project(project: Project) -> None:
@@ -53,7 +126,34 @@ def add_project(project: Project) -> None:
     projects.append(project)
 
 
+def attach_project(root: PurePath | str) -> bool:
+    """
+    Use the index of root held by a running pyhole daemon instead of building
+    a Project. Returns False if there is no daemon, in which case the project
+    should be added with add_project. The keys are then held by the daemon,
+    see get_attached_report.
+    """
+    from pyhole.daemon import DaemonClient
+    client = DaemonClient.connect()
+    if client is None:
+        return False
+    client.call('register', root=str(root))
+    client.close()
+    attached_roots.append(str(root))
+    return True
+
+
 def get_kwd_db() -> KeywordDb:
     global kwd_db
 
     return kwd_db
+
+
+def get_attached_report() -> dict[str, str]:
+    """
+    The keys found for attached projects, rendered by the daemon: 'rst' as
+    by KeywordDb.render_rst and 'fancy' as by KeywordDb.print_fancy.
+    """
+    if daemon is None:
+        raise RuntimeError('No cases were executed against attached projects')
+    return daemon.call('render', session=daemon_session)
@@ -1,27 +1,104 @@
 import sys
 import re
+import time
+from collections import Counter
 from types import FrameType
+from .utils import boxed
+
+
+class TracerStats:
+    """
+    Counters collected by a tracer created with collect_stats=True.
+    Tracers which don't collect stats pay only for a None check per event.
+    """
+
+    events: Counter[str]
+    functions: Counter[tuple[str, int, str]]
+    call_sites: Counter[tuple[str, int]]
+    trace_line_ns: int
+    enc_fn_hits: int
+    enc_fn_misses: int
+    calls_resolved: int
+    find_fn_failures: int
+
+    def __init__(self) -> None:
+        self.events = Counter()
+        self.functions = Counter()
+        self.call_sites = Counter()
+        self.trace_line_ns = 0
+        self.enc_fn_hits = 0
+        self.enc_fn_misses = 0
+        self.calls_resolved = 0
+        self.find_fn_failures = 0
+
+    def record_event(self, frame: FrameType, event: str) -> None:
+        self.events[event] += 1
+        code = frame.f_code
+        self.functions[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+        if event == "call" and frame.f_back is not None:
+            caller = frame.f_back
+            self.call_sites[(caller.f_code.co_filename, caller.f_lineno)] += 1
+
+    def print_fancy(self, top: int = 10) -> None:
+        print(boxed('TRACER STATS'))
+        for event, cnt in sorted(self.events.items()):
+            print(f'  {event} events: {cnt}')
+        print(f'  time in trace_line: {self.trace_line_ns / 1e6:.2f} ms')
+        print(f'  enclosing function hits/misses: {self.enc_fn_hits}/{self.enc_fn_misses}')
+        print(f'  call expressions resolved: {self.calls_resolved}')
+        print(f'  find_called_fn failures: {self.find_fn_failures}')
+        print()
+        print('  Top call sites:')
+        for (filename, lineno), cnt in self.call_sites.most_common(top):
+            print(f'    {cnt:>10}  {filename}:{lineno}')
+        print('  Top functions:')
+        for (filename, lineno, name), cnt in self.functions.most_common(top):
+            print(f'    {cnt:>10}  {name} ({filename}:{lineno})')
+        print()
 
 
 class Tracer:
+    """
+    Base tracer, subclasses override trace_call, trace_line and trace_return.
+    Subclasses which don't override trace_line only need call and return
+    events, so they are run with sys.setprofile, which never delivers line
+    events, instead of sys.settrace.
+    """
+
     start_tracing: bool
+    stats: TracerStats | None
+    call_only: bool
 
-    def __init__(self):
+    def __init__(self, collect_stats: bool = False):
         self.old_trace_fn = None
+        self.stats = TracerStats() if collect_stats else None
+        self.call_only = type(self).trace_line is Tracer.trace_line
 
     def enable_tracing(self):
-        self.old_trace_fn = sys.gettrace()
-        sys.settrace(self.trace_global)
+        if self.call_only:
+            self.old_trace_fn = sys.getprofile()
+            sys.setprofile(self.profile_global)
+        else:
+            self.old_trace_fn = sys.gettrace()
+            sys.settrace(self.trace_global)
 
     def disable_tracing(self):
-        sys.settrace(self.old_trace_fn)
+        if self.call_only:
+            sys.setprofile(self.old_trace_fn)
+        else:
+            sys.settrace(self.old_trace_fn)
         self.old_trace_fn = None
 
     def _start_tracing(self) -> bool:
         return self.start_tracing
 
     def _trace_line(self, frame: FrameType):
-        self.trace_line(frame)
+        if self.stats is None:
+            self.trace_line(frame)
+        else:
+            start = time.perf_counter_ns()
+            self.trace_line(frame)
+            self.stats.trace_line_ns += time.perf_counter_ns() - start
         return self.trace_global
 
     # Override this
@@ -45,6 +122,8 @@ class Tracer:
         pass
 
     def trace_global(self, frame: FrameType, event: str, _):
+        if self.stats is not None:
+            self.stats.record_event(frame, event)
         if event == "call":
             return self._trace_call(frame)
         if event == "line":
@@ -53,6 +132,17 @@ class Tracer:
             return self._trace_return(frame)
         return self.trace_global
 
+    def profile_global(self, frame: FrameType, event: str, _):
+        # c_call, c_return and c_exception are ignored, like with settrace
+        if event == "call":
+            if self.stats is not None:
+                self.stats.record_event(frame, event)
+            self.trace_call(frame)
+        elif event == "return":
+            if self.stats is not None:
+                self.stats.record_event(frame, event)
+            self.trace_return(frame)
+
 
 class PrintTracer(Tracer):
     """
@@ -62,10 +152,12 @@ class PrintTracer(Tracer):
     print_line: bool
     ignore_patterns: list[re.Pattern]
 
-    def __init__(self, print_line: bool = True, ignore_patterns: list[str] | None = None):
-        super().__init__()
+    def __init__(self, print_line: bool = True, ignore_patterns: list[str] | None = None,
+                 collect_stats: bool = False):
+        super().__init__(collect_stats)
         self.print_line = print_line
-        self.ignore_patterns = [re.compile(pat) for pat in ignore_patterns]
+        self.ignore_patterns = [re.compile(pat)
+                                for pat in ignore_patterns or []]
 
     def _should_ignore_filename(self, name):
         return any(map(lambda pat: pat.match(name), self.ignore_patterns))
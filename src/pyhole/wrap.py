@@ -0,0 +1,152 @@
+from types import FunctionType, ModuleType
+from typing import Any, Callable
+import functools
+import inspect
+import sys
+from .db import KeywordDb, ObjectDb, Position
+from . import Function
+
+
+def _named_params(code) -> frozenset[str]:
+    # Keys bound to named parameters never end up in **kwargs. Positional-only
+    # names can, since they can't be passed by keyword.
+    start = code.co_posonlyargcount
+    end = code.co_argcount + code.co_kwonlyargcount
+    return frozenset(code.co_varnames[start:end])
+
+
+class KwargsWrapper:
+    """
+    Captures the keys actually passed in **kwargs without any tracing. Every
+    **kwargs function of the project found in the loaded modules (as module
+    attributes, or as methods of classes) is replaced by a thin wrapper which
+    records the keys of its **kwargs before calling the original. unpatch
+    puts the originals back.
+    """
+
+    dbs: list[ObjectDb]
+    kw_fns: list[ObjectDb]
+    kwd_db: KeywordDb
+    files: set[str]
+
+    def __init__(self, dbs: ObjectDb | list[ObjectDb],
+                 kw_fns: ObjectDb | list[ObjectDb],
+                 kwd_db: KeywordDb) -> None:
+        self.dbs = dbs if isinstance(dbs, list) else [dbs]
+        self.kw_fns = kw_fns if isinstance(kw_fns, list) else [kw_fns]
+        self.kwd_db = kwd_db
+        self.files = {pos.filename for db in self.dbs for pos in db}
+        # original function => wrapper, so every reference gets the same wrapper
+        self._wrappers: dict[FunctionType, FunctionType] = {}
+        self._wrapped: set[FunctionType] = set()
+        # (module dict or class, name, original value)
+        self._patches: list[tuple[Any, str, Any]] = []
+        self._seen_modules: set[str] = set()
+        self._seen_classes: set[type] = set()
+
+    def _kw_fn(self, fn: FunctionType) -> Function | None:
+        code = getattr(fn, '__code__', None)
+        if code is None:
+            return None
+        pos = Position(code.co_filename, code.co_firstlineno)
+        for db in self.kw_fns:
+            if pos in db:
+                return db[pos]
+        return None
+
+    def _make_wrapper(self, fn: FunctionType, fn_ob: Function) -> FunctionType:
+        named = _named_params(fn.__code__)
+        seen: set[str] = set()
+        kwd_db = self.kwd_db
+
+        def record(kwargs: dict[str, Any]) -> None:
+            for key in kwargs:
+                if key not in seen and key not in named:
+                    seen.add(key)
+                    kwd_db.append_possibility(fn_ob, key)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                record(kwargs)
+                return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            record(kwargs)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def _wrapper_for(self, fn: Any) -> FunctionType | None:
+        if not isinstance(fn, FunctionType) or fn in self._wrapped:
+            return None
+        if fn in self._wrappers:
+            return self._wrappers[fn]
+        fn_ob = self._kw_fn(fn)
+        if fn_ob is None:
+            return None
+        wrapper = self._make_wrapper(fn, fn_ob)
+        self._wrappers[fn] = wrapper
+        self._wrapped.add(wrapper)
+        return wrapper
+
+    def _patch_class(self, cls: type) -> None:
+        if cls in self._seen_classes:
+            return
+        self._seen_classes.add(cls)
+        for name, val in list(cls.__dict__.items()):
+            wrap: Callable[[Any], Any] | None = None
+            if isinstance(val, (staticmethod, classmethod)):
+                wrapper = self._wrapper_for(val.__func__)
+                if wrapper is not None:
+                    wrap = type(val)(wrapper)
+            else:
+                wrap = self._wrapper_for(val)
+            if wrap is not None:
+                self._patches.append((cls, name, val))
+                setattr(cls, name, wrap)
+
+    def _patch_module(self, mod: ModuleType) -> None:
+        mod_dict = mod.__dict__
+        for name, val in list(mod_dict.items()):
+            if isinstance(val, type):
+                if getattr(sys.modules.get(val.__module__), '__file__', None) in self.files:
+                    self._patch_class(val)
+                continue
+            wrapper = self._wrapper_for(val)
+            if wrapper is not None:
+                self._patches.append((mod_dict, name, val))
+                mod_dict[name] = wrapper
+
+    def patch(self) -> None:
+        """
+        Wrap the **kwargs functions of project modules loaded since the last
+        call. It is cheap to call again after more modules have been imported.
+        """
+        for name, mod in list(sys.modules.items()):
+            if name in self._seen_modules or not isinstance(mod, ModuleType):
+                continue
+            if getattr(mod, '__file__', None) not in self.files:
+                continue
+            self._seen_modules.add(name)
+            self._patch_module(mod)
+
+    def unpatch(self) -> None:
+        for container, name, orig in reversed(self._patches):
+            if isinstance(container, dict):
+                container[name] = orig
+            else:
+                setattr(container, name, orig)
+        self._patches.clear()
+        self._wrappers.clear()
+        self._wrapped.clear()
+        self._seen_modules.clear()
+        self._seen_classes.clear()
+
+    def __enter__(self) -> "KwargsWrapper":
+        self.patch()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.unpatch()
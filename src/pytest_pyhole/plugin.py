@@ -1,13 +1,46 @@
 import pytest
+import sys
 
 from pyhole.tracer import Tracer
 from pyhole.keyword import KeywordDb, CallTracer
 from pyhole.project import Project
+from pyhole.static import infer_static_keywords, infer_dict_access_keywords
+from pyhole.instrument import ProbeRecorder
+from pyhole.import_hook import HookManager, instrument_modules
+from pyhole.wrap import KwargsWrapper
+from pyhole.deferred import CallEventRecorder, DeferredCallTracer
+from pyhole.daemon import DaemonClient, RemoteCallTracer, default_socket_path
+from pyhole.impact import ImpactMap, impact_path, functions_by_path, hash_of_test
+from pyhole.results import ResultCache, results_path
+from pyhole.propagate import Propagation
+from pyhole.crawl import DEFAULT_EXCLUDE, Crawler, manifest_path
+from pyhole.cache import FileCache
+from pyhole.object import CallSite
+from pyhole import Function
 from pathlib import PurePath
+from concurrent.futures import Future, ThreadPoolExecutor
 
 
 tracer: Tracer | None = None
+hook_manager: HookManager | None = None
+wrapper: KwargsWrapper | None = None
 kwd_db = KeywordDb()
+active = False
+# Indexing of the project, running while tests are collected
+indexing: Future | None = None
+# Test impact selection (trace and deferred modes)
+impact: ImpactMap | None = None
+prev_impact: ImpactMap | None = None
+changed_fns: set[str] = set()
+project_fns: dict[str, Function] = {}
+results: ResultCache | None = None
+# Daemon client and session, when attached to a daemon
+daemon: DaemonClient | None = None
+daemon_session: str | None = None
+# Tracing of child processes, and the resolver of their events when not
+# attached to a daemon
+propagation: Propagation | None = None
+child_resolver: DeferredCallTracer | None = None
 
 
 def pytest_addoption(parser):
@@ -23,32 +56,331 @@ def pytest_addoption(parser):
         type=PurePath,
         default=PurePath('kwargs.rst')
     )
+    parser.addoption(
+        '--pyhole-mode',
+        choices=['trace', 'deferred', 'instrument', 'wrap'],
+        default='trace',
+        help='How to collect keys: trace tests with sys.settrace, record call '
+             'events and resolve them after each test (deferred), instrument '
+             'project modules at import time, or wrap the **kwargs functions of '
+             'loaded project modules (only records the keys each one receives)',
+    )
+    parser.addoption(
+        '--pyhole-static',
+        action='store_true',
+        default=False,
+        help='Find keys statically (calls and **kwargs dict accesses) before tracing, '
+             'and only trace the call sites left over',
+    )
+    parser.addoption(
+        '--pyhole-stats',
+        action='store_true',
+        default=False,
+        help='Collect and print tracer statistics',
+    )
+    parser.addoption(
+        '--pyhole-affected',
+        action='store_true',
+        default=False,
+        help='Only trace the tests which changed, or reached functions changed, '
+             'since the previous run, and reuse the keys stored for the other tests',
+    )
+    parser.addoption(
+        '--pyhole-daemon',
+        action='store_true',
+        default=False,
+        help='Attach to a running pyhole daemon (python -m pyhole.daemon) instead of '
+             'indexing the project, in trace or deferred mode. Keys are then found '
+             'as in deferred mode, by the daemon',
+    )
+    parser.addoption(
+        '--pyhole-results-cache',
+        action='store_true',
+        default=False,
+        help='Start from the keys of earlier runs for functions which are unchanged, '
+             'along with the functions their keys were found through, and stop '
+             'looking for more keys of those',
+    )
+    parser.addoption(
+        '--pyhole-propagate',
+        action='store_true',
+        default=False,
+        help='Also trace Python subprocesses and multiprocessing children of the '
+             'tests, which record call events over the function table of the '
+             'project instead of indexing it',
+    )
+    parser.addoption(
+        '--pyhole-exclude',
+        action='append',
+        default=[],
+        metavar='GLOB',
+        help='Leave out project files and directories matching GLOB, matched against '
+             'their name, or their path relative to the project root if it has a / '
+             '(repeatable, in addition to ' + ', '.join(DEFAULT_EXCLUDE) + ')',
+    )
+    parser.addoption(
+        '--pyhole-manifest',
+        action='store_true',
+        default=False,
+        help='Keep a manifest of the project directories between runs, and only '
+             'list again those which changed',
+    )
+
+
+def _rst_path(config) -> PurePath:
+    path = config.getoption("--rst-path")
+    if isinstance(path, list):
+        path = path[0]
+    return path
+
+
+def _start_instrumenting(project: Project) -> None:
+    global hook_manager
+    files = {pos.filename for pos in project.db}
+    recorder = ProbeRecorder(project.db, project.kw_fns, kwd_db, files)
+    hook_manager = instrument_modules(recorder)
+    hook_manager.__enter__()
+    imported = [name for name, mod in list(sys.modules.items())
+                if getattr(mod, '__file__', None) in files]
+    if imported:
+        print(f'pyhole: {len(imported)} project modules were imported before '
+              f'instrumentation started and are not instrumented: {", ".join(imported)}')
+
+
+def _attach_daemon(config, root: PurePath) -> bool:
+    global tracer, daemon, daemon_session, propagation
+    if config.getoption('--pyhole-mode') not in ('trace', 'deferred'):
+        print('pyhole: --pyhole-daemon only works in trace and deferred modes')
+        return False
+    daemon = DaemonClient.connect()
+    if daemon is None:
+        print(f'pyhole: no daemon listening on {default_socket_path()}, indexing locally')
+        return False
+    if config.getoption('--pyhole-manifest'):
+        print('pyhole: the daemon keeps the listings of project directories itself, '
+              'ignoring --pyhole-manifest')
+    daemon_session = daemon.call('open', roots=[str(root)],
+                                 static=config.getoption('--pyhole-static'),
+                                 exclude=DEFAULT_EXCLUDE + config.getoption('--pyhole-exclude'))['session']
+    tracer = RemoteCallTracer(daemon, daemon_session,
+                              collect_stats=config.getoption('--pyhole-stats'))
+    if config.getoption('--pyhole-propagate'):
+        propagation = Propagation(tracer.table, lambda events: daemon.call(
+            'events', session=daemon_session, events=events))
+        propagation.start()
+    return True
+
+
+def _start_propagation(project: Project, static_calls) -> None:
+    global propagation, child_resolver
+    child_resolver = DeferredCallTracer(project.db, project.kw_fns, kwd_db,
+                                        static_calls=static_calls)
+    if results is not None:
+        child_resolver.saturated = tracer.saturated
+    propagation = Propagation.resolving_with(child_resolver)
+    propagation.start()
+
+
+def _collect_children(db: KeywordDb, reached: set[Function] | None = None) -> None:
+    if propagation is None:
+        return
+    if child_resolver is not None:
+        child_resolver.kwd_db = db
+        child_resolver.reached = reached
+        child_resolver.forget_resolved()
+    propagation.collect()
+
+
+# Options which only work with a tracer, in trace and deferred modes
+TRACER_OPTIONS = ['--pyhole-affected', '--pyhole-results-cache']
+
+
+def _refuse_tracer_options(config) -> None:
+    if config.getoption('--pyhole-mode') in ('trace', 'deferred'):
+        return
+    for option in TRACER_OPTIONS:
+        if config.getoption(option):
+            print(f'pyhole: {option} only works in trace and deferred modes, ignoring it')
 
 
 def pytest_sessionstart(session):
-    global tracer, kwd_db
+    global active, indexing
     root = session.config.getoption("--project-root")
     if root is not None:
-        project = Project(root[0])
-        tracer = CallTracer(project.db, project.kw_fns, kwd_db)
+        active = True
+        _refuse_tracer_options(session.config)
+        if session.config.getoption('--pyhole-daemon') and _attach_daemon(session.config, root[0]):
+            return
+        if session.config.getoption('--pyhole-mode') == 'instrument':
+            # The import hook must be in place before collection imports project modules
+            _finish_set_up(session.config, *_set_up(session.config, root[0]))
+            return
+        # Index while tests are collected, see _wait_for_index
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pyhole-index')
+        indexing = executor.submit(_set_up, session.config, root[0])
+        executor.shutdown(wait=False)
+
+
+def _wait_for_index(config) -> None:
+    global indexing, active
+    if indexing is not None:
+        future, indexing = indexing, None
+        try:
+            project, static_calls = future.result()
+        except Exception as e:
+            # Tests would run untraced, and kwargs.rst be written empty
+            active = False
+            pytest.exit(f'pyhole: indexing the project failed: {e!r}',
+                        returncode=pytest.ExitCode.INTERNAL_ERROR)
+        _finish_set_up(config, project, static_calls)
+
+
+def _set_up(config, root: PurePath) -> tuple[Project, set[CallSite] | None]:
+    """
+    Index the project and set up the tracer, off the main thread unless in
+    instrument mode. Returns the project and the statically resolved calls
+    for _finish_set_up.
+    """
+    global tracer, wrapper
+    crawler = Crawler(root, DEFAULT_EXCLUDE + config.getoption('--pyhole-exclude'))
+    if config.getoption('--pyhole-manifest'):
+        crawler.load_manifest(manifest_path(_rst_path(config)))
+    project = Project(root, crawler=crawler)
+    if config.getoption('--pyhole-manifest'):
+        crawler.save_manifest(manifest_path(_rst_path(config)))
+    static_calls = None
+    if config.getoption('--pyhole-static'):
+        static_calls = infer_static_keywords(project, kwd_db)
+        infer_dict_access_keywords(project.kw_fns, kwd_db)
+    match config.getoption('--pyhole-mode'):
+        case 'instrument':
+            _start_instrumenting(project)
+            return project, static_calls
+        case 'wrap':
+            wrapper = KwargsWrapper(project.db, project.kw_fns, kwd_db)
+            return project, static_calls
+    collect_stats = config.getoption('--pyhole-stats')
+    if config.getoption('--pyhole-mode') == 'deferred':
+        tracer = DeferredCallTracer(project.db, project.kw_fns, kwd_db,
+                                    static_calls=static_calls,
+                                    collect_stats=collect_stats)
+    else:
+        tracer = CallTracer(project.db, project.kw_fns, kwd_db,
+                            collect_stats=collect_stats, static_calls=static_calls,
+                            line_plan=project.line_plan(static_calls))
+    _start_impact(config, project)
+    if config.getoption('--pyhole-results-cache'):
+        _warm_start(config)
+    return project, static_calls
+
+
+def _finish_set_up(config, project: Project, static_calls: set[CallSite] | None) -> None:
+    # On the main thread, since propagation sets environment variables
+    if config.getoption('--pyhole-propagate'):
+        _start_propagation(project, static_calls)
+
+
+def _start_impact(config, project: Project) -> None:
+    global impact, prev_impact, changed_fns, project_fns
+    impact = ImpactMap()
+    project_fns = functions_by_path(project.db)
+    if config.getoption('--pyhole-affected'):
+        prev_impact = ImpactMap.load(impact_path(_rst_path(config)))
+        changed_fns = prev_impact.changed_functions(project_fns, FileCache())
+
+
+def _warm_start(config) -> None:
+    global results
+    results = ResultCache.load(results_path(_rst_path(config)))
+    tracer.saturated = results.warm_start(project_fns, FileCache(), kwd_db)
+
+
+def pytest_sessionfinish(session):
+    global hook_manager, propagation
+    _wait_for_index(session.config)
+    if propagation is not None:
+        _collect_children(kwd_db)
+        propagation.stop()
+        propagation = None
+    if hook_manager is not None:
+        hook_manager.__exit__()
+        hook_manager = None
+    if wrapper is not None:
+        wrapper.unpatch()
+    if impact is not None:
+        impact.update_hashes(project_fns, FileCache())
+        impact.save(impact_path(_rst_path(session.config)))
+    if results is not None:
+        results.update(kwd_db, FileCache())
+        results.save(results_path(_rst_path(session.config)))
+
+
+def _traced_call(test_id: str, source_hash: str):
+    # Keys of the test are collected apart, to be stored in the impact map
+    test_db = KeywordDb()
+    tracer.kwd_db = test_db
+    tracer.reached = set()
+    if isinstance(tracer, DeferredCallTracer):
+        tracer.forget_resolved()
+    tracer.enable_tracing()
+    yield
+    tracer.disable_tracing()
+    if isinstance(tracer, CallEventRecorder):
+        tracer.flush()
+    _collect_children(test_db, tracer.reached)
+    impact.record(test_id, tracer.reached, test_db, source_hash)
+    kwd_db.merge(test_db)
 
 
 @pytest.hookimpl(hookwrapper=True)
-def pytest_pyfunc_call():
+def pytest_pyfunc_call(pyfuncitem):
     global tracer
-    if tracer is not None:
+    _wait_for_index(pyfuncitem.config)
+    if wrapper is not None:
+        # Picks up project modules imported since the previous test
+        wrapper.patch()
+    if tracer is None:
+        _ = yield
+        _collect_children(kwd_db)
+        return
+    if impact is None:
         tracer.enable_tracing()
-    _ = yield
-    if tracer is not None:
+        _ = yield
         tracer.disable_tracing()
+        if isinstance(tracer, CallEventRecorder):
+            tracer.flush()
+        _collect_children(kwd_db)
+        return
+    test_id = pyfuncitem.nodeid
+    source_hash = hash_of_test(pyfuncitem.obj)
+    if prev_impact is not None and not prev_impact.is_affected(test_id, changed_fns, source_hash):
+        # Still run, but untraced
+        prev_impact.replay(test_id, project_fns, kwd_db)
+        impact.carry(test_id, prev_impact)
+        _ = yield
+        return
+    yield from _traced_call(test_id, source_hash)
+
+
+def _daemon_summary(config) -> None:
+    global daemon, daemon_session
+    report = daemon.call('render', session=daemon_session)
+    print(report['fancy'], end='')
+    with open(_rst_path(config), 'w') as f:
+        f.write(report['rst'])
+    daemon.call('close', session=daemon_session)
+    daemon.close()
+    daemon, daemon_session = None, None
 
 
 def pytest_terminal_summary(config):
     global kwd_db
-    if tracer is not None:
-        kwd_db.print_fancy()
-        path = config.getoption("--rst-path")
-        if isinstance(path, list):
-            path = path[0]
-        with open(path, 'w') as f:
-            kwd_db.render_rst(f)
+    if active:
+        if daemon is not None:
+            _daemon_summary(config)
+        else:
+            kwd_db.print_fancy()
+            with open(_rst_path(config), 'w') as f:
+                kwd_db.render_rst(f)
+        if tracer is not None and tracer.stats is not None:
+            tracer.stats.print_fancy()
@@ -0,0 +1,68 @@
+import os
+from pyhole.crawl import Crawler
+from pyhole.project import Project
+
+
+def _package(path, *modules):
+    path.mkdir(parents=True)
+    (path / '__init__.py').write_text('def init(**kw):\n    pass\n')
+    for name in modules:
+        (path / f'{name}.py').write_text(f'def {name}(**kw):\n    pass\n')
+
+
+def _modules(project):
+    return sorted(str(ob.full_path()) for ob in project.db.values() if ob.ob_type() == 'mod')
+
+
+def _age(root):
+    # Older than the manifest's racy window
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (1_000_000_000, 1_000_000_000))
+
+
+def test_exclude_globs(tmp_path):
+    pkg = tmp_path / 'pkg'
+    _package(pkg, 'core', 'test_core')
+    _package(pkg / 'tests', 'test_api')
+    _package(pkg / 'vendor')
+    _package(pkg / 'vendor' / 'six')
+    _package(pkg / 'sub' / 'vendor')
+    (pkg / 'sub' / '__init__.py').write_text('')
+    crawler = Crawler(pkg, ['tests', 'test_*.py', 'vendor/six'])
+    assert _modules(Project(pkg, crawler=crawler)) == \
+        ['pkg', 'pkg.core', 'pkg.sub', 'pkg.sub.vendor', 'pkg.vendor']
+
+
+def test_symlink_loop(tmp_path):
+    pkg = tmp_path / 'pkg'
+    _package(pkg / 'sub', 'mod')
+    (pkg / '__init__.py').write_text('')
+    os.symlink(pkg, pkg / 'sub' / 'back')
+    assert _modules(Project(pkg)) == ['pkg', 'pkg.sub', 'pkg.sub.mod']
+
+
+def test_manifest(tmp_path):
+    pkg = tmp_path / 'pkg'
+    _package(pkg / 'sub', 'mod')
+    (pkg / '__init__.py').write_text('')
+    _age(pkg)
+    crawler = Crawler(pkg)
+    Project(pkg, crawler=crawler)
+    assert crawler.listed == 2
+    path = tmp_path / 'kwargs.manifest.json'
+    crawler.save_manifest(path)
+
+    crawler = Crawler(pkg)
+    crawler.load_manifest(path)
+    assert _modules(Project(pkg, crawler=crawler)) == ['pkg', 'pkg.sub', 'pkg.sub.mod']
+    assert crawler.listed == 0
+
+    # Only the changed directory is listed again
+    (pkg / 'sub' / 'new.py').write_text('')
+    assert 'pkg.sub.new' in _modules(Project(pkg, crawler=crawler))
+    assert crawler.listed == 1
+
+    # Saved with other exclude globs
+    crawler = Crawler(pkg, ['tests'])
+    crawler.load_manifest(path)
+    assert crawler.manifest == {}
@@ -0,0 +1,85 @@
+import tempfile
+import threading
+import types
+import os
+import pytest
+from pyhole.crawl import DEFAULT_EXCLUDE
+from pyhole.daemon import DaemonClient, IndexedRoot, PyholeDaemon, RemoteCallTracer
+
+
+PKG_INIT = """
+def request(method, url, **kwargs):
+    return send(url, **kwargs)
+
+
+def send(url, timeout=None, *, stream=False):
+    return url
+
+
+def get(url, **kwargs):
+    return request('get', url, stream=True, **kwargs)
+"""
+
+
+@pytest.fixture
+def daemon():
+    # Unix socket paths are short, so not under tmp_path
+    sock_dir = tempfile.mkdtemp(prefix='pyhole-')
+    server = PyholeDaemon(os.path.join(sock_dir, 'd.sock'), refresh_interval=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    client = DaemonClient.connect(server.socket_path)
+    yield client
+    client.close()
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    os.rmdir(sock_dir)
+
+
+def test_daemon_session(daemon, tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    path = pkg / '__init__.py'
+    path.write_text(PKG_INIT)
+    assert daemon.call('register', root=str(pkg))['kw_fns'] == 2
+    assert daemon.call('is_kw_fn', root=str(pkg), filename=str(path), line=2)['result']
+    assert daemon.call('plan', root=str(pkg), filename=str(path), line=3)['lines'] == [3]
+
+    session = daemon.call('open', roots=[str(pkg)])['session']
+    tracer = RemoteCallTracer(daemon, session)
+    mod = types.ModuleType('pkg')
+    exec(compile(path.read_text(), str(path), 'exec'), mod.__dict__)
+    tracer.enable_tracing()
+    mod.get('url', timeout=1)
+    tracer.disable_tracing()
+    tracer.flush()
+    shard = daemon.call('keywords', session=session)['shard']
+    assert sorted((line, key) for _, line, key, _, _ in shard) == \
+        [(2, 'stream'), (2, 'timeout'), (10, 'timeout')]
+    assert '* stream' in daemon.call('render', session=session)['rst']
+
+    # Changed files are re-indexed
+    path.write_text(PKG_INIT + '\n\ndef post(**kwargs):\n    pass\n')
+    assert daemon.call('register', root=str(pkg))['kw_fns'] == 3
+
+
+def test_refresh_only_listed(daemon, tmp_path):
+    pkg = tmp_path / 'pkg'
+    (pkg / 'vendor').mkdir(parents=True)
+    (pkg / '.venv').mkdir()
+    (pkg / '__init__.py').write_text(PKG_INIT)
+    (pkg / 'vendor' / '__init__.py').write_text('def vendored(**kw):\n    pass\n')
+    (pkg / '.venv' / 'site.py').write_text('')
+    entry = IndexedRoot(str(pkg), DEFAULT_EXCLUDE + ['vendor'])
+    assert len(entry.project.kw_fns) == 2
+    # Excluded from the index, so not checked
+    (pkg / '.venv' / 'site.py').write_text('x = 1\n')
+    (pkg / 'vendor' / '__init__.py').write_text('')
+    assert not entry.refresh(0)
+    (pkg / 'api.py').write_text('def api(**kw):\n    pass\n')
+    assert entry.refresh(0)
+    assert len(entry.project.kw_fns) == 3
+
+    assert daemon.call('register', root=str(pkg))['kw_fns'] == 3
+    assert daemon.call('register', root=str(pkg), exclude=['api.py'])['kw_fns'] == 2
@@ -0,0 +1,48 @@
+import pytest
+from pyhole.keyword import nearest_enclosing_function
+from pyhole.db import Position
+from pyhole.project import Project
+
+np = pytest.importorskip('numpy')
+
+
+PKG_INIT = """
+def outer(x):
+    def inner(y):
+        return y
+
+    return inner(x)
+
+
+class Thing:
+    attr = 1
+
+    def method(self):
+        pass
+"""
+
+
+def test_batch_resolution(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    path = str(pkg / '__init__.py')
+    (pkg / '__init__.py').write_text(PKG_INIT)
+    (pkg / 'other.py').write_text('def f():\n    pass\n')
+    project = Project(pkg)
+    index = project.db.function_index()
+
+    starts, ends, ids = index.file_arrays(path)
+    assert [index.functions[i].name for i in ids] == ['outer', 'inner', 'method']
+    assert list(starts) == [2, 3, 12]
+
+    fid = index.file_id(path)
+    lines = np.array([1, 2, 4, 6, 9, 10, 13])
+    names = [index.functions[i].name if i >= 0 else None
+             for i in index.resolve(np.full(len(lines), fid), lines)]
+    assert names == [None, 'outer', 'inner', 'outer', None, None, 'method']
+    # Unknown files resolve to -1, ids are global across files
+    other_id = index.file_id(str(pkg / 'other.py'))
+    res = index.resolve([index.file_id('missing.py'), other_id], [1, 2])
+    assert res[0] == -1 and index.functions[res[1]].name == 'f'
+    # Agrees with the one at a time lookup inside the innermost function
+    assert nearest_enclosing_function(Position(path, 4), project.db).name == 'inner'
@@ -0,0 +1,105 @@
+import types
+from pyhole.db import KeywordDb
+from pyhole.deferred import DeferredCallTracer, EventBuffer
+from pyhole.project import Project
+
+
+PKG_INIT = """
+def request(method, url, **kwargs):
+    return send(url,
+                **kwargs)
+
+
+def send(url, timeout=None, *, stream=False, verify=True):
+    return url
+
+
+def get(url, **kwargs):
+    return request('get', url, stream=True, **kwargs)
+"""
+
+
+def test_event_buffer():
+    buf = EventBuffer(capacity=2)
+    assert not buf.append(0, 3, 1, ('a',))
+    assert buf.append(0, 3, 1, ('a',))
+    assert buf.drain() == {(0, 3, 1, 1)}
+    assert buf.keys[1] == ('a',)
+    assert buf.size == 0
+
+
+def test_deferred_tracer(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    path = pkg / '__init__.py'
+    path.write_text(PKG_INIT)
+    project = Project(pkg)
+    kwd_db = KeywordDb()
+    # Small enough to flush while tracing
+    tracer = DeferredCallTracer(project.db, project.kw_fns, kwd_db, capacity=2)
+    assert tracer.call_only
+
+    mod = types.ModuleType('pkg')
+    exec(compile(path.read_text(), str(path), 'exec'), mod.__dict__)
+    tracer.enable_tracing()
+    try:
+        for _ in range(3):
+            mod.get('url', timeout=1)
+    finally:
+        tracer.disable_tracing()
+    tracer.flush()
+    found = {fn.name: sorted(kwds) for fn, kwds in kwd_db.items()}
+    assert found == {
+        'get': ['timeout'],
+        'request': ['stream', 'timeout', 'verify'],
+    }
+
+
+PKG_CALLBACKS = """
+def sort_key(x, **opts):
+    return x
+
+
+def sort(items):
+    return sorted(items, key=sort_key, reverse=True)
+
+
+def logged(func):
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def fetch(url, **options):
+    return url
+
+
+fetch = logged(fetch)
+
+
+def get(url):
+    return fetch(url, timeout=1)
+"""
+
+
+def test_calls_through_other_functions(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    path = pkg / '__init__.py'
+    path.write_text(PKG_CALLBACKS)
+    project = Project(pkg)
+    kwd_db = KeywordDb()
+    tracer = DeferredCallTracer(project.db, project.kw_fns, kwd_db)
+
+    mod = types.ModuleType('pkg')
+    exec(compile(path.read_text(), str(path), 'exec'), mod.__dict__)
+    tracer.enable_tracing()
+    try:
+        mod.sort([2, 1])
+        mod.get('url')
+    finally:
+        tracer.disable_tracing()
+    tracer.flush()
+    found = {fn.name: sorted(kwds) for fn, kwds in kwd_db.items()}
+    # sorted calls sort_key, not sort, the wrapper calls fetch
+    assert found == {'fetch': ['timeout'], 'wrapper': ['timeout']}
@@ -0,0 +1,58 @@
+import types
+from pyhole import test_decorator
+from pyhole.db import KeywordDb
+from pyhole.project import Project
+
+
+PKG_INIT = """
+def request(method, url, **kwargs):
+    return send(url, **kwargs)
+
+
+def send(url, timeout=None, *, stream=False, verify=True):
+    return url
+
+
+def get(url, **kwargs):
+    return request('get', url, **kwargs)
+"""
+
+CASES = """
+def get_timeout():
+    mod.get('url', timeout=1)
+
+
+def get_stream():
+    mod.get('url', stream=True)
+
+
+def request_verify():
+    mod.request('post', 'url', verify=False)
+"""
+
+
+def test_exec_cases_parallel(tmp_path, monkeypatch):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    path = pkg / '__init__.py'
+    path.write_text(PKG_INIT)
+    mod = types.ModuleType('pkg')
+    exec(compile(path.read_text(), str(path), 'exec'), mod.__dict__)
+
+    # Cases are executed as module level code, so no closures
+    cases = {'mod': mod}
+    exec(CASES, cases)
+
+    def run(workers):
+        monkeypatch.setattr(test_decorator, 'projects', [Project(pkg)])
+        monkeypatch.setattr(test_decorator, 'test_cases', [])
+        monkeypatch.setattr(test_decorator, 'kwd_db', KeywordDb())
+        monkeypatch.setattr(test_decorator, 'tracer', None)
+        for name in ('get_timeout', 'get_stream', 'request_verify'):
+            test_decorator.test_case(cases[name])
+        test_decorator.exec_cases(workers=workers)
+        return [(fn.name, sorted(kwds)) for fn, kwds in test_decorator.get_kwd_db().items()]
+
+    found = run(workers=3)
+    assert found == [('get', ['stream', 'timeout']), ('request', ['stream', 'timeout', 'verify'])]
+    assert found == run(workers=1)
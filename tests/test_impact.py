@@ -0,0 +1,48 @@
+from pyhole.cache import FileCache
+from pyhole.db import KeywordDb
+from pyhole.impact import ImpactMap, functions_by_path, hash_of_test
+from pyhole.project import Project
+
+
+def test_impact_map(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    init = pkg / '__init__.py'
+    init.write_text('def a(**kw):\n    return kw\n\n\ndef b(**kw):\n    return kw\n')
+    fns = functions_by_path(Project(pkg).db)
+    kwd_db = KeywordDb()
+    kwd_db.append_possibility(fns['pkg.a'], 'x')
+
+    impact = ImpactMap()
+    impact.record('test_a', [fns['pkg.a']], kwd_db, 'hash-a')
+    impact.record('test_b', [fns['pkg.b']], KeywordDb())
+    impact.update_hashes(fns, FileCache())
+    path = tmp_path / 'kwargs.impact.json'
+    impact.save(path)
+
+    init.write_text('def a(**kw):\n    return kw\n\n\ndef b(**kw):\n    return dict(kw)\n')
+    fns = functions_by_path(Project(pkg).db)
+    prev = ImpactMap.load(path)
+    changed = prev.changed_functions(fns, FileCache())
+    assert changed == {'pkg.b'}
+    assert not prev.is_affected('test_a', changed, 'hash-a')
+    # Its own source changed, eg, to pass another key
+    assert prev.is_affected('test_a', changed, 'edited')
+    assert prev.is_affected('test_b', changed)
+    assert prev.is_affected('test_new', changed)
+
+    replayed = KeywordDb()
+    prev.replay('test_a', fns, replayed)
+    assert [(fn.name, kwds) for fn, kwds in replayed.items()] == [('a', ['x'])]
+
+
+def test_hash_of_test():
+    def test_one():
+        pass
+
+    def test_two():
+        return 2
+
+    assert hash_of_test(test_one) == hash_of_test(test_one)
+    assert hash_of_test(test_one) != hash_of_test(test_two)
+    assert hash_of_test(len) == ''
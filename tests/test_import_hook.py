@@ -0,0 +1,87 @@
+import sys
+from importlib import machinery
+from pyhole.import_hook import PyholeMetaPathFinder, PyholeSourceFileLoader
+
+
+class Finder:
+    def __init__(self, spec):
+        self.spec = spec
+        self.calls = 0
+
+    def find_spec(self, fullname, path, target=None):
+        self.calls += 1
+        return self.spec
+
+
+class LegacyFinder:
+    def find_module(self, fullname, path=None):
+        return None
+
+
+class Project:
+    def __init__(self):
+        self.added = []
+
+    def add_file(self, path, fullname):
+        self.added.append((path, fullname))
+
+
+def file_spec(loader_type, path='/src/pkg/__init__.py'):
+    return machinery.ModuleSpec('pkg', loader_type('pkg', path), origin=path)
+
+
+def test_found_spec(monkeypatch):
+    spec = file_spec(machinery.SourceFileLoader)
+    later = Finder(spec)
+    hook = PyholeMetaPathFinder(None)
+    monkeypatch.setattr(sys, 'meta_path', [hook, Finder(None), later])
+    # Nothing to add or instrument, the spec is returned as found
+    assert hook.find_spec('pkg', None) is spec
+    assert type(spec.loader) is machinery.SourceFileLoader
+    assert later.calls == 1
+    assert hook.find_spec('other', None) is spec
+    # Modules outside of packages, and pyhole itself, are left alone
+    hook.packages = {'other'}
+    assert hook.find_spec('pkg', None) is None
+    assert hook.find_spec('pyhole.db', None) is None
+    assert later.calls == 2
+
+
+def test_legacy_finder(monkeypatch):
+    later = Finder(file_spec(machinery.SourceFileLoader))
+    hook = PyholeMetaPathFinder(Project())
+    monkeypatch.setattr(sys, 'meta_path', [hook, LegacyFinder(), later])
+    assert hook.find_spec('pkg', None) is None
+    assert later.calls == 0
+
+
+def test_pathless_specs(monkeypatch):
+    project = Project()
+    hook = PyholeMetaPathFinder(project)
+    namespace = machinery.ModuleSpec('pkg', None, is_package=True)
+    builtin = machinery.ModuleSpec('pkg', machinery.BuiltinImporter, origin='built-in')
+    for spec in [namespace, builtin]:
+        loader = spec.loader
+        monkeypatch.setattr(sys, 'meta_path', [hook, Finder(spec)])
+        assert hook.find_spec('pkg', None) is spec
+        assert spec.loader is loader
+    assert project.added == []
+
+
+def test_wraps_source_loaders(monkeypatch):
+    project = Project()
+    hook = PyholeMetaPathFinder(project)
+    source = file_spec(machinery.SourceFileLoader)
+    monkeypatch.setattr(sys, 'meta_path', [hook, Finder(source)])
+    assert hook.find_spec('pkg', None) is source
+    assert type(source.loader) is PyholeSourceFileLoader
+    assert source.loader.project is project and source.loader.recorder is None
+    # Added from the code the loader compiles, not from the file
+    assert project.added == []
+
+    path = '/src/pkg/__init__.pyc'
+    sourceless = file_spec(machinery.SourcelessFileLoader, path)
+    monkeypatch.setattr(sys, 'meta_path', [hook, Finder(sourceless)])
+    assert hook.find_spec('pkg', None) is sourceless
+    assert type(sourceless.loader) is machinery.SourcelessFileLoader
+    assert project.added == [(path, 'pkg')]
@@ -0,0 +1,41 @@
+import types
+from pyhole.db import KeywordDb
+from pyhole.instrument import ProbeRecorder, instrumented_code
+from pyhole.project import Project
+
+
+PKG_INIT = """
+def request(method, url, **kwargs):
+    '''Docstring stays first'''
+    return send(url, **kwargs)
+
+
+def send(url, timeout=None, *, stream=False, verify=True):
+    return url
+
+
+def get(url, **kwargs):
+    return request('get', url, stream=True, **kwargs)
+"""
+
+
+def test_instrumented_module(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    path = pkg / '__init__.py'
+    path.write_text(PKG_INIT)
+    project = Project(pkg)
+    kwd_db = KeywordDb()
+    recorder = ProbeRecorder(project.db, project.kw_fns, kwd_db)
+
+    mod = types.ModuleType('pkg')
+    recorder.install(mod.__dict__)
+    exec(instrumented_code(str(path)), mod.__dict__)
+    assert mod.request.__doc__ == 'Docstring stays first'
+
+    mod.get('url', timeout=1)
+    found = {fn.name: kwds for fn, kwds in kwd_db.items()}
+    assert found == {
+        'get': ['timeout'],
+        'request': ['stream', 'timeout', 'verify'],
+    }
@@ -0,0 +1,47 @@
+import sys
+from pyhole.keyword import FrameSymbolTable, SymbolKind
+from pyhole.project import Project
+
+
+GLOBAL_THING = object()
+
+
+def test_frame_symbol_table():
+    local_thing = object()
+    sym_tab = FrameSymbolTable(sys._getframe())
+
+    assert sym_tab.lookup('GLOBAL_THING') == (GLOBAL_THING, SymbolKind.GLOB)
+    assert sym_tab.lookup('len') == (len, SymbolKind.BUILTIN)
+    assert sym_tab.lookup('not_a_name') == (None, SymbolKind.NOT_FOUND)
+    # Globals and builtins don't need the frame's locals
+    assert sym_tab._loc is None
+
+    assert sym_tab.lookup('local_thing') == (local_thing, SymbolKind.LOC)
+    assert sym_tab._loc is not None
+
+
+def test_line_plan(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text("""
+def target(a, **kwargs):
+    return a
+
+
+def caller(x, **kw):
+    y = len(x)
+    target(y, flag=True)
+    other(y, flag=True)
+    return other(y, **kw)
+
+
+def other(a, flag=False, **_):
+    print(a)
+    return target(a)
+""")
+    project = Project(pkg)
+    plan = project.line_plan()
+    fns = {ob.name: ob for ob in project.db.values() if ob.name in ('caller', 'other')}
+    # Calls to **kwargs functions by name with keywords, and forwarding **kw
+    assert plan.lines_of(fns['caller']) == {8, 9, 10}
+    assert plan.lines_of(fns['other']) == frozenset()
@@ -1,5 +1,7 @@
 import ast
 import pathlib
+import pytest
+import types
 import pyhole.object as pho
 
 
@@ -57,3 +59,170 @@ class Thing:
     assert isinstance(cls, pho.Class)
     assert cls.name == "Thing"
     assert len(cls.children) == 2
+
+
+def test_kwargs_key_accesses():
+    code = """
+def func(a, **kw):
+    x = kw['first']
+    if 'second' in kw:
+        kw.pop('third', None)
+    y = kw.get('fourth') or kw.get(a)
+    kw['stored'] = 1
+
+    def inner(**kw):
+        return kw.get('inner')
+    return [kw.get('first') for _ in range(2)]
+"""
+    mod = root_object(code)
+    fn = mod.children['func']
+    assert fn.kwargs_key_accesses() == ['first', 'second', 'third', 'fourth']
+
+
+def _tree(ob: pho.Object, path: str = '') -> list:
+    path = f'{path}.{ob.name}'
+    entry = [(path, ob.ob_type(), ob.source_span.start_line, ob.source_span.end_line)]
+    for child in ob.children.values():
+        entry.extend(_tree(child, path))
+    return entry
+
+
+@pytest.mark.parametrize('positions', [True, False])
+def test_code_objects(tmp_path, monkeypatch, positions):
+    from pyhole.project import mod_from_code, mod_from_file
+
+    # Without co_positions (before 3.11), spans come from co_lines
+    monkeypatch.setattr(pho, '_HAS_POSITIONS', positions and pho._HAS_POSITIONS)
+
+    code = """
+import functools
+
+if True:
+    def dup(a, **kw):
+        pass
+else:
+    pass
+
+
+@functools.cache
+def outer(a, *args, b=1, **opts):
+    def inner(**kw):
+        return kw
+    return [lambda: x for x in args]
+
+
+class Thing(
+    object
+):
+    @property
+    def prop(self):
+        return 1
+
+    async def run(self):
+        def callback(**kwargs):
+            pass
+"""
+    path = tmp_path / 'simple.py'
+    path.write_text(code)
+    mod = mod_from_code(compile(code, str(path), 'exec'), str(path))
+    assert _tree(mod) == _tree(mod_from_file(str(path)))
+
+    outer = mod.children['outer']
+    assert isinstance(outer, pho.CodeFunction)
+    # Decorated, the span starts at the def line anyway
+    assert outer.source_span.start_line == 12
+    assert outer.get_kwargs_name() == 'opts'
+    assert 'callback' in mod.children['Thing'].children
+    # The AST is only needed for these
+    assert [p.name for p in outer.get_formal_params()] == ['a', 'b']
+    assert list(outer.stmts) == [15]
+
+
+def test_statements_built_while_visiting():
+    code = """
+def func(x, **kw):
+    a = 1
+    if x:
+        b = 2
+        def nested():
+            pass
+    else:
+        c = 3
+    try:
+        d = 4
+    except ValueError:
+        e = 5
+    finally:
+        f = 6
+    match x:
+        case 1:
+            g = 7
+    with x:
+        h = [lambda: 8 for _ in x]
+"""
+    func = root_object(code).children['func']
+    tree = ast.parse(code)
+    assert func.stmts.keys() == pho.extract_statements_from_body(tree.body[0].body).keys()
+    assert list(func.stmts) == [3, 4, 5, 10, 11, 15, 13, 16, 18, 19, 20]
+    assert 'nested' in func.children
+
+
+def test_try_statements():
+    code = """
+try:
+    import json
+except ImportError:
+    def loads(s):
+        pass
+else:
+    def dumps(ob, **kw):
+        pass
+finally:
+    class Cleanup:
+        pass
+"""
+    mod = root_object(code)
+    assert list(mod.children) == ['loads', 'dumps', 'Cleanup']
+    if pho._TRY_STAR:
+        mod = root_object(code.replace('except ImportError', 'except* ImportError'))
+        assert list(mod.children) == ['loads', 'dumps', 'Cleanup']
+
+
+def test_compact_functions(tmp_path):
+    from pyhole.project import mod_from_file
+
+    code = """
+def send(url, *args, timeout=None, **options):
+    return request('get', url,
+                   timeout=timeout, **options)
+
+def request(method, url, **kw):
+    pass
+"""
+    path = tmp_path / 'simple.py'
+    path.write_text(code)
+    send = mod_from_file(str(path)).children['send']
+    assert isinstance(send, pho.CompactFunction)
+    assert send.get_kwargs_name() == 'options'
+    [site] = pho.call_sites_at(send, 4)
+    assert (site.name, site.keywords, site.arg_cnt) == ('request', ('timeout',), 2)
+    assert site.forwards('options') and not site.forwards('timeout')
+    # Parsed again when asked for the AST
+    assert [p.name for p in send.get_formal_params()] == ['url', 'timeout']
+    assert list(send.stmts) == [3]
+    assert send.stmts is not send.stmts
+
+
+def test_foreign_function_calls():
+    code = """
+def func(**kw):
+    return send(
+        'url', **kw)
+"""
+    fn = root_object(code).children['func']
+    # Like the functions of the Rust indexer, with stmts only
+    foreign = types.SimpleNamespace(stmts=fn.stmts)
+    [site] = pho.call_sites_at(foreign, 4)
+    assert site.name == 'send' and site.forwards('kw')
+    assert pho.call_sites_at(foreign, 3)[0] in {site}
+    assert pho.function_calls(foreign)[0] is pho.function_calls(foreign)[0]
@@ -0,0 +1,84 @@
+from importlib.metadata import entry_points
+import os
+import pytest
+import pytest_pyhole
+
+pytest_plugins = ['pytester']
+
+# Loaded by pytest already when installed
+PLUGIN_ARGS = [] if any(ep.value == 'pytest_pyhole.plugin'
+                        for ep in entry_points(group='pytest11')) else ['-p', 'pytest_pyhole.plugin']
+
+
+PKG_INIT = """
+def request(method, url, **kwargs):
+    return send(url, **kwargs)
+
+
+def send(url, **options):
+    return url
+"""
+
+TESTS = """
+import pkg
+
+
+def test_request():
+    pkg.request('get', 'url', timeout=1)
+
+
+def test_again():
+    pkg.request('post', 'url', verify=False)
+"""
+
+
+@pytest.fixture
+def run(pytester, monkeypatch):
+    monkeypatch.setenv('PYHOLE_INDEXER', 'python')
+    # The plugin may be importable only through a relative PYTHONPATH
+    src = os.path.dirname(os.path.dirname(pytest_pyhole.__file__))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([src, os.environ.get('PYTHONPATH', '')]))
+    pkg = pytester.mkpydir('pkg')
+
+    def run(*args: str, broken: bool = False, tests: str = TESTS):
+        (pkg / '__init__.py').write_text(PKG_INIT)
+        if broken:
+            # Not imported by the tests, only indexing fails
+            (pkg / 'broken.py').write_text('def request(:\n')
+        pytester.makepyfile(test_pkg=tests)
+        return pytester.runpytest_subprocess(*PLUGIN_ARGS, '--project-root', str(pkg), *args)
+    return run
+
+
+@pytest.mark.parametrize('args', [['--pyhole-mode', 'trace'],
+                                  ['--pyhole-mode', 'deferred', '--pyhole-propagate']])
+def test_index_while_collecting(run, pytester, args):
+    result = run(*args)
+    result.assert_outcomes(passed=2)
+    rst = (pytester.path / 'kwargs.rst').read_text()
+    assert 'timeout' in rst and 'verify' in rst
+
+
+def test_affected_test_edited(run, pytester):
+    run('--pyhole-affected').assert_outcomes(passed=2)
+    # Only the test changes, to pass a new key to the project
+    tests = TESTS.replace('timeout=1', 'timeout=1, stream=True')
+    run('--pyhole-affected', tests=tests).assert_outcomes(passed=2)
+    rst = (pytester.path / 'kwargs.rst').read_text()
+    assert 'stream' in rst and 'verify' in rst
+
+
+def test_indexing_error(run, pytester):
+    result = run('--pyhole-propagate', broken=True)
+    assert result.ret == pytest.ExitCode.INTERNAL_ERROR
+    result.stdout.fnmatch_lines(['*pyhole: indexing the project failed: SyntaxError*'])
+    # The session stops at the first test
+    assert result.parseoutcomes().get('passed', 0) == 0
+    assert not (pytester.path / 'kwargs.rst').exists()
+
+
+@pytest.mark.parametrize('option', ['--pyhole-affected', '--pyhole-results-cache'])
+def test_tracer_options_refused(run, option):
+    result = run('--pyhole-mode', 'wrap', option)
+    result.assert_outcomes(passed=2)
+    result.stdout.fnmatch_lines([f'pyhole: {option} only works in trace and deferred modes*'])
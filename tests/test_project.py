@@ -0,0 +1,70 @@
+import importlib
+import pytest
+from pyhole.db import KeywordDb, Position
+from pyhole.keyword import CallTracer
+from pyhole.project import Project
+
+
+def _modules(project):
+    return sorted(str(ob.full_path()) for ob in project.db.values() if ob.ob_type() == 'mod')
+
+
+@pytest.fixture
+def lazypkg(tmp_path, monkeypatch):
+    pkg = tmp_path / 'lazypkg'
+    (pkg / 'sub').mkdir(parents=True)
+    (pkg / 'loose').mkdir()
+    (pkg / '__init__.py').write_text('')
+    (pkg / 'api.py').write_text("""
+from .sub.send import send
+
+
+def get(url, **kwargs):
+    return send(url, stream=True, **kwargs)
+""")
+    (pkg / 'unused.py').write_text('def unused(**kw):\n    pass\n')
+    (pkg / 'sub' / '__init__.py').write_text('')
+    (pkg / 'sub' / 'send.py').write_text("""
+def send(url, **options):
+    return url
+""")
+    (pkg / 'loose' / 'mod.py').write_text('def loose(**kw):\n    pass\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield pkg
+    for name in ['lazypkg', 'lazypkg.api', 'lazypkg.sub', 'lazypkg.sub.send']:
+        monkeypatch.delitem('sys.modules', name, raising=False)
+
+
+def test_from_import_name(lazypkg):
+    project = Project.from_import_name('lazypkg')
+    assert _modules(project) == ['lazypkg']
+
+    send = Position(str(lazypkg / 'sub' / 'send.py'), 2)
+    assert send in project.kw_fns
+    assert _modules(project) == ['lazypkg', 'lazypkg.sub', 'lazypkg.sub.send']
+    assert project.db[send].parent.parent.parent is project.root_ob
+    # Not in a package
+    assert Position(str(lazypkg / 'loose' / 'mod.py'), 1) not in project.db
+
+    project.index_all()
+    assert _modules(project) == ['lazypkg', 'lazypkg.api', 'lazypkg.sub',
+                                 'lazypkg.sub.send', 'lazypkg.unused']
+    assert _modules(Project(lazypkg)) == _modules(project)
+
+    with pytest.raises(ModuleNotFoundError):
+        Project.from_import_name('lazypkg_missing')
+
+
+def test_trace_lazy_project(lazypkg):
+    project = Project.from_import_name('lazypkg')
+    api = importlib.import_module('lazypkg.api')
+    kwd_db = KeywordDb()
+    tracer = CallTracer(project.db, project.kw_fns, kwd_db)
+    tracer.enable_tracing()
+    try:
+        api.get('url', timeout=1)
+    finally:
+        tracer.disable_tracing()
+    found = {fn.name: sorted(kwds) for fn, kwds in kwd_db.items()}
+    assert found == {'get': ['timeout'], 'send': ['stream', 'timeout']}
+    assert 'lazypkg.unused' not in _modules(project)
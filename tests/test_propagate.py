@@ -0,0 +1,67 @@
+import multiprocessing as mp
+import os
+import pathlib
+import site
+import subprocess
+import sys
+from pyhole.db import KeywordDb
+from pyhole.deferred import DeferredCallTracer
+from pyhole.project import Project
+from pyhole.propagate import Propagation
+
+
+PKG_INIT = """
+def request(method, url, **kwargs):
+    return send(url, **kwargs)
+
+
+def send(url, timeout=None, *, stream=False, verify=True):
+    return url
+
+
+def get(url, **kwargs):
+    return request('get', url, **kwargs)
+"""
+
+
+def _call_in_child(path):
+    sys.path.insert(0, path)
+    import pkg
+    pkg.request('post', 'url', verify=False)
+
+
+def test_propagation(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text(PKG_INIT)
+    project = Project(pkg)
+    kwd_db = KeywordDb()
+    resolver = DeferredCallTracer(project.db, project.kw_fns, kwd_db)
+    with Propagation.resolving_with(resolver) as propagation:
+        subprocess.run([sys.executable, '-c', "import pkg; pkg.get('url', timeout=1)"],
+                       cwd=tmp_path, check=True)
+        with mp.get_context('fork').Pool(1) as pool:
+            pool.apply(_call_in_child, (str(tmp_path),))
+        assert propagation.collect() == 2
+    found = {fn.name: sorted(kwds) for fn, kwds in kwd_db.items()}
+    assert found == {'get': ['timeout'], 'request': ['stream', 'timeout', 'verify']}
+
+
+def test_environment(monkeypatch, tmp_path):
+    import pyhole.propagate as pp
+    package_parent = str(pathlib.Path(pp.__file__).parents[1])
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    with Propagation({}, lambda events: None):
+        assert os.environ['PYTHONPATH'].split(os.pathsep) == \
+            [pp.STARTUP_DIR, str(tmp_path), package_parent]
+    assert os.environ['PYTHONPATH'] == str(tmp_path)
+
+    # Installed, eg, in site-packages
+    monkeypatch.setattr(site, 'getsitepackages', lambda: [package_parent])
+    with Propagation({}, lambda events: None):
+        assert os.environ['PYTHONPATH'].split(os.pathsep) == [pp.STARTUP_DIR, str(tmp_path)]
+
+
+def test_no_fork_hooks_on_import():
+    code = 'import pyhole.propagate as pp; assert not pp._fork_hooks'
+    subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,64 @@
+from pyhole.cache import FileCache
+from pyhole.db import Evidence, KeywordDb
+from pyhole.impact import functions_by_path
+from pyhole.project import Project
+from pyhole.results import ResultCache
+
+
+SOURCE = """
+def a(**kw):
+    return b(**kw)
+
+
+def b(x=None):
+    return x
+
+
+def c(**kw):
+    return kw
+"""
+
+
+def test_result_cache(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    init = pkg / '__init__.py'
+    init.write_text(SOURCE)
+    fns = functions_by_path(Project(pkg).db)
+    kwd_db = KeywordDb()
+    kwd_db.append_possibility(fns['pkg.a'], 'x', source=fns['pkg.b'])
+    kwd_db.append_possibility(fns['pkg.c'], 'y')
+    cache = ResultCache()
+    cache.update(kwd_db, FileCache())
+    path = tmp_path / 'kwargs.results.json'
+    cache.save(path)
+
+    # b changes, so the keys of a, found through b, are stale
+    init.write_text(SOURCE.replace('return x', 'return [x]'))
+    fns = functions_by_path(Project(pkg).db)
+    warm = KeywordDb()
+    saturated = ResultCache.load(path).warm_start(fns, FileCache(), warm)
+    assert saturated == {fns['pkg.c']}
+    assert [(fn.name, kwds) for fn, kwds in warm.items()] == [('c', ['y'])]
+    assert warm.evidence_of(fns['pkg.c'], 'y') == {Evidence.CACHED}
+
+
+def test_shard_sources(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text(SOURCE)
+    project = Project(pkg)
+    fns = functions_by_path(project.db)
+    kwd_db = KeywordDb()
+    kwd_db.append_possibility(fns['pkg.a'], 'x', source=fns['pkg.b'])
+    kwd_db.append_possibility(fns['pkg.c'], 'y')
+
+    # Keys merged from a shard (eg, from a worker) keep their sources, so
+    # the cache still hashes b as a dependency of a
+    merged = KeywordDb()
+    merged.merge_shard(kwd_db.to_shard(), project.db)
+    assert merged.sources == {fns['pkg.a']: {fns['pkg.b']}}
+    cache, merged_cache = ResultCache(), ResultCache()
+    cache.update(kwd_db, FileCache())
+    merged_cache.update(merged, FileCache())
+    assert merged_cache.entries == cache.entries
@@ -0,0 +1,113 @@
+import pathlib
+import pytest
+import pyhole.object
+from pyhole.db import Evidence, KeywordDb
+from pyhole.project import Project
+from pyhole.static import infer_static_keywords, infer_dict_access_keywords
+
+
+PKG_INIT = """
+from .api import request, get
+"""
+
+PKG_API = """
+from . import sessions
+from .sessions import send
+
+
+def request(method, url, **kwargs):
+    return sessions.Session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('get', url, timeout=1, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    handler = lambda x: x
+    handler(1)
+    return request('post', url, data=data, **kwargs)
+
+
+def fetch(url, **kwargs):
+    return send(url, **kwargs)
+"""
+
+PKG_SESSIONS = """
+class Session:
+    def __init__(self, **opts):
+        self.opts = opts
+
+    def request(self, method, url, params=None, *, headers=None, verify=True):
+        return method
+
+
+def make():
+    return Session(trust_env=False)
+
+
+def send(url, timeout=None, *, stream=False):
+    return url
+"""
+
+
+@pytest.fixture
+def project(tmp_path: pathlib.Path) -> Project:
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text(PKG_INIT)
+    (pkg / 'api.py').write_text(PKG_API)
+    (pkg / 'sessions.py').write_text(PKG_SESSIONS)
+    return Project(pkg)
+
+
+def keys_of(kwd_db: KeywordDb, path: str) -> list[str]:
+    for fn, kwds in kwd_db.items():
+        if str(fn.full_path()) == path:
+            return kwds
+    return []
+
+
+def test_child_keys(project):
+    kwd_db = KeywordDb()
+    infer_static_keywords(project, kwd_db)
+    assert keys_of(kwd_db, 'pkg.api.request') == ['timeout', 'data']
+    assert keys_of(kwd_db, 'pkg.sessions.Session.__init__') == ['trust_env']
+
+
+def test_forwarded_keys(project):
+    kwd_db = KeywordDb()
+    infer_static_keywords(project, kwd_db)
+    assert keys_of(kwd_db, 'pkg.api.fetch') == ['timeout', 'stream']
+    # request forwards **kwargs to a method of an instance, which is only
+    # known at runtime
+    assert keys_of(kwd_db, 'pkg.api.get') == []
+
+
+def test_resolved_calls(project, monkeypatch):
+    # The pass doesn't parse the modules again for their functions
+    monkeypatch.setattr(pyhole.object, '_last_defs', None)
+    resolved = infer_static_keywords(project, KeywordDb())
+    assert pyhole.object._last_defs is None
+    post = next(ob for ob in project.kw_fns.values() if ob.name == 'post')
+    sites = [site for sites in post.call_sites.values() for site in sites]
+    names = {site.name for site in sites if site in resolved}
+    # The local lambda can't be resolved statically
+    assert names == {'request'}
+
+
+def test_dict_access_keys(tmp_path: pathlib.Path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text("""
+def configure(**options):
+    verbose = options.pop('verbose', False)
+    if 'color' in options:
+        return options['color']
+""")
+    project = Project(pkg)
+    kwd_db = KeywordDb()
+    infer_dict_access_keywords(project.kw_fns, kwd_db)
+    fn = next(iter(project.kw_fns.values()))
+    assert keys_of(kwd_db, 'pkg.configure') == ['verbose', 'color']
+    assert kwd_db.evidence_of(fn, 'color') == {Evidence.DICT_ACCESS}
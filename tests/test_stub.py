@@ -0,0 +1,71 @@
+from pyhole.object import StubFunction
+from pyhole.project import Project, mod_from_file
+from pyhole.stub import stub_module
+
+
+PLAIN = '''
+import functools
+
+DOC = """
+def not_a_function(**kwargs):
+    pass
+"""
+
+
+@functools.cache
+def send(url, timeout=None, *,
+         stream=False):  # (
+    return url ** 2
+
+
+class Session:
+    def get(self, url,
+            verify=True):
+        return send(url, stream=True) \\
+            + 1
+
+    async def close(self):
+        def callback(a):
+            pass
+        return [x
+                for x in 'abc']
+
+if DOC:
+    def dup(): pass
+else:
+    def dup(): return 1
+'''
+
+
+def _tree(ob, path=''):
+    path = f'{path}.{ob.name}'
+    entry = [(path, ob.ob_type(), ob.source_span.start_line, ob.source_span.end_line)]
+    for child in ob.children.values():
+        entry.extend(_tree(child, path))
+    return entry
+
+
+def test_stub_module(tmp_path):
+    path = tmp_path / 'plain.py'
+    path.write_text(PLAIN)
+    mod = stub_module(path, PLAIN)
+    assert _tree(mod) == _tree(mod_from_file(str(path)))
+    send = mod.children['send']
+    assert isinstance(send, StubFunction)
+    assert not send.has_kwargs_dict()
+    # Parsed on demand
+    assert [p.name for p in send.get_formal_params()] == ['url', 'timeout', 'stream']
+
+    assert stub_module(path, PLAIN + '\ndef fwd(**kw):\n    pass\n') is None
+
+
+def test_kwargs_focused_project(tmp_path):
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text('def request(method, **kwargs):\n    pass\n')
+    (pkg / 'plain.py').write_text(PLAIN)
+    project = Project(pkg, kwargs_focused=True)
+    full = Project(pkg)
+    assert set(map(str, project.db)) == set(map(str, full.db))
+    assert [ob.name for ob in project.kw_fns.values()] == ['request']
+    assert any(isinstance(ob, StubFunction) for ob in project.db.values())
@@ -0,0 +1,36 @@
+import sys
+from types import FrameType
+from pyhole.tracer import Tracer
+from pyhole.keyword import CallTracer
+
+
+class CallCounter(Tracer):
+    def __init__(self) -> None:
+        super().__init__(collect_stats=True)
+        self.names: list[str] = []
+
+    def trace_call(self, frame: FrameType):
+        self.names.append(frame.f_code.co_name)
+
+
+def work(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def test_call_only_tracer():
+    assert not CallTracer([], [], None).call_only
+    tracer = CallCounter()
+    assert tracer.call_only
+    tracer.enable_tracing()
+    try:
+        assert sys.gettrace() is None
+        work(3)
+    finally:
+        tracer.disable_tracing()
+    assert sys.getprofile() is None
+    # The profile function also sees the call to disable_tracing
+    assert tracer.names[0] == 'work'
+    assert 'line' not in tracer.stats.events
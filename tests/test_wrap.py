@@ -0,0 +1,51 @@
+import sys
+import pytest
+from pyhole.db import KeywordDb
+from pyhole.project import Project
+from pyhole.wrap import KwargsWrapper
+
+
+PKG_INIT = """
+from .api import get
+
+
+class Session:
+    def request(self, method, url, **kwargs):
+        return kwargs
+"""
+
+PKG_API = """
+def get(url, /, **kwargs):
+    return url
+"""
+
+
+@pytest.fixture
+def wrap_pkg(tmp_path, monkeypatch):
+    pkg = tmp_path / 'wrap_pkg'
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text(PKG_INIT)
+    (pkg / 'api.py').write_text(PKG_API)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import wrap_pkg
+    yield pkg, wrap_pkg
+    for name in ['wrap_pkg', 'wrap_pkg.api']:
+        sys.modules.pop(name, None)
+
+
+def test_wrapped_keys(wrap_pkg):
+    root, mod = wrap_pkg
+    project = Project(root)
+    kwd_db = KeywordDb()
+    orig_get = mod.get
+    with KwargsWrapper(project.db, project.kw_fns, kwd_db):
+        # The re-exported reference gets the same wrapper as the original
+        assert mod.get is mod.api.get and mod.get is not orig_get
+        mod.get('u', url='x', timeout=1)
+        mod.Session().request('get', 'u', verify=True)
+    assert mod.get is orig_get
+    found = {fn.name: kwds for fn, kwds in kwd_db.items()}
+    assert found == {
+        'get': ['url', 'timeout'],
+        'request': ['verify'],
+    }